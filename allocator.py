@@ -0,0 +1,96 @@
+import random
+from collections import deque
+
+
+class KeyspaceExhausted(Exception):
+    pass
+
+
+#The following class hands out fixed-length codes over an alphabet, such
+#as the 26^4 room codes or the 10-digit user ids, in constant time.
+#
+#Codes are produced by walking a counter through a keyed permutation of
+#the whole keyspace, so every code is issued at most once and the order
+#cannot be guessed without the key. Released codes go on a free pool and
+#are only handed out again, oldest first, once every new code has been
+#issued, so a code stays out of use for as long as possible after its
+#room is gone and stale clients holding it reach nothing. Releasing a
+#code that is already free does nothing. The permutation is a small
+#Feistel network over the next even number of bits, cycle-walked back
+#into range, which takes fewer than three passes on average for
+#both keyspaces used here.
+class CodeAllocator:
+    def __init__(self, alphabet, length, key=None, rounds=4):
+        self.alphabet = alphabet
+        self.length = length
+        self.base = len(alphabet)
+        self.capacity = self.base ** length
+
+        bits = max(2, (self.capacity - 1).bit_length())
+        self.halfBits = (bits + 1) // 2
+        self.halfMask = (1 << self.halfBits) - 1
+
+        rng = random.Random(key) if key is not None else random.SystemRandom()
+        self.keys = [rng.getrandbits(64) for _ in range(rounds)]
+
+        self.counter = 0
+        self.free = deque()
+        self.freeSet = set()
+        self.released = 0
+
+    #This method runs the Feistel rounds over an index in the padded
+    #domain. It is a bijection on [0, 2**(2*halfBits)).
+    def feistel(self, value):
+        left = value >> self.halfBits
+        right = value & self.halfMask
+        for roundKey in self.keys:
+            left, right = right, left ^ (hash((roundKey, right)) & self.halfMask)
+        return (left << self.halfBits) | right
+
+    #This method maps an index in [0, capacity) to a unique index in the
+    #same range by cycle-walking the Feistel permutation.
+    def permute(self, index):
+        value = self.feistel(index)
+        while value >= self.capacity:
+            value = self.feistel(value)
+        return value
+
+    def encode(self, index):
+        chars = []
+        for i in range(self.length):
+            index, digit = divmod(index, self.base)
+            chars.append(self.alphabet[digit])
+        return "".join(reversed(chars))
+
+    #This method returns an unused code, issuing new codes before it
+    #reuses released ones.
+    def allocate(self):
+        if self.counter < self.capacity:
+            code = self.encode(self.permute(self.counter))
+            self.counter += 1
+            return code
+        if self.free:
+            code = self.free.popleft()
+            self.freeSet.discard(code)
+            return code
+        raise KeyspaceExhausted("all %d codes are in use" % self.capacity)
+
+    #This method returns count unused codes at once, for example to
+    #pre-warm a pool of rooms.
+    def allocateMany(self, count):
+        return [self.allocate() for _ in range(count)]
+
+    #This method puts a code back in the free pool so it can be handed
+    #out again.
+    def release(self, code):
+        if code in self.freeSet:
+            return
+        self.free.append(code)
+        self.freeSet.add(code)
+        self.released += 1
+
+    def stats(self):
+        inUse = self.counter - len(self.free)
+        return {"capacity": self.capacity, "inUse": inUse,
+            "free": len(self.free), "issued": self.counter,
+            "released": self.released, "occupancy": inUse / self.capacity}
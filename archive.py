@@ -0,0 +1,371 @@
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import defaultdict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#The following classes keep finished games for analysis. Games are
+#buffered as columns (one array per field of a table, as narrow as the
+#values allow) and written out in immutable segment files of up to
+#segmentGames games, each column compressed on its own. Segments are
+#only ever added, never rewritten. Segment files are named after their
+#number and the process that wrote them, so workers sharing a directory
+#never write over each other's segments.
+#
+#A segment file is the magic bytes, the length of a JSON header, the
+#header and then the column blobs. The header lists, for every table, its
+#row count and each column's type, codec, offset and length. Readers
+#memory-map the file and hand the compressed bytes to zlib without
+#copying them; columns stored "raw" are used straight from the map.
+#Queries only touch the columns they need, one segment at a time, and
+#remember their result for each segment, so an aggregate over millions of
+#games holds one segment in memory and only ever scans new segments.
+#
+#All numbers are little-endian.
+
+MAGIC = b"SHC1"
+
+#The tables, and their columns as (name, array typecode). Rows in the
+#other tables point at their game by its row in the segment's games.
+TABLES = {
+    "games": (("size", "B"), ("winner", "B"), ("fascistPolicies", "B"),
+        ("liberalPolicies", "B"), ("elections", "H"), ("hitlerExecuted", "B"),
+        ("finishedAt", "I")),
+    "players": (("game", "I"), ("seat", "B"), ("role", "B"), ("dead", "B"),
+        ("won", "B")),
+    "votes": (("game", "I"), ("election", "H"), ("seat", "B"), ("role", "B"),
+        ("vote", "B"), ("passed", "B")),
+    "policies": (("game", "I"), ("order", "B"), ("card", "B"), ("chaos", "B")),
+    "actions": (("game", "I"), ("kind", "B"), ("seat", "B"), ("target", "B"),
+        ("targetRole", "B")),
+}
+
+ROLES = ("Liberal", "Fascist", "Hitler")
+VOTES = ("No", "Yes", "Abstain")
+CARDS = ("L", "F")
+ACTIONS = ("investigate", "execute", "special")
+NUMPY_TYPES = {"B": "<u1", "H": "<u2", "I": "<u4"}
+UNKNOWN_SEAT = 255
+
+
+#This class buffers finished games and writes them out as segments.
+class GameArchive:
+    def __init__(self, directory, segmentGames=4096, compressLevel=1):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.segmentGames = segmentGames
+        self.compressLevel = compressLevel
+        self.lock = threading.Lock()
+        self.segment = self.latestSegment() + 1
+        self.columns = self.emptyColumns()
+        self.games = 0
+
+    def latestSegment(self):
+        segments = [int(os.path.basename(path).split("-")[1].split(".")[0])
+            for path in segmentPaths(self.directory)]
+        return max(segments) if segments else 0
+
+    def emptyColumns(self):
+        return {table: {name: array(typecode) for name, typecode in columns}
+            for table, columns in TABLES.items()}
+
+    #This method adds the rows of a finished room to the buffer, and
+    #writes a segment once the buffer holds segmentGames games.
+    def append(self, room, finishedAt=None):
+        seats = {player.name: seat for seat, player in enumerate(room.players)}
+        roles = [ROLES.index(player.role) if player.role in ROLES else 0
+            for player in room.players]
+        winner = 1 if room.winner == "F" else 0
+        with self.lock:
+            columns = self.columns
+            game = self.games
+            self.games += 1
+            elections = 0
+            hitlerExecuted = 0
+            for seat, player in enumerate(room.players):
+                addRow(columns["players"], game, seat, roles[seat],
+                    int(player.dead), int((roles[seat] > 0) == bool(winner)))
+            order = 0
+            for entry in room.record:
+                if entry[0] == "vote":
+                    passed = int(entry[4])
+                    for name, vote in entry[3]:
+                        seat = seats.get(name, UNKNOWN_SEAT)
+                        addRow(columns["votes"], game, elections, seat,
+                            roles[seat] if seat != UNKNOWN_SEAT else 0,
+                            VOTES.index(vote) if vote in VOTES else 2, passed)
+                    elections += 1
+                elif entry[0] == "policy":
+                    addRow(columns["policies"], game, order,
+                        CARDS.index(entry[1]), int(entry[2]))
+                    order += 1
+                else:
+                    seat = seats.get(entry[1], UNKNOWN_SEAT)
+                    target = seats.get(entry[2], UNKNOWN_SEAT)
+                    targetRole = roles[target] if target != UNKNOWN_SEAT else 0
+                    if entry[0] == "execute" and targetRole == 2:
+                        hitlerExecuted = 1
+                    addRow(columns["actions"], game, ACTIONS.index(entry[0]),
+                        seat, target, targetRole)
+            addRow(columns["games"], room.size, winner, room.board["F"],
+                room.board["L"], elections, hitlerExecuted,
+                int(finishedAt if finishedAt is not None else time.time()))
+            if self.games < self.segmentGames:
+                return
+            columns, segment = self.swap()
+        self.writeSegment(segment, columns)
+
+    def swap(self):
+        columns, segment = self.columns, self.segment
+        self.columns = self.emptyColumns()
+        self.games = 0
+        self.segment += 1
+        return columns, segment
+
+    #This method writes whatever is buffered as a segment, so games reach
+    #the disk even when few finish.
+    def flush(self):
+        with self.lock:
+            if self.games == 0:
+                return
+            columns, segment = self.swap()
+        self.writeSegment(segment, columns)
+
+    def close(self):
+        self.flush()
+
+    #This method writes a segment to a temporary file and renames it into
+    #place, so readers never see half a segment.
+    def writeSegment(self, segment, columns):
+        header = {"tables": {}}
+        blobs = []
+        offset = 0
+        for table, tableColumns in columns.items():
+            rows = len(tableColumns[TABLES[table][0][0]])
+            entry = header["tables"][table] = {"rows": rows, "columns": {}}
+            for name, values in tableColumns.items():
+                if sys.byteorder != "little":
+                    values.byteswap()
+                blob = values.tobytes()
+                codec = "raw"
+                if self.compressLevel:
+                    packed = zlib.compress(blob, self.compressLevel)
+                    if len(packed) < len(blob):
+                        blob, codec = packed, "zlib"
+                entry["columns"][name] = {"type": values.typecode, "codec": codec,
+                    "offset": offset, "length": len(blob)}
+                blobs.append(blob)
+                offset += len(blob)
+        headerBytes = json.dumps(header, separators=(",", ":")).encode("UTF-8")
+        path = segmentPath(self.directory, segment, os.getpid())
+        with open(path + ".tmp", "wb") as handle:
+            handle.write(MAGIC + struct.pack("<I", len(headerBytes)) + headerBytes)
+            for blob in blobs:
+                handle.write(blob)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(path + ".tmp", path)
+
+
+def addRow(columns, *values):
+    for column, value in zip(columns.values(), values):
+        column.append(value)
+
+
+def segmentPath(directory, segment, writer):
+    return os.path.join(directory, "games-%08d-%d.col" % (segment, writer))
+
+
+def segmentPaths(directory):
+    return sorted(glob.glob(os.path.join(directory, "games-*.col")))
+
+
+#This class is one memory-mapped segment.
+class Segment:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as handle:
+            self.map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:4] != MAGIC:
+            raise ValueError("not a game archive segment: %s" % path)
+        headerLength = struct.unpack_from("<I", self.map, 4)[0]
+        self.header = json.loads(self.map[8:8 + headerLength])
+        self.base = 8 + headerLength
+
+    def rows(self, table):
+        return self.header["tables"][table]["rows"]
+
+    #This method gives a column as a NumPy array (or a typed memoryview
+    #without NumPy). Raw columns are views of the map itself.
+    def column(self, table, name):
+        spec = self.header["tables"][table]["columns"][name]
+        start = self.base + spec["offset"]
+        view = memoryview(self.map)[start:start + spec["length"]]
+        if spec["codec"] == "zlib":
+            view = memoryview(zlib.decompress(view))
+        if numpy is not None:
+            return numpy.frombuffer(view, dtype=NUMPY_TYPES[spec["type"]])
+        return view.cast(spec["type"])
+
+
+#This class runs the aggregates over every segment in the directory.
+#Segments never change, so each one's partial result is kept and only
+#segments written since the last query are scanned.
+class ArchiveReader:
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = {}
+        self.partials = {}
+        self.lock = threading.Lock()
+
+    def segment(self, path):
+        segment = self.segments.get(path)
+        if segment is None:
+            segment = self.segments[path] = Segment(path)
+        return segment
+
+    def aggregate(self, query):
+        totals = defaultdict(lambda: [0] * len(QUERIES[query][1]))
+        with self.lock:
+            for path in segmentPaths(self.directory):
+                key = (path, query)
+                partial = self.partials.get(key)
+                if partial is None:
+                    partial = self.partials[key] = QUERIES[query][0](self.segment(path))
+                for group, counts in partial.items():
+                    total = totals[group]
+                    for i, count in enumerate(counts):
+                        total[i] += count
+        return totals
+
+    #This method gives the named aggregate as a JSON-ready dict.
+    def stats(self, query):
+        return FORMATS[query](self.aggregate(query))
+
+
+#This function counts, per group, the rows of the given key columns and
+#the sum of each value column. groups gives the number of values each
+#key column can take.
+def countBy(keys, groups, values):
+    if numpy is not None:
+        combined = numpy.zeros(len(keys[0]), dtype=numpy.int64)
+        for key, size in zip(keys, groups):
+            combined = combined * size + key
+        width = 1
+        for size in groups:
+            width *= size
+        columns = [numpy.bincount(combined, minlength=width)]
+        for value in values:
+            columns.append(numpy.bincount(combined, weights=value, minlength=width))
+        result = {}
+        for index in numpy.nonzero(columns[0])[0].tolist():
+            group = []
+            rest = index
+            for size in reversed(groups):
+                rest, part = divmod(rest, size)
+                group.append(part)
+            result[tuple(reversed(group))] = [int(column[index]) for column in columns]
+        return result
+    result = {}
+    for row in range(len(keys[0])):
+        group = tuple(key[row] for key in keys)
+        counts = result.get(group)
+        if counts is None:
+            counts = result[group] = [0] * (len(values) + 1)
+        counts[0] += 1
+        for i, value in enumerate(values):
+            counts[i + 1] += value[row]
+    return result
+
+
+#This query counts players and wins by room size and role.
+def winRate(segment):
+    sizes = segment.column("games", "size")
+    games = segment.column("players", "game")
+    if numpy is not None:
+        playerSizes = sizes[games]
+    else:
+        playerSizes = [sizes[game] for game in games]
+    return countBy([playerSizes, segment.column("players", "role")], [256, 3],
+        [segment.column("players", "won")])
+
+
+#This query counts votes by the voter's role: yes votes, abstentions and
+#votes that went the way the election did.
+def voteAgreement(segment):
+    roles = segment.column("votes", "role")
+    votes = segment.column("votes", "vote")
+    passed = segment.column("votes", "passed")
+    if numpy is not None:
+        yes = votes == 1
+        abstain = votes == 2
+        agreed = (yes & (passed == 1)) | ((votes == 0) & (passed == 0))
+    else:
+        yes = [int(vote == 1) for vote in votes]
+        abstain = [int(vote == 2) for vote in votes]
+        agreed = [int(vote == 1 and passing == 1 or vote == 0 and passing == 0)
+            for vote, passing in zip(votes, passed)]
+    return countBy([roles], [3], [yes, abstain, agreed])
+
+
+#This query counts games by room size and winner, with their policies,
+#elections and Hitler executions.
+def gameCounts(segment):
+    return countBy([segment.column("games", "size"), segment.column("games", "winner")],
+        [256, 2], [segment.column("games", "fascistPolicies"),
+            segment.column("games", "liberalPolicies"),
+            segment.column("games", "elections"),
+            segment.column("games", "hitlerExecuted")])
+
+
+def formatWinRate(totals):
+    result = {}
+    for (size, role), (players, wins) in sorted(totals.items()):
+        result.setdefault(str(size), {})[ROLES[role]] = {"players": players,
+            "winRate": wins / players}
+    return result
+
+
+def formatVoteAgreement(totals):
+    result = {}
+    for (role,), (votes, yes, abstain, agreed) in sorted(totals.items()):
+        result[ROLES[role]] = {"votes": votes, "yesRate": yes / votes,
+            "abstainRate": abstain / votes, "agreement": agreed / votes}
+    return result
+
+
+def formatGameCounts(totals):
+    result = {}
+    for (size, winner), (games, fascist, liberal, elections, hitler) in sorted(totals.items()):
+        bySize = result.setdefault(str(size), {"games": 0})
+        bySize["games"] += games
+        bySize[CARDS[winner]] = {"games": games,
+            "fascistPolicies": fascist / games, "liberalPolicies": liberal / games,
+            "elections": elections / games, "hitlerExecuted": hitler / games}
+    return result
+
+
+#The queries /api/stats can run: the per-segment function and the names
+#of the counts it returns for each group.
+QUERIES = {
+    "winRate": (winRate, ("players", "wins")),
+    "voteAgreement": (voteAgreement, ("votes", "yes", "abstain", "agreed")),
+    "games": (gameCounts, ("games", "fascistPolicies", "liberalPolicies",
+        "elections", "hitlerExecuted")),
+}
+FORMATS = {
+    "winRate": formatWinRate,
+    "voteAgreement": formatVoteAgreement,
+    "games": formatGameCounts,
+}
@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+
+from flask import Response, render_template, request, url_for
+from jinja2 import TemplateNotFound
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger("secrethitler.assets")
+
+#The following functions serve the pages and static files from memory.
+#Everything is read (or rendered) once at startup and compressed in
+#advance with gzip and, if the brotli module is installed, Brotli. Each
+#variant has a strong ETag of its own, so a client that already has it
+#gets 304 Not Modified instead of the body.
+#
+#Static files are also served under "/assets/<fingerprint>/<path>",
+#where the fingerprint is a hash of the content. Those URLs never change
+#content, so they are cached as immutable for a year. Templates get the
+#URL of a file with assetUrl("<path>").
+
+PAGE_CACHE = "no-cache"
+ASSET_CACHE = "public, max-age=31536000, immutable"
+
+
+class Asset:
+    __slots__ = ("variants", "mimetype", "cacheControl", "fingerprint")
+
+    def __init__(self, body, mimetype, cacheControl):
+        digest = hashlib.sha256(body).hexdigest()
+        self.fingerprint = digest[:12]
+        self.mimetype = mimetype
+        self.cacheControl = cacheControl
+        self.variants = {"identity": (body, '"%s"' % digest[:24])}
+        packed = gzip.compress(body, 9, mtime=0)
+        if len(packed) < len(body):
+            self.variants["gzip"] = (packed, '"%s-gz"' % digest[:24])
+        if brotli is not None:
+            packed = brotli.compress(body, quality=11)
+            if len(packed) < len(body):
+                self.variants["br"] = (packed, '"%s-br"' % digest[:24])
+
+    #This method picks the smallest variant the client accepts.
+    def variant(self):
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and request.accept_encodings[encoding]:
+                return encoding
+        return "identity"
+
+
+#This function answers a request for an asset: 304 if the client sent
+#an ETag of any of its variants, otherwise the best variant it accepts.
+def serveAsset(asset):
+    encoding = asset.variant()
+    body, etag = asset.variants[encoding]
+    headers = {"ETag": etag, "Cache-Control": asset.cacheControl,
+        "Vary": "Accept-Encoding"}
+    if notModified(asset):
+        return Response(status=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(body, mimetype=asset.mimetype, headers=headers)
+
+
+#This function compares If-None-Match (weakly, as RFC 9110 asks) with
+#the ETags of every variant.
+def notModified(asset):
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    tags = {tag.strip() for tag in header.split(",")}
+    if "*" in tags:
+        return True
+    tags = {tag[2:] if tag.startswith("W/") else tag for tag in tags}
+    return any(etag in tags for body, etag in asset.variants.values())
+
+
+#This function loads every file under the static folder, keyed by its
+#path relative to the folder.
+def loadStaticAssets(folder):
+    assets = {}
+    if not folder or not os.path.isdir(folder):
+        return assets
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, folder).replace(os.sep, "/")
+            with open(path, "rb") as handle:
+                body = handle.read()
+            mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            assets[relative] = Asset(body, mimetype, ASSET_CACHE)
+    return assets
+
+
+#This function renders each template once, for the pages that never
+#change between requests. A template that is missing is left out and
+#logged, and its route renders it per request as before.
+def renderPages(app, templates):
+    pages = {}
+    with app.test_request_context("/"):
+        for name, template in templates.items():
+            try:
+                body = render_template(template).encode("UTF-8")
+            except TemplateNotFound:
+                log.warning("template %s not found; it will be rendered per request", template)
+                continue
+            pages[name] = Asset(body, "text/html", PAGE_CACHE)
+    return pages
+
+
+#This function gives the fingerprinted URL of a static file, or its
+#plain static URL if it was not loaded at startup.
+def assetUrl(assets, path):
+    asset = assets.get(path)
+    if asset is None:
+        return url_for("static", filename=path)
+    return "/assets/%s/%s" % (asset.fingerprint, path)
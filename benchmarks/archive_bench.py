@@ -0,0 +1,79 @@
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import archive
+import simulate
+from engine import GameEngine
+
+#This benchmark measures the game archive. It plays --distinct seeded
+#games, archives them over and over until --games games are stored, and
+#reports the append rate, the bytes each game takes on disk, and how
+#long each /api/stats query takes the first time (scanning every
+#segment) and again (from the per-segment results).
+
+
+#This engine keeps every room whose game has ended.
+class FinishedEngine(GameEngine):
+    def __init__(self):
+        GameEngine.__init__(self)
+        self.finished = []
+
+    def apply(self, state, event):
+        result = GameEngine.apply(self, state, event)
+        if state.winner is not None and not state.archived:
+            state.archived = True
+            self.finished.append(state)
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=1000000)
+    parser.add_argument("--distinct", type=int, default=5000)
+    parser.add_argument("--segment-games", type=int, default=4096)
+    parser.add_argument("--afk", type=float, default=0.1)
+    args = parser.parse_args()
+
+    engine = FinishedEngine()
+    simulate.ENGINE = engine
+    for seed in range(args.distinct):
+        simulate.playGame(5 + seed % 6, seed, afk=args.afk)
+    rooms = engine.finished
+
+    directory = tempfile.mkdtemp(prefix="archive-bench-")
+    try:
+        gameArchive = archive.GameArchive(directory, args.segment_games)
+        start = time.perf_counter()
+        for i in range(args.games):
+            gameArchive.append(rooms[i % len(rooms)])
+        gameArchive.close()
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(path) for path in archive.segmentPaths(directory))
+        print("games=%d segments=%d append=%.0f games/s disk=%.1f MB (%.1f B/game)" %
+            (args.games, len(archive.segmentPaths(directory)), args.games / elapsed,
+            size / 1e6, size / args.games))
+
+        reader = archive.ArchiveReader(directory)
+        print("%-16s %10s %10s" % ("query", "first s", "again ms"))
+        for query in archive.QUERIES:
+            start = time.perf_counter()
+            reader.stats(query)
+            first = time.perf_counter() - start
+            start = time.perf_counter()
+            reader.stats(query)
+            again = time.perf_counter() - start
+            print("%-16s %10.3f %10.2f" % (query, first, again * 1e3))
+        print("peak RSS: %.0f MB" % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bots import POLICIES, BotRunner
+from engine import GameEngine, Room
+from executor import RoomExecutor
+from timers import TimerWheel
+
+#This benchmark soak-tests bots the way the server runs them: --games
+#rooms of 5 to 10 bots at once, all driven by one BotRunner on one timer
+#wheel turned by the main thread, each move run through a RoomExecutor
+#and the GameEngine. A finished game is replaced by a new one, so the
+#number of games running stays the same. It reports how much memory
+#each bot takes, then games and moves per second over --seconds, what
+#share of a core the bots use (in total and per bot), and how far behind
+#the wheel fell. For comparison it starts --threads idle threads and
+#reports the memory each one takes.
+
+
+def memoryKB(field):
+    try:
+        with open("/proc/self/status") as handle:
+            for line in handle:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class Soak:
+    def __init__(self, args):
+        self.engine = GameEngine()
+        self.rooms = {}
+        self.finished = []
+        self.executor = RoomExecutor()
+        self.wheel = TimerWheel(args.tick)
+        self.runner = BotRunner(self.wheel, self.executor.submit, self.rooms.get,
+            self.apply, think=(args.think_min, args.think_max), seed=args.seed)
+        self.rng = random.Random(args.seed)
+        self.policies = [POLICIES[name] for name in args.policies.split(",")]
+        self.counter = 0
+        self.games = 0
+
+    def apply(self, code, event):
+        room = self.rooms[code]
+        self.engine.apply(room, event)
+        if room.winner is not None:
+            self.finished.append(code)
+        else:
+            self.runner.wake(code, room)
+
+    def start(self):
+        self.counter += 1
+        code = "G%d" % self.counter
+        self.rooms[code] = Room(self.rng.randint(5, 10), self.rng.getrandbits(64))
+        policy = self.rng.choice(self.policies)
+        self.executor.submit(code, lambda: self.runner.seat(code, 10, policy))
+
+    def replaceFinished(self):
+        while self.finished:
+            code = self.finished.pop()
+            self.runner.forget(code)
+            self.executor.forget(code)
+            del self.rooms[code]
+            self.games += 1
+            self.start()
+
+
+def idleThreads(count):
+    stop = threading.Event()
+    rss, size = memoryKB("VmRSS"), memoryKB("VmSize")
+    threads = [threading.Thread(target=stop.wait) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    perThread = ((memoryKB("VmRSS") - rss) / count, (memoryKB("VmSize") - size) / count)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return perThread
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--think-min", type=float, default=1.0)
+    parser.add_argument("--think-max", type=float, default=3.0)
+    parser.add_argument("--tick", type=float, default=0.1)
+    parser.add_argument("--policies", default="random,heuristic")
+    parser.add_argument("--threads", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    soak = Soak(args)
+    tracemalloc.start()
+    rss = memoryKB("VmRSS")
+    for _ in range(args.games):
+        soak.start()
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    bots = soak.runner.stats()["bots"]
+    print("games=%d bots=%d memory per bot: %.0f B traced, %.1f KB RSS" %
+        (args.games, bots, traced / bots, (memoryKB("VmRSS") - rss) / bots))
+
+    soak.wheel.advance()
+    moves = soak.runner.moves
+    busy = 0.0
+    lag = 0.0
+    cpu = time.process_time()
+    start = time.perf_counter()
+    end = start + args.seconds
+    while True:
+        now = time.perf_counter()
+        if now >= end:
+            break
+        lag = max(lag, now - soak.wheel.origin - (soak.wheel.current + 1) * soak.wheel.tick)
+        soak.wheel.advance()
+        soak.replaceFinished()
+        busy += time.perf_counter() - now
+        time.sleep(max(0.0, soak.wheel.tick - (time.perf_counter() - now)))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    moves = soak.runner.moves - moves
+
+    print("seconds=%.1f games finished=%d (%.1f/s) moves=%d (%.0f/s)" %
+        (elapsed, soak.games, soak.games / elapsed, moves, moves / elapsed))
+    print("cpu: %.1f%% of a core, %.4f%% per bot; wheel busy %.1f%%, worst lag %.0f ms" %
+        (100 * cpu / elapsed, 100 * cpu / elapsed / bots, 100 * busy / elapsed, lag * 1e3))
+    if args.threads:
+        rssPerThread, sizePerThread = idleThreads(args.threads)
+        print("idle thread: %.1f KB RSS, %.0f KB virtual each" % (rssPerThread, sizePerThread))
+
+
+if __name__ == "__main__":
+    main()
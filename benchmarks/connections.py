@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.request import urlopen
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+#This benchmark starts serve.py and measures how many websockets one
+#process can hold. It opens --idle connections that only answer pings and
+#reports the server's memory per connection, then makes --active of them
+#send getBoard in a loop and reports round-trip latency and throughput.
+#Raise the open file limit (ulimit -n) before asking for large counts.
+
+
+def serverMemory(pid):
+    with open("/proc/%d/status" % pid) as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+async def connectAll(url, count, batch):
+    import socketio
+    clients = []
+    for start in range(0, count, batch):
+        group = [socketio.AsyncClient(reconnection=False)
+            for _ in range(min(batch, count - start))]
+        await asyncio.gather(*[client.connect(url, transports=["websocket"])
+            for client in group])
+        clients.extend(group)
+    return clients
+
+
+async def activeClient(client, room, seconds, latencies):
+    answered = asyncio.Event()
+    client.on("getBoardResponse", lambda board: answered.set())
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        answered.clear()
+        start = time.perf_counter()
+        await client.emit("getBoard", room)
+        await answered.wait()
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(args, pid):
+    rss = serverMemory(pid)
+    start = time.perf_counter()
+    clients = await connectAll(args.url, args.idle, args.batch)
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(2)
+    perConnection = (serverMemory(pid) - rss) / max(1, len(clients))
+    print("idle: %d connections in %.1fs, %.1f KiB server memory each" %
+        (len(clients), elapsed, perConnection / 1024))
+
+    with urlopen(args.url + "/api/createroom", data=b"5") as response:
+        room = json.loads(response.read())["roomCode"]
+    latencies = []
+    active = clients[:args.active]
+    await asyncio.gather(*[activeClient(client, room, args.seconds, latencies)
+        for client in active])
+    latencies.sort()
+    if latencies:
+        print("active: %d clients, %.0f requests/s, p50 %.2f ms, p99 %.2f ms" %
+            (len(active), len(latencies) / args.seconds,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000))
+    await asyncio.gather(*[client.disconnect() for client in clients])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--idle", type=int, default=10000)
+    parser.add_argument("--active", type=int, default=1000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument("--async-mode", default="eventlet")
+    args = parser.parse_args()
+    args.url = "http://127.0.0.1:%d" % args.port
+
+    environment = dict(os.environ, PORT=str(args.port), ASYNC_MODE=args.async_mode)
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "serve.py")],
+        env=environment, cwd=ROOT)
+    try:
+        time.sleep(2)
+        asyncio.run(run(args, process.pid))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    main()
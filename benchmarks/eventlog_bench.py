@@ -0,0 +1,120 @@
+import argparse
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import simulate
+from engine import GameEngine, READ_ONLY
+from eventlog import EventLog
+
+#This benchmark measures what the event log costs on the write path and
+#how fast rooms are rebuilt from it. It plays the same seeded games twice,
+#once without and once with logging, then recovers every room from the
+#log (with and without a checkpoint) and checks the rebuilt rooms match
+#the live ones.
+
+
+#This engine logs every state-changing event the simulator applies, the
+#way server.dispatch does.
+class LoggingEngine(GameEngine):
+    def __init__(self, eventLog):
+        GameEngine.__init__(self)
+        self.eventLog = eventLog
+        self.rooms = {}
+
+    def apply(self, state, event):
+        result = GameEngine.apply(self, state, event)
+        if event["type"] not in READ_ONLY:
+            self.eventLog.append(self.rooms[id(state)], state, event)
+        return result
+
+
+def playGames(games, size):
+    start = time.perf_counter()
+    for seed in range(games):
+        simulate.playGame(size, seed)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=7)
+    parser.add_argument("--flush-interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    simulate.ENGINE = GameEngine()
+    baseline = playGames(args.games, args.size)
+
+    directory = tempfile.mkdtemp(prefix="eventlog-")
+    try:
+        eventLog = EventLog(directory, flushInterval=args.flush_interval)
+        engine = LoggingEngine(eventLog)
+        simulate.ENGINE = engine
+
+        #Each game gets a fresh room, logged with its seed the way
+        #createRoom does. Remember them to compare after recovery.
+        live = {}
+        original = simulate.Room
+
+        def trackedRoom(size, seed):
+            room = original(size, seed)
+            code = "G%06d" % len(live)
+            live[code] = room
+            engine.rooms[id(room)] = code
+            eventLog.append(code, room, {"type":"create", "size":size, "seed":seed})
+            return room
+
+        simulate.Room = trackedRoom
+        start = time.perf_counter()
+        for seed in range(args.games):
+            simulate.playGame(args.size, seed)
+        logged = time.perf_counter() - start
+        eventLog.flush()
+        flushed = time.perf_counter() - start
+        simulate.Room = original
+        events = eventLog.queued
+
+        print("games=%d events=%d" % (args.games, events))
+        print("without log: %.3fs  with log: %.3fs (+%.2f us/event), durable after %.3fs" %
+            (baseline, logged, (logged - baseline) / events * 1e6, flushed))
+
+        def check(rooms):
+            for code, room in live.items():
+                rebuilt = rooms[code]
+                assert rebuilt.board == room.board and rebuilt.winner == room.winner \
+                    and rebuilt.seq == room.seq, code
+
+        #The log is still open and holds the directory, so recover from a
+        #copy of it, as a crash would have left it.
+        crashed = directory + "-crashed"
+        shutil.copytree(directory, crashed)
+        start = time.perf_counter()
+        recovering = EventLog(crashed)
+        rooms = recovering.recover(GameEngine())
+        elapsed = time.perf_counter() - start
+        recovering.close()
+        shutil.rmtree(crashed)
+        check(rooms)
+        print("recovery from log only: %.3fs (%.0f events/s)" % (elapsed, events / elapsed))
+
+        eventLog.checkpoint(lambda code: pickle.dumps(live[code], pickle.HIGHEST_PROTOCOL))
+        eventLog.close()
+        start = time.perf_counter()
+        recovering = EventLog(directory)
+        rooms = recovering.recover(GameEngine())
+        elapsed = time.perf_counter() - start
+        recovering.close()
+        check(rooms)
+        print("recovery from snapshots: %.3fs (%.0f rooms/s)" % (elapsed, len(rooms) / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
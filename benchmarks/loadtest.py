@@ -0,0 +1,321 @@
+import argparse
+import json
+import os
+import pickle
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+#This load generator plays full games through the socket events, the
+#same way the browser does: newUser -> addName -> getRole -> onLoadGame
+#-> chancellorSelection -> vote -> getCardsPresident -> discardPresident
+#-> updateBoard, and so on until gameOver. By default it runs every
+#room in-process through the flask_socketio test client; with --url it
+#drives real websocket clients against a running server instead.
+#
+#It reports p50/p99 latency per event, games completed per second and
+#memory per room. --max-p99-ms and --min-games-per-sec turn it into a
+#regression gate: the exit status is 1 when either is missed, or when
+#the server rejected any event.
+#
+#Scripted players move far faster than people, so in-process runs set
+#the server's rate limits to --rate-limits (every budget unlimited by
+#default) through RATE_LIMITS_SID and RATE_LIMITS_ROOM. With --url the
+#server's own budgets apply.
+
+UNLIMITED = ",".join("%s=1000000/1000000" % event for event in ("default",
+    "vote", "getCardsPresident", "onLoadGame", "sync", "spectate", "getOdds"))
+
+
+#This class talks to the server through the flask_socketio test client.
+#Handlers run synchronously inside emit, so the time spent in emit is
+#the handler latency.
+class TestTransport:
+    def __init__(self, server):
+        self.client = server.socketio.test_client(server.app)
+
+    def emit(self, event, *args):
+        self.client.emit(event, *args)
+        return self.client.get_received()
+
+    def drain(self):
+        self.client.get_received()
+
+    def close(self):
+        self.client.disconnect()
+
+
+#This class talks to a running server over a real websocket. Messages
+#arrive on a background thread; emit waits for the first message that
+#arrives afterwards, or for a short settle time when the event sends
+#nothing back to this client.
+class SocketTransport:
+    def __init__(self, url, settle):
+        import socketio
+        self.client = socketio.Client(reconnection=False)
+        self.received = []
+        self.arrived = threading.Condition()
+        self.settle = settle
+
+        @self.client.on("*")
+        def catchAll(event, *args):
+            with self.arrived:
+                self.received.append({"name":event, "args":list(args)})
+                self.arrived.notify()
+
+        self.client.connect(url, transports=["websocket"])
+
+    def emit(self, event, *args):
+        with self.arrived:
+            self.received = []
+        self.client.emit(event, args)
+        with self.arrived:
+            self.arrived.wait_for(lambda: self.received, timeout=self.settle)
+            received = self.received
+            self.received = []
+        return received
+
+    def drain(self):
+        with self.arrived:
+            self.received = []
+
+    def close(self):
+        self.client.disconnect()
+
+
+#This class keeps latency samples per event name.
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.rejected = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def add(self, event, seconds):
+        with self.lock:
+            self.samples[event].append(seconds)
+
+    def percentile(self, event, fraction):
+        values = sorted(self.samples[event])
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+#This generator plays one game in a room. It yields after every emit so
+#the caller can interleave many rooms, and returns the winner.
+def playGame(code, transports, recorder, rng):
+    size = len(transports)
+    names = ["P%d" % i for i in range(size)]
+    userIds = ["%s%02d" % (code, i) for i in range(size)]
+    byName = dict(zip(names, transports))
+    dead = set()
+
+    def send(transport, event, *args):
+        start = time.perf_counter()
+        received = transport.emit(event, *args)
+        recorder.add(event, time.perf_counter() - start)
+        for message in received:
+            if message["name"] == "rejected":
+                recorder.rejected[message["args"][0]["event"]] += 1
+        for other in transports:
+            if other is not transport:
+                other.drain()
+        return [(message["name"], message["args"]) for message in received]
+
+    for i in range(size):
+        send(transports[i], "newUser", userIds[i], code)
+        yield
+    for i in range(size):
+        send(transports[i], "addName", userIds[i], names[i], code)
+        yield
+    for i in range(size):
+        send(transports[i], "getRole", code, userIds[i])
+        yield
+    pending = []
+    for i in range(size):
+        pending.extend(send(transports[i], "onLoadGame", code, names[i]))
+        yield
+
+    while pending:
+        event, args = pending.pop(0)
+        data = args[0] if args else None
+        if event == "gameOver":
+            return data
+        if event == "playerExecuted":
+            dead.add(data)
+        elif event == "president":
+            candidates = data["chancellorCandidates"]
+            if candidates:
+                pending.extend(send(byName[data["president"]],
+                    "chancellorSelection", rng.choice(candidates), code))
+        elif event == "voting":
+            for name in names:
+                if name not in dead:
+                    pending.extend(send(byName[name], "vote",
+                        rng.choice(("Yes", "No")), code, name))
+                    yield
+        elif event == "voteResult":
+            if data["majority"] == "Yes":
+                pending.extend(send(byName[data["president"]],
+                    "getCardsPresident", code))
+                president = data["president"]
+            else:
+                pending.extend(send(transports[0], "handler", "1", code))
+        elif event == "sendCardsPresident":
+            pending.extend(send(byName[president], "discardPresident",
+                rng.choice(data), list(data), code))
+        elif event == "sendCardsChancellor":
+            cards = data["cards"]
+            pending.extend(send(byName[data["chancellor"]], "updateBoard",
+                rng.choice(cards), list(cards), code))
+        elif event == "investigationSelection":
+            send(byName[data["president"]], "investigationResponse",
+                rng.choice(data["players"]), code)
+            pending.extend(send(transports[0], "handler", "2", code))
+        elif event == "specialPresidency":
+            pending.extend(send(byName[data["president"]],
+                "specialPresidencySelection", rng.choice(data["players"]), code))
+        elif event == "showTopCard":
+            pending.extend(send(transports[0], "handler", "2", code))
+        elif event == "executePlayer":
+            pending.extend(send(byName[data["president"]], "executionResponse",
+                rng.choice(data["players"]), code))
+        yield
+    return "stuck"
+
+
+def createRoomInProcess(httpClient, size):
+    response = httpClient.post("/api/createroom", data=str(size))
+    return response.get_json()["roomCode"]
+
+
+def createRoomOverHttp(url, size):
+    from urllib.request import urlopen
+    with urlopen(url.rstrip("/") + "/api/createroom", data=str(size).encode()) as response:
+        return json.loads(response.read())["roomCode"]
+
+
+#This function runs every room in this process, interleaving one emit
+#per room at a time so that all rooms are in flight together.
+def runInProcess(args, recorder):
+    os.environ.setdefault("RATE_LIMITS_SID", args.rate_limits)
+    os.environ.setdefault("RATE_LIMITS_ROOM", args.rate_limits)
+    import server
+    httpClient = server.app.test_client()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    games = []
+    for i in range(args.rooms):
+        size = args.size or random.Random(args.seed + i).randint(5, 10)
+        code = createRoomInProcess(httpClient, size)
+        transports = [TestTransport(server) for _ in range(size)]
+        games.append((code, transports,
+            playGame(code, transports, recorder, random.Random(args.seed + i))))
+
+    results = []
+    peakRoomBytes = 0
+    traced = 0
+    start = time.perf_counter()
+    while games:
+        running = []
+        for code, transports, game in games:
+            try:
+                next(game)
+                running.append((code, transports, game))
+            except StopIteration as finished:
+                results.append(finished.value)
+                room = server.DATA.get(code)
+                if room is not None:
+                    peakRoomBytes = max(peakRoomBytes, len(pickle.dumps(room)))
+                for transport in transports:
+                    transport.close()
+        if len(results) == 0:
+            traced = tracemalloc.get_traced_memory()[0] - baseline
+        games = running
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    return results, elapsed, traced / max(1, args.rooms), peakRoomBytes
+
+
+#This function plays each room on its own thread against a real server.
+def runOverSocket(args, recorder):
+    def runRoom(i):
+        rng = random.Random(args.seed + i)
+        size = args.size or rng.randint(5, 10)
+        code = createRoomOverHttp(args.url, size)
+        transports = [SocketTransport(args.url, args.settle) for _ in range(size)]
+        try:
+            game = playGame(code, transports, recorder, rng)
+            while True:
+                next(game)
+        except StopIteration as finished:
+            return finished.value
+        finally:
+            for transport in transports:
+                transport.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(runRoom, range(args.rooms)))
+    return results, time.perf_counter() - start, None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end socket load test")
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--size", type=int, default=0,
+        help="players per room, 0 picks 5-10 at random")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", default=None,
+        help="drive a running server over websockets instead of in-process")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--settle", type=float, default=0.05)
+    parser.add_argument("--max-p99-ms", type=float, default=None)
+    parser.add_argument("--min-games-per-sec", type=float, default=None)
+    parser.add_argument("--rate-limits", default=UNLIMITED,
+        help="budgets for the in-process server, such as vote=2/4")
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    if args.url:
+        results, elapsed, perRoom, roomBytes = runOverSocket(args, recorder)
+    else:
+        results, elapsed, perRoom, roomBytes = runInProcess(args, recorder)
+
+    completed = sum(1 for result in results if result in ("F", "L"))
+    print("rooms=%d completed=%d stuck=%d time=%.2fs games/s=%.1f" %
+        (args.rooms, completed, len(results) - completed, elapsed, completed / elapsed))
+    if perRoom is not None:
+        print("memory/room: %.0f bytes traced, %d bytes pickled (largest)" %
+            (perRoom, roomBytes))
+    print("%-28s %8s %10s %10s" % ("event", "count", "p50 ms", "p99 ms"))
+    worstP99 = 0.0
+    for event in sorted(recorder.samples):
+        p50 = recorder.percentile(event, 0.50) * 1000
+        p99 = recorder.percentile(event, 0.99) * 1000
+        worstP99 = max(worstP99, p99)
+        print("%-28s %8d %10.3f %10.3f" %
+            (event, len(recorder.samples[event]), p50, p99))
+
+    failed = False
+    if recorder.rejected:
+        print("FAIL: rejected events %s" % dict(recorder.rejected))
+        failed = True
+    if args.max_p99_ms is not None and worstP99 > args.max_p99_ms:
+        print("FAIL: p99 %.3f ms exceeds %.3f ms" % (worstP99, args.max_p99_ms))
+        failed = True
+    if args.min_games_per_sec is not None and completed / elapsed < args.min_games_per_sec:
+        print("FAIL: %.1f games/s below %.1f" % (completed / elapsed, args.min_games_per_sec))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from engine import Player, Room
+from store import MemoryRoomStore
+
+#This benchmark measures the lobby directory with many rooms. It fills a
+#MemoryRoomStore with --rooms rooms of random sizes, part of them in the
+#lobby with free seats, lists them all, and reports the cost of moving a
+#room between buckets, of fetching a page of /api/rooms and of finding a
+#best fit for /api/quickjoin, against scanning every room the way the
+#only lookup before the directory would have to.
+
+
+def fill(rooms, rng):
+    store = MemoryRoomStore()
+    for i in range(rooms):
+        size = rng.randint(5, 10)
+        room = Room(size)
+        for j in range(rng.randint(0, size)):
+            room.addPlayer(Player("%d-%d" % (i, j)))
+        code = "%06d" % i
+        store.put(code, room)
+        store.listRoom(code, size, size - len(room.players))
+    return store
+
+
+def scanBestFit(store, seats):
+    best = None
+    for code in store.codes():
+        room = store.get(code)
+        free = room.size - len(room.players)
+        if free >= seats and (best is None or free < best[0]):
+            best = (free, code)
+    return best
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        function(i)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=300000)
+    parser.add_argument("--repeat", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    store = fill(args.rooms, rng)
+    print("rooms=%d listed=%d filled in %.2fs" % (args.rooms, len(store.listing),
+        time.perf_counter() - start))
+
+    codes = store.codes()
+
+    def move(i):
+        code = codes[rng.randrange(len(codes))]
+        room = store.rooms[code]
+        store.listRoom(code, room.size, rng.randint(0, room.size))
+
+    def page(i):
+        store.openRooms(limit=50)
+
+    def deepPage(i):
+        store.openRooms(7, (3, 7, codes[rng.randrange(len(codes))]), 50)
+
+    def bestFit(i):
+        store.bestFit(rng.randint(1, 5))
+
+    print("%-28s %10s" % ("operation", "us"))
+    print("%-28s %10.2f" % ("list/move a room", timed(move, args.repeat)))
+    print("%-28s %10.2f" % ("first page of 50", timed(page, args.repeat)))
+    print("%-28s %10.2f" % ("page of 50 after a cursor", timed(deepPage, args.repeat)))
+    print("%-28s %10.2f" % ("best fit", timed(bestFit, args.repeat)))
+    print("%-28s %10.2f" % ("best fit by scanning rooms",
+        timed(lambda i: scanBestFit(store, 3), max(1, args.repeat // 1000))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import simulate
+from engine import GameEngine
+from metrics import Metrics, configureLogging
+
+#This benchmark measures what metrics and logging add to every event. It
+#plays the same seeded games with a bare engine, with the recording that
+#server.dispatch and server.deliver do around each event, and with that
+#plus debug logging sampled at --sample, and reports the extra time per
+#event.
+
+
+class MeteredEngine(GameEngine):
+    def __init__(self, metrics):
+        GameEngine.__init__(self)
+        self.metrics = metrics
+
+    def apply(self, state, event):
+        start = time.perf_counter()
+        result = GameEngine.apply(self, state, event)
+        for message in result[1]:
+            self.metrics.countEmit(message.event, message.data)
+        self.metrics.observeHandler(event["type"], time.perf_counter() - start)
+        return result
+
+
+def play(engine, games):
+    simulate.ENGINE = engine
+    events = 0
+    start = time.perf_counter()
+    for seed in range(games):
+        events += simulate.playGame(8, seed)[1]
+    return time.perf_counter() - start, events
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--sample", type=int, default=1000)
+    args = parser.parse_args()
+
+    baseline, events = play(GameEngine(), args.games)
+    metered, _ = play(MeteredEngine(Metrics()), args.games)
+
+    logger = configureLogging("DEBUG", args.sample)
+    logger.handlers[0].stream = open(os.devnull, "w")
+    logged, _ = play(MeteredEngine(Metrics()), args.games)
+    logger.setLevel(logging.WARNING)
+
+    print("events=%d" % events)
+    print("bare engine:              %.3fs" % baseline)
+    print("with metrics:             %.3fs (+%.2f us/event)" %
+        (metered, (metered - baseline) / events * 1e6))
+    print("with metrics + debug 1/%d: %.3fs (+%.2f us/event)" %
+        (args.sample, logged, (logged - baseline) / events * 1e6))
+
+
+if __name__ == "__main__":
+    main()
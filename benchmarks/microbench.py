@@ -0,0 +1,103 @@
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import simulate
+from engine import GameEngine, Room
+from store import MemoryRoomStore
+
+#This benchmark measures the cost of single engine events. The first
+#part plays full 10-player games and times every event by type. The
+#second part fills a store with thousands of 10-player rooms and times
+#the session + apply path the socket handlers take, round-robin across
+#all rooms so the working set is as large as it is in production.
+
+
+class TimedEngine(GameEngine):
+    def __init__(self):
+        GameEngine.__init__(self)
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def apply(self, state, event):
+        start = time.perf_counter()
+        result = GameEngine.apply(self, state, event)
+        self.totals[event["type"]] += time.perf_counter() - start
+        self.counts[event["type"]] += 1
+        return result
+
+
+def perEvent(games):
+    engine = TimedEngine()
+    simulate.ENGINE = engine
+    for seed in range(games):
+        simulate.playGame(10, seed)
+    print("10-player rooms, %d games" % games)
+    print("%-28s %10s %10s" % ("event", "count", "us/event"))
+    for name in sorted(engine.totals):
+        print("%-28s %10d %10.2f" % (name, engine.counts[name],
+            engine.totals[name] / engine.counts[name] * 1e6))
+
+
+def startedRoom(engine, seed):
+    room = Room(10, seed)
+    for i in range(10):
+        engine.apply(room, {"type":"newUser", "userId":str(i)})
+    for i in range(10):
+        engine.apply(room, {"type":"addName", "userId":str(i), "name":"P%d" % i})
+    engine.apply(room, {"type":"onLoadGame", "name":"P1"})
+    return room
+
+
+def manyRooms(count, rounds):
+    engine = GameEngine()
+    store = MemoryRoomStore()
+    codes = ["R%05d" % i for i in range(count)]
+    for i, code in enumerate(codes):
+        store.put(code, startedRoom(engine, i))
+
+    def run(event):
+        with store.session(code) as room:
+            engine.apply(room, event)
+
+    timings = {}
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for code in codes:
+            run({"type":"onLoadGame", "name":"P5"})
+    timings["onLoadGame"] = (time.perf_counter() - start) / (rounds * count)
+
+    start = time.perf_counter()
+    for code in codes:
+        run({"type":"chancellorSelection", "chancellor":"P3"})
+        for i in range(10):
+            run({"type":"vote", "name":"P%d" % i, "vote":"Yes"})
+    timings["vote"] = (time.perf_counter() - start) / (count * 11)
+
+    start = time.perf_counter()
+    for code in codes:
+        run({"type":"getCardsPresident"})
+    timings["getCardsPresident"] = (time.perf_counter() - start) / count
+
+    print("%d rooms in the store" % count)
+    for name, seconds in timings.items():
+        print("%-28s %10.2f us/event" % (name, seconds * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--rooms", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    perEvent(args.games)
+    print()
+    manyRooms(args.rooms, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import odds
+
+#This benchmark compares the batched NumPy odds with the plain Python
+#baseline. It works out the next-draw odds for --states random deck
+#states and plays --games random games from the start both ways, times
+#cached and uncached deckOdds lookups, and prints the executive power
+#odds for every room size.
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--states", type=int, default=1000000)
+    parser.add_argument("--games", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if odds.numpy is None:
+        print("numpy is not installed; both columns use plain Python")
+    rng = random.Random(args.seed)
+    fascist = [rng.randint(0, odds.FASCIST_CARDS) for _ in range(args.states)]
+    liberal = [rng.randint(max(0, 3 - f), odds.LIBERAL_CARDS) for f in fascist]
+
+    pythonDraw, _ = timed(lambda: [odds.drawOdds(f, l) for f, l in zip(fascist, liberal)])
+    batchDraw, _ = timed(lambda: odds.drawOddsBatch(fascist, liberal))
+    pythonPlay, _ = timed(lambda: odds.playOutPython(11, 6, 0, 0, args.games, args.seed))
+    batchPlay, _ = timed(lambda: odds.playOut(11, 6, 0, 0, args.games, args.seed))
+
+    print("%-34s %12s %12s %9s" % ("", "python s", "batched s", "speedup"))
+    print("%-34s %12.3f %12.3f %8.1fx" % ("next-draw odds, %d states" % args.states,
+        pythonDraw, batchDraw, pythonDraw / batchDraw))
+    print("%-34s %12.3f %12.3f %8.1fx" % ("random playouts, %d games" % args.games,
+        pythonPlay, batchPlay, pythonPlay / batchPlay))
+
+    odds.deckOdds.cache_clear()
+    miss, _ = timed(lambda: odds.publicOdds({"F": 2, "L": 1}))
+    hit, _ = timed(lambda: [odds.publicOdds({"F": 2, "L": 1}) for _ in range(10000)])
+    print("deckOdds: miss %.2f ms, hit %.2f us" % (miss * 1e3, hit / 10000 * 1e6))
+
+    print()
+    print("%-5s %-18s %12s %10s" % ("size", "power", "at least 1", "expected"))
+    for size in range(5, 11):
+        for power, chances in sorted(odds.powerOdds(size, seed=args.seed).items()):
+            print("%-5d %-18s %12.4f %10.3f" % (size, power,
+                chances["atLeastOnce"], chances["expected"]))
+
+
+if __name__ == "__main__":
+    main()
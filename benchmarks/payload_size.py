@@ -0,0 +1,65 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import codec
+import simulate
+from engine import GameEngine
+
+#This benchmark compares the JSON and the compact MessagePack encodings
+#of the messages real games send. It records every message from a batch
+#of simulated games and reports, per message type, the average size and
+#encode time of each format.
+
+
+class RecordingEngine(GameEngine):
+    def __init__(self):
+        GameEngine.__init__(self)
+        self.messages = defaultdict(list)
+
+    def apply(self, state, event):
+        result = GameEngine.apply(self, state, event)
+        for message in result[1]:
+            self.messages[message.event].append(message.data)
+        return result
+
+
+def timeEncode(payloads, function):
+    start = time.perf_counter()
+    sizes = [len(function(data)) for data in payloads]
+    return sum(sizes) / len(sizes), (time.perf_counter() - start) / len(payloads)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=500)
+    args = parser.parse_args()
+
+    engine = RecordingEngine()
+    simulate.ENGINE = engine
+    for seed in range(args.games):
+        simulate.playGame(5 + seed % 6, seed)
+
+    if codec.msgpack is None:
+        print("msgpack is not installed; showing JSON only")
+    print("%-24s %8s %10s %10s %10s %10s" %
+        ("message", "count", "json B", "json us", "msgpack B", "msgpack us"))
+    for event, payloads in sorted(engine.messages.items()):
+        jsonSize, jsonTime = timeEncode(payloads,
+            lambda data: json.dumps(data, separators=(",", ":")))
+        if codec.msgpack is not None:
+            packedSize, packedTime = timeEncode(payloads,
+                lambda data: codec.encode(data, "msgpack"))
+        else:
+            packedSize, packedTime = float("nan"), float("nan")
+        print("%-24s %8d %10.1f %10.2f %10.1f %10.2f" % (event, len(payloads),
+            jsonSize, jsonTime * 1e6, packedSize, packedTime * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+import argparse
+import fnmatch
+import hashlib
+import socketserver
+import threading
+import time
+
+#This is a small stand-in for a Redis server, for running the Redis room
+#store (store.RedisRoomStore) without installing one. It speaks the RESP
+#protocol over TCP (RESP2, and enough of RESP3 for clients that ask for
+#it) and implements only the commands the store and
+#redis-py's lock send: strings with NX/PX, sets, hashes, sorted sets
+#read by rank and by lex range, SCAN, MULTI/EXEC pipelines, and the lock
+#release script. Every command runs under one lock, so it is atomic the
+#way Redis commands are. It is for checks and benchmarks, not speed.
+
+RELEASE_SCRIPT = "redis.call('del'"
+
+
+class Error(Exception):
+    pass
+
+
+class Keyspace:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expires = {}
+        self.scripts = {}
+
+    def lookup(self, key, kind=None):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            del self.expires[key]
+        value = self.data.get(key)
+        if value is not None and kind is not None and not isinstance(value, kind):
+            raise Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def delete(self, key):
+        self.expires.pop(key, None)
+        return self.data.pop(key, None) is not None
+
+    def create(self, key, kind):
+        value = self.lookup(key, kind)
+        if value is None:
+            value = self.data[key] = kind()
+        return value
+
+    #This method runs one command (a list of bytes) and returns its reply.
+    def run(self, command):
+        name = command[0].decode().lower()
+        handler = getattr(self, "cmd_" + name, None)
+        if handler is None:
+            raise Error("ERR unknown command '%s'" % name)
+        return handler(*command[1:])
+
+    def cmd_ping(self, *args):
+        return args[0] if args else Status("PONG")
+
+    def cmd_client(self, *args):
+        return Status("OK")
+
+    def cmd_select(self, db):
+        return Status("OK")
+
+    def cmd_get(self, key):
+        return self.lookup(key, bytes)
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        expires = None
+        for flag, scale in ((b"PX", 0.001), (b"EX", 1.0)):
+            if flag in options:
+                expires = time.monotonic() + int(options[options.index(flag) + 1]) * scale
+        if b"NX" in options and self.lookup(key) is not None:
+            return None
+        self.delete(key)
+        self.data[key] = value
+        if expires is not None:
+            self.expires[key] = expires
+        return Status("OK")
+
+    def cmd_pexpire(self, key, milliseconds):
+        if self.lookup(key) is None:
+            return 0
+        self.expires[key] = time.monotonic() + int(milliseconds) / 1000
+        return 1
+
+    def cmd_del(self, *keys):
+        return sum(1 for key in keys if self.lookup(key) is not None and self.delete(key))
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self.lookup(key) is not None)
+
+    def cmd_scan(self, cursor, *options):
+        pattern = b"*"
+        options = list(options)
+        for i in range(0, len(options) - 1, 2):
+            if options[i].upper() == b"MATCH":
+                pattern = options[i + 1]
+        keys = [key for key in list(self.data) if self.lookup(key) is not None
+            and fnmatch.fnmatchcase(key.decode("latin-1"), pattern.decode("latin-1"))]
+        return [b"0", keys]
+
+    def cmd_sadd(self, key, *members):
+        members = set(members)
+        found = self.create(key, set)
+        added = len(members - found)
+        found |= members
+        return added
+
+    def cmd_srem(self, key, *members):
+        found = self.lookup(key, set) or set()
+        removed = len(found & set(members))
+        found -= set(members)
+        return removed
+
+    def cmd_sismember(self, key, member):
+        return int(member in (self.lookup(key, set) or ()))
+
+    def cmd_smembers(self, key):
+        return list(self.lookup(key, set) or ())
+
+    def cmd_hset(self, key, *pairs):
+        found = self.create(key, dict)
+        added = 0
+        for field, value in zip(pairs[::2], pairs[1::2]):
+            added += field not in found
+            found[field] = value
+        return added
+
+    def cmd_hget(self, key, field):
+        return (self.lookup(key, dict) or {}).get(field)
+
+    def cmd_hdel(self, key, *fields):
+        found = self.lookup(key, dict) or {}
+        return sum(1 for field in fields if found.pop(field, None) is not None)
+
+    def cmd_zadd(self, key, *args):
+        args = [arg for arg in args if arg.upper() not in (b"NX", b"XX", b"CH", b"GT", b"LT")]
+        found = self.create(key, ZSet)
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            added += member not in found
+            found[member] = float(score)
+        return added
+
+    def cmd_zrem(self, key, *members):
+        found = self.lookup(key, ZSet) or {}
+        return sum(1 for member in members if found.pop(member, None) is not None)
+
+    def cmd_zrange(self, key, start, stop, *options):
+        ordered = (self.lookup(key, ZSet) or ZSet()).ordered()
+        start, stop = int(start), int(stop)
+        if stop < 0:
+            stop += len(ordered)
+        return ordered[start:stop + 1]
+
+    def cmd_zrangebylex(self, key, low, high, *options):
+        ordered = (self.lookup(key, ZSet) or ZSet()).ordered()
+        picked = [member for member in ordered if lexAbove(member, low) and lexBelow(member, high)]
+        if options and options[0].upper() == b"LIMIT":
+            offset, count = int(options[1]), int(options[2])
+            picked = picked[offset:] if count < 0 else picked[offset:offset + count]
+        return picked
+
+    def cmd_script(self, subcommand, *args):
+        if subcommand.upper() != b"LOAD":
+            raise Error("ERR unsupported SCRIPT subcommand")
+        sha = hashlib.sha1(args[0]).hexdigest().encode()
+        self.scripts[sha] = args[0].decode()
+        return sha
+
+    def cmd_evalsha(self, sha, count, *args):
+        script = self.scripts.get(sha.lower())
+        if script is None:
+            raise Error("NOSCRIPT No matching script. Please use EVAL.")
+        return self.evaluate(script, int(count), args)
+
+    def cmd_eval(self, script, count, *args):
+        return self.evaluate(script.decode(), int(count), args)
+
+    #Only the script redis-py's Lock releases itself with is understood:
+    #delete KEYS[1] if it still holds the token ARGV[1].
+    def evaluate(self, script, count, args):
+        keys, argv = args[:count], args[count:]
+        if RELEASE_SCRIPT not in script:
+            raise Error("ERR the stand-in only runs the lock release script")
+        if self.lookup(keys[0]) != argv[0]:
+            return 0
+        self.delete(keys[0])
+        return 1
+
+
+#A sorted set: member -> score, listed by (score, member).
+class ZSet(dict):
+    def ordered(self):
+        return [member for score, member in sorted((score, member)
+            for member, score in self.items())]
+
+
+def lexAbove(member, low):
+    if low == b"-":
+        return True
+    if low[:1] == b"(":
+        return member > low[1:]
+    return member >= low[1:]
+
+
+def lexBelow(member, high):
+    if high == b"+":
+        return True
+    if high[:1] == b"(":
+        return member < high[1:]
+    return member <= high[1:]
+
+
+class Status(str):
+    pass
+
+
+#A RESP3 map, only sent in answer to HELLO 3.
+class Map(dict):
+    pass
+
+
+#This function encodes a reply for a connection speaking RESP2 or RESP3,
+#which differ only in how they send nil and maps here.
+def encodeReply(reply, protocol=2):
+    if reply is None:
+        return b"_\r\n" if protocol == 3 else b"$-1\r\n"
+    if isinstance(reply, Status):
+        return b"+" + reply.encode() + b"\r\n"
+    if isinstance(reply, Error):
+        return b"-" + str(reply).encode() + b"\r\n"
+    if isinstance(reply, Map):
+        return b"%%%d\r\n" % len(reply) + b"".join(
+            encodeReply(key, protocol) + encodeReply(value, protocol)
+            for key, value in reply.items())
+    if isinstance(reply, bool) or isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, str):
+        reply = reply.encode()
+    if isinstance(reply, bytes):
+        return b"$%d\r\n%s\r\n" % (len(reply), reply)
+    return b"*%d\r\n" % len(reply) + b"".join(encodeReply(item, protocol)
+        for item in reply)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def readCommand(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if line[:1] != b"*":
+            return line.split()
+        command = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            command.append(self.rfile.read(length + 2)[:-2])
+        return command
+
+    def handle(self):
+        keyspace = self.server.keyspace
+        queued = None
+        protocol = 2
+        while True:
+            command = self.readCommand()
+            if command is None:
+                return
+            name = command[0].upper()
+            if name == b"HELLO":
+                reply = self.hello(command[1:])
+                if not isinstance(reply, Error):
+                    protocol = int(command[1]) if len(command) > 1 else 2
+            elif name == b"MULTI":
+                queued = []
+                reply = Status("OK")
+            elif name == b"EXEC" and queued is not None:
+                with keyspace.lock:
+                    reply = [self.runSafely(keyspace, queuedCommand)
+                        for queuedCommand in queued]
+                queued = None
+            elif name == b"DISCARD" and queued is not None:
+                queued = None
+                reply = Status("OK")
+            elif queued is not None:
+                queued.append(command)
+                reply = Status("QUEUED")
+            else:
+                with keyspace.lock:
+                    reply = self.runSafely(keyspace, command)
+            self.wfile.write(encodeReply(reply, protocol))
+
+    #This method answers HELLO. Replies use the RESP2 types that RESP3
+    #kept, except for nil and the HELLO map itself.
+    def hello(self, args):
+        protocol = int(args[0]) if args else 2
+        if protocol not in (2, 3):
+            return Error("NOPROTO unsupported protocol version")
+        info = [("server", "redis"), ("version", "7.0.0"), ("proto", protocol),
+            ("id", 1), ("mode", "standalone"), ("role", "master"), ("modules", [])]
+        if protocol == 3:
+            return Map(info)
+        return [item for pair in info for item in pair]
+
+    def runSafely(self, keyspace, command):
+        try:
+            return keyspace.run(command)
+        except Error as error:
+            return error
+        except (IndexError, ValueError):
+            return Error("ERR syntax error")
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        socketserver.ThreadingTCPServer.__init__(self, (host, port), Handler)
+        self.keyspace = Keyspace()
+
+    @property
+    def url(self):
+        return "redis://%s:%d/0" % self.server_address
+
+    #This method serves on a background thread and returns the URL.
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in Redis server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    server = RespServer(args.host, args.port)
+    print("serving %s" % server.url)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
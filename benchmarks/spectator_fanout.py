@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import simulate
+from engine import GameEngine
+from server import PUBLIC_EVENTS, spectatorEvents, spectatorFrameJSON
+
+#This benchmark compares two ways of feeding spectators. The naive way
+#sends every public broadcast to every spectator, encoding it once per
+#socket. The way server.py does it collects the broadcasts and sends one
+#frame per tick with the state changes since the previous frame, encoded
+#once for the whole room, and skips ticks where nothing happened. It
+#plays seeded games, treats every --events-per-tick engine events as one
+#tick, and reports the encode work each way, the bytes spectators
+#receive and the extra time the player path pays. Frames also carry the
+#parts of the public view no event holds (votes cast, deck sizes, failed
+#votes), so they only undercut naive bytes once ticks coalesce several
+#elections; their events leave out what the view already says.
+
+
+class FanoutEngine(GameEngine):
+    def __init__(self, spectators, eventsPerTick, naive):
+        GameEngine.__init__(self)
+        self.spectators = spectators
+        self.eventsPerTick = eventsPerTick
+        self.naive = naive
+        self.pending = []
+        self.events = 0
+        self.frames = 0
+        self.bytes = 0
+        self.playerPath = 0.0
+        self.lastVersion = None
+
+    def apply(self, state, event):
+        result = GameEngine.apply(self, state, event)
+        start = time.perf_counter()
+        for message in result[1]:
+            if message.broadcast and message.event in PUBLIC_EVENTS:
+                if self.naive:
+                    for _ in range(self.spectators):
+                        self.bytes += len(json.dumps([message.event, message.data]))
+                    self.frames += self.spectators
+                else:
+                    self.pending.append([message.event, message.data])
+        self.playerPath += time.perf_counter() - start
+        self.events += 1
+        if not self.naive and self.events % self.eventsPerTick == 0:
+            state.recordVersion()
+            full, changes = state.changesSince(self.lastVersion)
+            self.lastVersion = state.version
+            frame = spectatorFrameJSON("ABCD", state.version, full, changes,
+                spectatorEvents(self.pending, state.lastPublic))
+            if frame is not None:
+                self.bytes += len(frame) * self.spectators
+                self.frames += 1
+            self.pending = []
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--spectators", default="10,100,1000,5000")
+    parser.add_argument("--events-per-tick", type=int, default=10)
+    args = parser.parse_args()
+
+    print("%-11s %-10s %12s %12s %14s %14s" % ("spectators", "mode",
+        "encodes", "MB sent", "total s", "player us/ev"))
+    for spectators in [int(n) for n in args.spectators.split(",")]:
+        for naive in (True, False):
+            engine = FanoutEngine(spectators, args.events_per_tick, naive)
+            simulate.ENGINE = engine
+            start = time.perf_counter()
+            for seed in range(args.games):
+                simulate.playGame(10, seed)
+            elapsed = time.perf_counter() - start
+            print("%-11d %-10s %12d %12.2f %14.3f %14.2f" % (spectators,
+                "naive" if naive else "coalesced", engine.frames,
+                engine.bytes / 1e6, elapsed, engine.playerPath / engine.events * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask import Flask, render_template
+
+from assets import assetUrl, loadStaticAssets, renderPages, serveAsset
+
+#This benchmark compares serving a page the old way (render_template on
+#every hit, static files through Flask's /static) with the prebuilt,
+#precompressed pages and fingerprinted assets of assets.py. It uses the
+#repo's templates and static folder when they exist, otherwise a page
+#and a script of a similar size. It reports requests per second for the
+#page, and the bytes a browser downloads on a first and on a repeat
+#visit (page plus every static file).
+
+HEADERS = {"Accept-Encoding": "gzip, deflate, br"}
+
+
+def sampleSite(directory, rng):
+    os.makedirs(os.path.join(directory, "templates"))
+    os.makedirs(os.path.join(directory, "static"))
+    words = ["room", "vote", "policy", "president", "chancellor", "fascist",
+        "liberal", "board", "player", "card", "lobby", "game"]
+    script = "\n".join("function %s%d(a, b) { return a.%s(b, %d); }" %
+        (rng.choice(words), i, rng.choice(words), rng.randrange(1000))
+        for i in range(2000))
+    with open(os.path.join(directory, "static", "socket.io.min.js"), "w") as handle:
+        handle.write(script)
+    body = "".join("<div class='%s'>%s</div>\n" % (rng.choice(words),
+        " ".join(rng.choice(words) for _ in range(8))) for _ in range(150))
+    with open(os.path.join(directory, "templates", "home.html"), "w") as handle:
+        handle.write("<html><head><script src=\"{{ script }}\"></script></head>"
+            "<body>%s</body></html>" % body)
+
+
+def buildApps(templates, static):
+    before = Flask("before", template_folder=templates, static_folder=static)
+    after = Flask("after", template_folder=templates, static_folder=static)
+    assets = loadStaticAssets(static)
+    after.jinja_env.globals["assetUrl"] = lambda path: assetUrl(assets, path)
+    scripts = sorted(assets)
+
+    @before.context_processor
+    def beforeScripts():
+        return {"script": "/static/" + scripts[0] if scripts else ""}
+
+    @after.context_processor
+    def afterScripts():
+        return {"script": assetUrl(assets, scripts[0]) if scripts else ""}
+
+    @before.route("/")
+    def beforeHome():
+        return render_template("home.html")
+
+    pages = renderPages(after, {"home": "home.html"})
+
+    @after.route("/")
+    def afterHome():
+        return serveAsset(pages["home"])
+
+    @after.route("/assets/<fingerprint>/<path:filename>")
+    def afterAsset(fingerprint, filename):
+        return serveAsset(assets[filename])
+
+    staticUrls = {"before": ["/static/" + path for path in scripts],
+        "after": [assetUrl(assets, path) for path in scripts]}
+    return before, after, staticUrls
+
+
+#This function loads the page and its static files as a browser would:
+#it revalidates what it has an ETag for and skips what is immutable.
+def visit(client, urls, cache):
+    downloaded = 0
+    for url in urls:
+        entry = cache.get(url)
+        if entry is not None and "immutable" in entry[1]:
+            continue
+        headers = dict(HEADERS)
+        if entry is not None and entry[0]:
+            headers["If-None-Match"] = entry[0]
+        response = client.get(url, headers=headers)
+        downloaded += len(response.get_data())
+        if response.status_code == 200:
+            cache[url] = (response.headers.get("ETag"),
+                response.headers.get("Cache-Control", ""))
+        response.close()
+    return downloaded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    directory = None
+    templates = os.path.join(root, "templates")
+    static = os.path.join(root, "static")
+    if not os.path.exists(os.path.join(templates, "home.html")):
+        directory = tempfile.mkdtemp(prefix="static-bench-")
+        sampleSite(directory, random.Random(args.seed))
+        templates = os.path.join(directory, "templates")
+        static = os.path.join(directory, "static")
+    try:
+        before, after, staticUrls = buildApps(templates, static)
+        print("%-7s %12s %14s %14s" % ("", "page req/s", "first visit B", "repeat visit B"))
+        for name, app in (("before", before), ("after", after)):
+            client = app.test_client()
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                client.get("/", headers=HEADERS).close()
+            rate = args.requests / (time.perf_counter() - start)
+            cache = {}
+            urls = ["/"] + staticUrls[name]
+            first = visit(client, urls, cache)
+            repeat = visit(client, urls, cache)
+            print("%-7s %12.0f %14d %14d" % (name, rate, first, repeat))
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import os
+import random
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from engine import Room
+from resp_server import RespServer
+from store import MemoryRoomStore, RedisRoomStore
+
+#This check runs the Redis room store against a Redis-protocol server (by
+#default the stand-in in resp_server.py) and the in-memory store side by
+#side, and fails if they ever disagree. It covers rooms and sessions
+#(including threads changing the same room at once, which the per-room
+#lock has to serialize), user IDs, and the lobby directory: random
+#listings and delistings, then every page of openRooms and bestFit for
+#every group size. It needs the redis client package, as the store does.
+
+
+def check(failures, name, got, expected):
+    if got != expected:
+        failures.append("%s: got %r, expected %r" % (name, got, expected))
+
+
+def checkRooms(stores, failures, threads, rounds):
+    for store in stores:
+        for code in ("AAAA", "BBBB"):
+            store.put(code, Room(5, 1))
+        with store.session("AAAA") as room:
+            room.voteYes = 3
+        with store.session("ZZZZ") as room:
+            check(failures, "session of a missing room", room, None)
+
+        def bump():
+            for _ in range(rounds):
+                with store.session("BBBB") as room:
+                    room.voteNo += 1
+        workers = [threading.Thread(target=bump) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        kind = type(store).__name__
+        check(failures, kind + " write-back", store.get("AAAA").voteYes, 3)
+        check(failures, kind + " concurrent sessions", store.get("BBBB").voteNo,
+            threads * rounds)
+        check(failures, kind + " codes", sorted(store.codes()), ["AAAA", "BBBB"])
+        check(failures, kind + " contains", ("AAAA" in store, "ZZZZ" in store), (True, False))
+        check(failures, kind + " len", len(store), 2)
+        store.delete("AAAA")
+        check(failures, kind + " delete", (store.get("AAAA"), len(store)), (None, 1))
+        store.delete("BBBB")
+
+        check(failures, kind + " unknown user ID", bool(store.hasUserId("0123456789")), False)
+        store.addUserId("0123456789")
+        check(failures, kind + " user ID", bool(store.hasUserId("0123456789")), True)
+
+
+def checkDirectory(stores, failures, rooms, seed):
+    rng = random.Random(seed)
+    memory, redis = stores
+    codes = ["%04d" % i for i in range(rooms)]
+    for _ in range(rooms * 3):
+        code = rng.choice(codes)
+        if rng.random() < 0.2:
+            for store in stores:
+                store.delistRoom(code)
+        else:
+            size = rng.randint(5, 10)
+            free = rng.randint(0, size)
+            for store in stores:
+                store.listRoom(code, size, free)
+
+    for size in [None] + list(range(5, 11)):
+        for limit in (1, 7, 50):
+            pages = []
+            for store in stores:
+                after, seen = None, []
+                while True:
+                    page = store.openRooms(size, after, limit)
+                    seen.extend(page)
+                    if len(page) < limit:
+                        break
+                    code, roomSize, free = page[-1]
+                    after = (free, roomSize, code)
+                pages.append(seen)
+            check(failures, "openRooms size=%s limit=%d" % (size, limit), pages[1], pages[0])
+        for seats in range(1, 11):
+            check(failures, "bestFit seats=%d size=%s" % (seats, size),
+                redis.bestFit(seats, size), memory.bestFit(seats, size))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None,
+        help="a Redis server to check against instead of the stand-in")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--rooms", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = RespServer()
+        url = server.start()
+    try:
+        stores = [MemoryRoomStore(), RedisRoomStore(url, prefix="check%d:" % os.getpid())]
+        failures = []
+        checkRooms(stores, failures, args.threads, args.rounds)
+        checkDirectory(stores, failures, args.rooms, args.seed)
+    finally:
+        if server is not None:
+            server.stop()
+
+    for failure in failures:
+        print("FAIL " + failure)
+    print("store check against %s: %d failures" % (url, len(failures)))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
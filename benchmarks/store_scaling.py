@@ -0,0 +1,72 @@
+import argparse
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from engine import Room
+from resp_server import RespServer
+from store import createStore
+
+#This benchmark measures how many room sessions per second the store
+#serves as the number of worker processes grows. Each worker owns its
+#own rooms and runs a vote-like read/modify/write on them, which is the
+#access pattern of the socket handlers. Every worker shares the Redis
+#server at --url, which has to be a real Redis for the numbers to show
+#scaling. --url memory runs each worker on its own in-memory store as a
+#baseline, and --url standin starts the stand-in from resp_server.py,
+#which runs every command under one lock: it shows the store working
+#across processes, but its throughput cannot grow with the workers.
+
+
+def worker(args):
+    url, workerIndex, rooms, rounds = args
+    store = createStore(None if url == "memory" else url)
+    codes = ["W%dR%d" % (workerIndex, i) for i in range(rooms)]
+    for code in codes:
+        store.put(code, Room(10))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for code in codes:
+            with store.session(code) as room:
+                room.voteYes += 1
+    elapsed = time.perf_counter() - start
+    for code in codes:
+        store.delete(code)
+    return rooms * rounds, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", required=True,
+        help="a Redis server (redis://...), memory or standin")
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    server = None
+    if args.url == "standin":
+        server = RespServer()
+        args.url = server.start()
+        print("store: stand-in at %s; it serializes every command, so these "
+            "numbers check the store, they do not measure scaling" % args.url)
+    else:
+        print("store: %s" % args.url)
+    for count in [int(n) for n in args.workers.split(",")]:
+        jobs = [(args.url, i, args.rooms, args.rounds) for i in range(count)]
+        with Pool(count) as pool:
+            start = time.perf_counter()
+            results = pool.map(worker, jobs)
+            wall = time.perf_counter() - start
+        total = sum(ops for ops, _ in results)
+        print("workers=%d sessions=%d wall=%.2fs throughput=%.0f/s" %
+            (count, total, wall, total / wall))
+    if server is not None:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import heapq
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from timers import TimerWheel
+
+#This benchmark measures what the room deadlines cost with many of them
+#armed at once. It arms --timers deadlines of 30 to 120 seconds on a
+#timer wheel driven by a simulated clock, then re-arms a share of them
+#the way server.armDeadline does after every event, and reports the cost
+#of scheduling, re-arming and of each tick while the wheel turns through
+#the next --seconds. A binary heap with lazy cancellation is timed the
+#same way for comparison.
+
+
+class HeapTimers:
+    def __init__(self, tick):
+        self.tick = tick
+        self.heap = []
+        self.counter = itertools.count()
+        self.now = 0.0
+
+    def schedule(self, delay, callback):
+        entry = [self.now + delay, next(self.counter), callback]
+        heapq.heappush(self.heap, entry)
+        return entry
+
+    def cancel(self, entry):
+        entry[2] = None
+
+    def advance(self, now):
+        self.now = now
+        fired = 0
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            if entry[2] is not None:
+                entry[2]()
+                fired += 1
+        return fired
+
+
+def run(name, timers, args, delays):
+    fired = [0]
+
+    def callback():
+        fired[0] += 1
+
+    start = time.perf_counter()
+    armed = [timers.schedule(delay, callback) for delay in delays]
+    scheduleTime = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    for _ in range(args.rearms):
+        i = rng.randrange(len(armed))
+        timers.cancel(armed[i])
+        armed[i] = timers.schedule(delays[i], callback)
+    rearmTime = time.perf_counter() - start
+
+    ticks = int(args.seconds / args.tick)
+    start = time.perf_counter()
+    for tick in range(1, ticks + 1):
+        timers.advance(tick * args.tick + 1e-9)
+    tickTime = time.perf_counter() - start
+
+    print("%-6s %12.2f %12.2f %14.2f %10d" % (name,
+        scheduleTime / len(delays) * 1e6, rearmTime / args.rearms * 1e6,
+        tickTime / ticks * 1e6, fired[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--timers", type=int, default=100000)
+    parser.add_argument("--rearms", type=int, default=200000)
+    parser.add_argument("--seconds", type=float, default=150)
+    parser.add_argument("--tick", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    delays = [rng.uniform(30, 120) for _ in range(args.timers)]
+
+    print("timers=%d rearms=%d simulated=%.0fs tick=%.2fs" %
+        (args.timers, args.rearms, args.seconds, args.tick))
+    print("%-6s %12s %12s %14s %10s" % ("", "schedule us", "rearm us",
+        "us per tick", "fired"))
+    clock = [0.0]
+    run("wheel", TimerWheel(args.tick, clock=lambda: clock[0]), args, delays)
+    run("heap", HeapTimers(args.tick), args, delays)
+
+
+if __name__ == "__main__":
+    main()
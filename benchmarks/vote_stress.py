@@ -0,0 +1,120 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import server
+from engine import Room
+
+#This stress test fires every vote of an election at the same moment, from
+#one thread per player, across many rooms at once, and checks that each
+#room's tally is exact: one voteResult per election, every player counted
+#once, and the majority matching the votes that were sent. It then
+#reports how deep the room queues got.
+#
+#To make the threads really interleave, the interpreter switches threads
+#every --switch-interval seconds and each vote yields in the middle of
+#the handler (see YieldingRoom). With --no-executor the votes skip the
+#room executor, which shows the tally going wrong without it.
+
+
+#This room gives up the GIL every time the engine looks at the votes,
+#which the vote handler does between checking, storing and counting a
+#vote.
+class YieldingRoom(Room):
+    __slots__ = ()
+
+    @property
+    def votes(self):
+        time.sleep(0)
+        return Room.votes.__get__(self)
+
+    @votes.setter
+    def votes(self, value):
+        Room.votes.__set__(self, value)
+
+
+def startedRoom(code, size):
+    server.DATA.put(code, YieldingRoom(size, 0))
+    for i in range(size):
+        server.applyEvent(code, {"type":"newUser", "userId":"%s%d" % (code, i)})
+    for i in range(size):
+        server.applyEvent(code, {"type":"addName", "userId":"%s%d" % (code, i),
+            "name":"P%d" % i})
+    server.applyEvent(code, {"type":"onLoadGame", "name":"P1"})
+
+
+#The test only votes, so once an election is over the room is put
+#straight back to waiting on a chancellor instead of playing the policy
+#a passed vote leads to.
+def reopenElection(code):
+    with server.DATA.session(code) as currentRoom:
+        currentRoom.chancellor = ""
+        currentRoom.voted = True
+        currentRoom.dirty = True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--size", type=int, default=10)
+    parser.add_argument("--elections", type=int, default=20)
+    parser.add_argument("--switch-interval", type=float, default=1e-6)
+    parser.add_argument("--no-executor", action="store_true")
+    args = parser.parse_args()
+
+    sys.setswitchinterval(args.switch_interval)
+    if args.no_executor:
+        server.ROOMS.submit = lambda code, task: task()
+
+    codes = ["V%03d" % i for i in range(args.rooms)]
+    for code in codes:
+        startedRoom(code, args.size)
+
+    threads = args.rooms * args.size
+    failures = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        for election in range(args.elections):
+            for code in codes:
+                reopenElection(code)
+                currentRoom = server.DATA.get(code)
+                candidate = currentRoom.getChancellorCandidates()[0]
+                server.applyEvent(code, {"type":"chancellorSelection",
+                    "chancellor":candidate})
+
+            barrier = threading.Barrier(threads)
+
+            def vote(code, i):
+                choice = "Yes" if (i + election) % 3 else "No"
+                event = {"type":"vote", "name":"P%d" % i, "vote":choice}
+                barrier.wait()
+                return server.ROOMS.submit(code, lambda: server.applyEvent(code, event))
+
+            futures = {(code, i): pool.submit(vote, code, i)
+                for code in codes for i in range(args.size)}
+            expectedYes = sum(1 for i in range(args.size) if (i + election) % 3)
+            expected = "Yes" if expectedYes > args.size - expectedYes else "No"
+            for code in codes:
+                results = [message for i in range(args.size)
+                    for message in futures[(code, i)].result()
+                    if message.event == "voteResult"]
+                if len(results) != 1 or len(results[0].data["votingArray"]) != args.size \
+                        or results[0].data["majority"] != expected:
+                    failures += 1
+    elapsed = time.perf_counter() - start
+
+    votes = args.rooms * args.size * args.elections
+    print("rooms=%d players=%d elections=%d votes=%d time=%.2fs votes/s=%.0f" %
+        (args.rooms, args.size, args.elections, votes, elapsed, votes / elapsed))
+    print("queues: %s" % server.ROOMS.stats())
+    print("tally failures: %d" % failures)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import logging
+import random
+
+from engine import executivePower
+
+log = logging.getLogger("secrethitler.bots")
+
+#The following classes play for bots: players the server seats itself,
+#through the same newUser and addName events as everybody else, and who
+#act through the same game events. A bot has no socket and no thread. It
+#is just a name in its room's entry in the BotRunner, with the policy it
+#plays by. Its moves are worked out from the room as it is, so bots
+#remember nothing between moves and need no messages.
+#
+#Whenever an event changes a room that has bots, one timer for the whole
+#room is put on the server's timer wheel. When it fires, every bot with
+#something to do makes one move in the room's executor, and the events
+#they send set the next timer. That way thousands of bots share the one
+#thread that turns the wheel.
+
+
+#This policy picks at random wherever a player has a choice, like the
+#headless simulator. Every method is given the room, the bot's Player
+#and a random generator; other policies override what they care about.
+class RandomPolicy:
+    name = "random"
+
+    #This method picks the chancellor from the candidates.
+    def chancellor(self, room, player, candidates, rng):
+        return rng.choice(candidates)
+
+    #This method gives "Yes" or "No" for the government on the ballot.
+    def vote(self, room, player, rng):
+        return rng.choice(("Yes", "No"))
+
+    #This method gives the card the president discards from three.
+    def discard(self, room, player, cards, rng):
+        return rng.choice(cards)
+
+    #This method gives the card the chancellor plays from two.
+    def enact(self, room, player, cards, rng):
+        return rng.choice(cards)
+
+    #This method picks a player for "investigation", "execution" or
+    #"specialPresidency".
+    def target(self, room, player, power, players, rng):
+        return rng.choice(players)
+
+
+#This policy plays for its side with what the player could know: its
+#own role, its team if it is a Fascist (and Hitler in rooms of five or
+#six), and the players it has investigated. Liberals bury fascist
+#policies and vote against governments with a known fascist in them;
+#fascists do the opposite and vote for governments with one of their
+#own in them.
+class HeuristicPolicy(RandomPolicy):
+    name = "heuristic"
+
+    #This method gives the names the player knows to be on the fascist
+    #side.
+    def fascists(self, room, player):
+        if player.role == "Fascist" or player.role == "Hitler" and room.size <= 6:
+            return {other.name for other in room.players if other.role != "Liberal"}
+        known = {player.name} if player.role == "Hitler" else set()
+        for entry in room.record:
+            if entry[0] == "investigate" and entry[1] == player.name:
+                other = room.byName.get(entry[2])
+                if other is not None and other.role != "Liberal":
+                    known.add(other.name)
+        return known
+
+    def prefer(self, room, player, names, fascist, rng):
+        known = self.fascists(room, player)
+        if player.role != "Liberal":
+            fascist = not fascist
+        picks = [name for name in names if (name in known) == fascist]
+        return rng.choice(picks or names)
+
+    def chancellor(self, room, player, candidates, rng):
+        return self.prefer(room, player, candidates, False, rng)
+
+    def vote(self, room, player, rng):
+        known = self.fascists(room, player)
+        government = known & {room.president, room.chancellor}
+        if player.role == "Liberal":
+            return "No" if government else "Yes"
+        return "Yes" if government else "No"
+
+    def discard(self, room, player, cards, rng):
+        card = "F" if player.role == "Liberal" else "L"
+        return card if card in cards else cards[0]
+
+    def enact(self, room, player, cards, rng):
+        card = "L" if player.role == "Liberal" else "F"
+        return card if card in cards else cards[0]
+
+    def target(self, room, player, power, players, rng):
+        if power == "investigation":
+            done = {entry[2] for entry in room.record
+                if entry[0] == "investigate" and entry[1] == player.name}
+            return rng.choice([name for name in players if name not in done] or players)
+        return self.prefer(room, player, players, power == "execution", rng)
+
+
+POLICIES = {policy.name: policy for policy in (RandomPolicy(), HeuristicPolicy())}
+
+
+#This function gives the power the president of the room still has to
+#use before picking a chancellor: "specialPresidency" while they have to
+#name the next president, "investigation" once they have seen the party
+#(they pass the presidency on), or "showTopCard", which the room only
+#tells apart from an ordinary turn by the policy the president has just
+#enacted.
+def unusedPower(room):
+    if room.specialPick:
+        return "specialPresidency"
+    record = room.record
+    if not record:
+        return None
+    last = record[-1]
+    if last[0] == "investigate" and last[1] == room.president:
+        return "investigation"
+    if last[0] == "policy" and last[1] == "F" and not last[2] and len(record) > 1 \
+            and record[-2][0] == "vote" and record[-2][1] == room.president:
+        if executivePower(room.size, room.board["F"]) == "showTopCard":
+            return "showTopCard"
+    return None
+
+
+#This function gives the event the named bot sends next in the room, or
+#None if the room is not waiting on it.
+def nextEvent(room, name, policy, rng):
+    if room.phase() != "game":
+        return None
+    player = room.byName.get(name)
+    if player is None or player.dead:
+        return None
+    if room.president == "":
+        return {"type":"onLoadGame", "name":name}
+    action = room.pendingAction()
+    if action == "vote":
+        if name in room.votes:
+            return None
+        return {"type":"vote", "name":name, "vote":policy.vote(room, player, rng)}
+    if action == "updateBoard":
+        if name != room.chancellor:
+            return None
+        cards = list(room.currentCards)
+        return {"type":"updateBoard", "card":policy.enact(room, player, cards, rng),
+            "cards":cards}
+    if name != room.president:
+        return None
+    if action == "discardPresident":
+        if not room.currentCards:
+            return {"type":"getCardsPresident"}
+        cards = list(room.currentCards)
+        return {"type":"discardPresident",
+            "discard":policy.discard(room, player, cards, rng), "cards":cards}
+    if action == "power":
+        players = room.getPlayers()
+        if room.investigation:
+            return {"type":"investigationResponse",
+                "selectedPlayer":policy.target(room, player, "investigation", players, rng)}
+        return {"type":"executionResponse",
+            "selectedPlayer":policy.target(room, player, "execution", players, rng)}
+    power = unusedPower(room)
+    if power == "specialPresidency":
+        return {"type":"specialPresidencySelection",
+            "president":policy.target(room, player, power, room.getPlayers(), rng)}
+    if power is not None:
+        return {"type":"handler", "code":"2"}
+    candidates = room.getChancellorCandidates()
+    if not candidates:
+        return None
+    return {"type":"chancellorSelection",
+        "chancellor":policy.chancellor(room, player, candidates, rng)}
+
+
+#This class keeps the bots of every room and wakes them. It does not
+#know about sockets or stores: timers is the TimerWheel, submit(code,
+#task) runs a task in the room's executor, lookup(code) gives the room,
+#and apply(code, event) runs an event the way the server does, which
+#ends in a call to wake(). Bots wait think[0] to think[1] seconds before
+#each move.
+class BotRunner:
+    def __init__(self, timers, submit, lookup, apply, think=(1.0, 3.0), seed=None):
+        self.timers = timers
+        self.submit = submit
+        self.lookup = lookup
+        self.apply = apply
+        self.think = think
+        self.rng = random.Random(seed)
+        self.rooms = {}
+        self.pending = {}
+        self.moves = 0
+
+    #This method seats up to count bots playing by the policy in the
+    #room's free seats and returns their names. It has to run in the
+    #room's executor.
+    def seat(self, code, count, policy):
+        room = self.lookup(code)
+        if room is None or room.phase() != "lobby":
+            return []
+        bots = self.rooms.setdefault(code, {})
+        names = []
+        number = len(room.players)
+        for _ in range(min(count, room.size - len(room.players))):
+            number += 1
+            userId = "bot-%d" % number
+            name = "Bot %d" % number
+            while userId in room.byId or name in room.byName:
+                number += 1
+                userId = "bot-%d" % number
+                name = "Bot %d" % number
+            bots[name] = policy
+            names.append(name)
+            self.apply(code, {"type":"newUser", "userId":userId})
+            self.apply(code, {"type":"addName", "userId":userId, "name":name})
+            room = self.lookup(code)
+        if not bots:
+            del self.rooms[code]
+        return names
+
+    #This method drops the bots of a room that no longer exists.
+    def forget(self, code):
+        self.rooms.pop(code, None)
+        timer = self.pending.pop(code, None)
+        if timer is not None:
+            self.timers.cancel(timer)
+
+    #This method sets a timer for the room's bots if one of them has a
+    #move to make and none is set yet. It is called after every event
+    #that may change the room.
+    def wake(self, code, room):
+        bots = self.rooms.get(code)
+        if not bots or code in self.pending:
+            return
+        for name, policy in bots.items():
+            if nextEvent(room, name, policy, self.rng) is not None:
+                break
+        else:
+            return
+        timer = self.timers.schedule(self.rng.uniform(*self.think),
+            lambda: self.submit(code, lambda: self.act(code, timer)))
+        self.pending[code] = timer
+
+    #This method lets every bot in the room make at most one move, looking
+    #at the room again after each one.
+    def act(self, code, timer):
+        if self.pending.get(code) is not timer:
+            return
+        del self.pending[code]
+        for name, policy in list(self.rooms.get(code, {}).items()):
+            room = self.lookup(code)
+            if room is None:
+                return
+            event = nextEvent(room, name, policy, self.rng)
+            if event is not None:
+                self.moves += 1
+                self.apply(code, event)
+
+    def stats(self):
+        return {"rooms": len(self.rooms),
+            "bots": sum(len(bots) for bots in list(self.rooms.values())),
+            "waiting": len(self.pending), "moves": self.moves}
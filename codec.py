@@ -0,0 +1,105 @@
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+#The following functions encode outgoing messages for clients that have
+#asked for the compact binary format. The payload is packed with
+#MessagePack after its keys are swapped for small integer field IDs, and
+#every board is sent as [F, L]. Clients that never ask, or servers without
+#msgpack installed, keep getting the plain JSON payloads.
+#
+#Field IDs are part of the protocol: only ever append new ones.
+
+BOARD = {"board"}
+
+#Field IDs of the keys used in payloads. Nested objects use the same table.
+FIELDS = {
+    "president": 0,
+    "chancellorCandidates": 1,
+    "board": 2,
+    "majority": 3,
+    "votingArray": 4,
+    "chancellor": 5,
+    "message": 6,
+    "players": 7,
+    "card": 8,
+    "cards": 9,
+    "array": 10,
+    "role": 11,
+    "name": 12,
+    "userArray": 13,
+    "errorCode": 14,
+    "version": 15,
+    "full": 16,
+    "public": 17,
+    "private": 18,
+    "phase": 19,
+    "size": 20,
+    "voted": 21,
+    "votesCast": 22,
+    "failedVotes": 23,
+    "deckSize": 24,
+    "discardSize": 25,
+    "sentCards": 26,
+    "investigation": 27,
+    "specialPresidency": 28,
+    "execution": 29,
+    "winner": 30,
+    "hasVoted": 31,
+    "candidates": 32,
+    "action": 33,
+    "draw": 34,
+    "atLeastTwoF": 35,
+    "win": 36,
+    "event": 37,
+    "reason": 38,
+}
+
+
+#This function replaces known keys with their field IDs, recursively,
+#and turns boards into [F, L].
+def compact(data):
+    if isinstance(data, dict):
+        packed = {}
+        for key, value in data.items():
+            if key in BOARD and isinstance(value, dict):
+                value = [value.get("F", 0), value.get("L", 0)]
+            else:
+                value = compact(value)
+            packed[FIELDS.get(key, key)] = value
+        return packed
+    if isinstance(data, (list, tuple)):
+        return [compact(item) for item in data]
+    return data
+
+
+#This function picks the first encoding the client offered that this
+#server supports.
+def negotiate(offered):
+    if isinstance(offered, str):
+        offered = [offered]
+    for encoding in offered or ():
+        if encoding == "msgpack" and msgpack is not None:
+            return "msgpack"
+        if encoding == "json":
+            return "json"
+    return "json"
+
+
+#This function returns the payload to emit for a client using the given
+#encoding: bytes for msgpack, the data unchanged for json.
+def encode(data, encoding):
+    if encoding == "msgpack":
+        return msgpack.packb(compact(data), use_bin_type=True)
+    return data
+
+
+#This function returns how many bytes the payload takes on the wire,
+#for benchmarks and metrics.
+def encodedSize(data, encoding):
+    if encoding == "msgpack":
+        return len(encode(data, encoding))
+    return len(json.dumps(data, separators=(",", ":")))
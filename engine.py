@@ -0,0 +1,826 @@
+import logging
+import random
+import sys
+from collections import deque, namedtuple
+
+log = logging.getLogger("secrethitler.engine")
+
+#This is a message the engine wants delivered. When broadcast is True it
+#goes to everybody in the room, otherwise only to the socket that sent
+#the event.
+Message = namedtuple("Message", ["event", "data", "broadcast"])
+
+#The number of fascists (not counting Hitler) for each room size.
+FASCISTS = {5:1, 6:1, 7:2, 8:2, 9:3, 10:3}
+
+#How many versions of changes a room remembers. A client that reconnects
+#further behind than this is sent a full snapshot instead of a delta.
+SYNC_HISTORY = 64
+
+#These events only read the room, so they never bump its version.
+READ_ONLY = {"onLoadLobby", "getRole", "getBoard"}
+
+#What the engine may do for a player who lets a deadline pass, for each
+#thing a room can be waiting on (see Room.pendingAction). The first
+#choice is the default. "abstain" and "no" fill in the missing votes,
+#"discard" plays a random card for the player and "skip" moves the
+#presidency on.
+TIMEOUT_ACTIONS = {
+    "chancellorSelection": ("skip",),
+    "vote": ("abstain", "no"),
+    "discardPresident": ("discard", "skip"),
+    "updateBoard": ("discard",),
+    "power": ("skip",),
+}
+
+#The following class manages Rooms. It stores various variables to do with
+#voting, player roles and full a room is, and the state of cards. Players
+#are indexed by ID and by name so handlers never scan the player list.
+class Room:
+    __slots__ = ("ready", "size", "filled", "players", "byId", "byName",
+        "living", "president", "chancellor", "presIndex", "voteYes",
+        "voteNo", "votes", "voted", "ineligible", "lastChancellor",
+        "failedVotes", "currentCards", "sentCards", "deck", "discards",
+        "board", "investigation", "specialPresidency", "specialPick", "execution",
+        "winner", "record", "rng", "version", "dirty", "history", "lastPublic", "seq", "lastActive",
+        "connections", "listed", "archived")
+
+    def __init__(self, size, seed=None):
+        #This variable counts how many players are ready in the lobby
+        # (i.e how many players are named.)
+        self.ready = 0
+
+        #These variables store the size of the room and whether
+        #it is full.
+        self.size = int(size)
+        self.filled = False
+
+        #These variables hold the players in seating order, indexes of
+        #them by ID and by name, how many are alive, the name of the
+        #president and the name of the chancellor
+        self.players = []
+        self.byId = {}
+        self.byName = {}
+        self.living = 0
+        self.president= ""
+        self.chancellor = ""
+        self.presIndex = 0
+
+        #These variables stores information about voting. votes maps
+        #each player's name to their vote in the current election.
+        self.voteYes = 0
+        self.voteNo = 0
+        self.votes = {}
+        self.voted = True
+        self.ineligible = set()
+        self.lastChancellor = ""
+        self.failedVotes = 0
+
+        #These variables store information about the state
+        #of the deck, and whether cards have been shown
+        #to particular players
+        self.currentCards = []
+        self.sentCards = False
+        self.deck = deque(["F"]*11 + ["L"]*6)
+        self.discards = []
+
+        #This variable stores information about the state of the board
+        self.board = {"F":0,"L":0}
+
+        #These variables track whether things have happened. specialPick
+        #is set while the president still has to name the special
+        #president; specialPresidency stays set until that president's
+        #government is elected.
+        self.investigation = False
+        self.specialPresidency = False
+        self.specialPick = False
+        self.execution = False
+        self.winner = None
+
+        #This variable keeps what would otherwise be forgotten once the
+        #game is over, in order: ("vote", president, chancellor,
+        #votingArray, passed), ("policy", card, chaos), and
+        #("investigate" | "execute" | "special", president, target).
+        self.record = []
+
+        #Every random choice in a room comes from this generator, so a
+        #room replays exactly the same way from the same seed.
+        self.rng = random.Random(seed)
+
+        #These variables track the version of the room. Events that may
+        #change the room mark it dirty; the next time somebody asks for
+        #the version it is bumped if the public view really changed, and
+        #history keeps which parts changed at each version so a
+        #reconnecting client can be sent only what it missed.
+        self.version = 0
+        self.dirty = True
+        self.history = deque(maxlen=SYNC_HISTORY)
+        self.lastPublic = {}
+
+        #These variables are kept by the server rather than the rules:
+        #how many events have been written to the event log for the room,
+        #when it last saw an event, how many sockets are in it and how
+        #many free seats it is listed with in the lobby directory, and
+        #whether the finished game went to the archive.
+        self.seq = 0
+        self.lastActive = 0
+        self.connections = 0
+        self.listed = None
+        self.archived = False
+
+    #This method allows a player to be added into a list, and modifies
+    #the size and filled parameters accordingly.
+    def addPlayer(self, playerObject):
+        self.players.append(playerObject)
+        self.byId[playerObject.ID] = playerObject
+        if playerObject.name is not None:
+            self.byName[playerObject.name] = playerObject
+        if playerObject.dead == False:
+            self.living += 1
+        if len(self.players) == self.size:
+            self.filled = True
+
+    def removePlayer(self, playerObject):
+        self.players.remove(playerObject)
+        self.byId.pop(playerObject.ID, None)
+        self.byName.pop(playerObject.name, None)
+        if playerObject.dead == False:
+            self.living -= 1
+        self.filled = len(self.players) == self.size
+
+    #This method names a player and keeps the name index up to date.
+    def setName(self, playerObject, name):
+        self.byName.pop(playerObject.name, None)
+        playerObject.setName(name)
+        self.byName[name] = playerObject
+
+    def kill(self, playerObject):
+        if playerObject.dead == False:
+            playerObject.dead = True
+            self.living -= 1
+
+    #This method sets the first President at index 0.
+    def getPresident(self):
+        self.president = self.players[self.presIndex].name
+        return self.president
+
+    #This method finds the next living player in the player list and
+    #sets them as president.
+    def nextPresident(self):
+        self.presIndex = (self.presIndex + 1) % self.size
+        while self.players[self.presIndex].dead:
+            self.presIndex = (self.presIndex + 1) % self.size
+        self.president = self.players[self.presIndex].name
+        return self.president
+
+    #This method gives the list of candidates for Chancellor, excluding
+    #the current president, dead players, and immediately former
+    #chancellors and presidents. With five or fewer players alive only
+    #the last chancellor is term-limited.
+    def getChancellorCandidates(self):
+        ineligible = self.ineligible
+        if self.living <= 5:
+            ineligible = {self.lastChancellor}
+        return [player.name for player in self.players
+            if player.dead == False and player.name != self.president
+            and player.name not in ineligible]
+
+    #This method tells what the game is waiting on: "chancellorSelection",
+    #"vote", "discardPresident" (drawing or discarding), "updateBoard"
+    #(the chancellor's card) or "power" (an investigation or an
+    #execution). It gives None outside a game or before the first
+    #president is picked.
+    def pendingAction(self):
+        if self.phase() != "game" or self.president == "":
+            return None
+        if self.investigation or self.execution:
+            return "power"
+        if self.chancellor == "":
+            return "chancellorSelection"
+        if self.voted == False:
+            return "vote"
+        if self.sentCards:
+            return "updateBoard"
+        return "discardPresident"
+
+    def getPlayers(self):
+        L = []
+        for player in self.players:
+            if player.dead == False and player.name != self.president:
+                L.append(player.name)
+        log.debug("players %s", L)
+        return L
+
+    #This method gives the phase of the room: "lobby" until every
+    #player is named, "game" while it is being played and "finished"
+    #once somebody has won.
+    def phase(self):
+        if self.winner is not None:
+            return "finished"
+        if self.ready < self.size:
+            return "lobby"
+        return "game"
+
+    #This method estimates how many bytes the room holds, following its
+    #attributes, players, cards and votes.
+    def memoryEstimate(self):
+        return deepSize(self)
+
+    #This method gives the votes of the current election in the order
+    #they were cast, in the [name, vote] form the clients expect.
+    def votingArray(self):
+        return [[name, vote] for name, vote in self.votes.items()]
+
+    #This method gives the part of the room everybody may see.
+    def publicView(self):
+        return {
+            "phase": self.phase(),
+            "size": self.size,
+            "players": [[player.name, player.dead] for player in self.players],
+            "president": self.president,
+            "chancellor": self.chancellor,
+            "voted": self.voted,
+            "votesCast": len(self.votes),
+            "failedVotes": self.failedVotes,
+            "board": dict(self.board),
+            "deckSize": len(self.deck),
+            "discardSize": len(self.discards),
+            "sentCards": self.sentCards,
+            "investigation": self.investigation,
+            "specialPresidency": self.specialPresidency,
+            "execution": self.execution,
+            "winner": self.winner,
+        }
+
+    #This method gives the part of the room only one player may see:
+    #their role, whether they have voted, the chancellor candidates if
+    #they are choosing, and the cards in their hand.
+    def privateView(self, playerObject):
+        view = {"name": playerObject.name, "role": playerObject.role,
+            "hasVoted": playerObject.name in self.votes,
+            "candidates": None, "cards": None}
+        if playerObject.name == self.president:
+            if self.chancellor == "" and not (self.investigation
+                    or self.execution or self.specialPick):
+                view["candidates"] = self.getChancellorCandidates()
+            if self.currentCards and self.sentCards == False:
+                view["cards"] = list(self.currentCards)
+        if playerObject.name == self.chancellor and self.sentCards:
+            view["cards"] = list(self.currentCards)
+        return view
+
+    #This method bumps the version if the public view changed since it
+    #was last recorded and remembers which keys changed.
+    def recordVersion(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        public = self.publicView()
+        changed = [key for key, value in public.items()
+            if self.lastPublic.get(key, None) != value or key not in self.lastPublic]
+        if changed:
+            self.version += 1
+            self.history.append((self.version, frozenset(changed)))
+            self.lastPublic = public
+
+    #This method gives the public view changes since the given version
+    #as (False, changed keys and values), or (True, the whole view) when
+    #the version is unknown or older than the history. Call
+    #recordVersion() first.
+    def changesSince(self, since):
+        oldest = self.history[0][0] if self.history else self.version + 1
+        if since is None or since > self.version or since < oldest - 1:
+            return True, self.lastPublic
+        changed = set()
+        for version, keys in self.history:
+            if version > since:
+                changed |= keys
+        return False, {key: self.lastPublic[key] for key in changed}
+
+    #This method makes sure at least three cards can be drawn, shuffling
+    #the discard pile back into the deck when it runs low.
+    def refillDeck(self):
+        if len(self.deck) < 3:
+            cards = list(self.deck) + self.discards
+            self.discards = []
+            self.rng.shuffle(cards)
+            self.deck = deque(cards)
+
+    def presidentData(self, candidates=None):
+        if candidates is None:
+            candidates = self.getChancellorCandidates()
+        return {"president": self.president,
+            "chancellorCandidates": candidates, "board": self.board}
+
+class Player:
+    __slots__ = ("ID", "name", "role", "dead")
+
+    def __init__(self, ID):
+        self.ID = ID
+        self.name = None
+        self.role = None
+        self.dead = False
+    def setName(self, name):
+        self.name = name
+
+
+#This function gives the executive power a fascist policy grants in a
+#room of the given size when it is the fascistCards-th on the board:
+#"investigation", "specialPresidency", "showTopCard", "execution" or
+#None.
+def executivePower(size, fascistCards):
+    if (fascistCards == 1 and size in [9,10]) \
+        or (fascistCards == 2 and size in [7,8,9,10]):
+        return "investigation"
+    if fascistCards == 1 and size in [5,8,9,10]:
+        return "specialPresidency"
+    if fascistCards == 3 and size in [5,6]:
+        return "showTopCard"
+    if fascistCards in [4,5]:
+        return "execution"
+    return None
+
+
+#This function adds up sys.getsizeof over an object and everything it
+#refers to through containers and instance attributes, counting shared
+#objects once.
+def deepSize(obj, seen=None):
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deepSize(key, seen) + deepSize(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deepSize(item, seen)
+    elif hasattr(obj, "__dict__"):
+        size += deepSize(vars(obj), seen)
+    for name in getattr(type(obj), "__slots__", ()):
+        if hasattr(obj, name):
+            size += deepSize(getattr(obj, name), seen)
+    return size
+
+
+#The following class holds the rules of the game. Every socket event is
+#turned into an event dict such as {"type": "vote", "name": .., "vote": ..}
+#and passed to apply() together with the Room. The engine changes the
+#Room and returns the messages to send; it never touches sockets, so the
+#same rules run behind the server, the headless simulator and replays.
+class GameEngine:
+    #timeoutActions picks, for some of the keys of TIMEOUT_ACTIONS, which
+    #of their choices a "timeout" event takes.
+    def __init__(self, timeoutActions=None):
+        self.timeoutActions = {action: choices[0]
+            for action, choices in TIMEOUT_ACTIONS.items()}
+        for action, choice in (timeoutActions or {}).items():
+            if choice not in TIMEOUT_ACTIONS.get(action, ()):
+                raise ValueError("unknown timeout action: %s=%s" % (action, choice))
+            self.timeoutActions[action] = choice
+        self.handlers = {
+            "onLoadLobby": self.onLoadLobby,
+            "newUser": self.newUser,
+            "addName": self.addName,
+            "getRole": self.getRole,
+            "onLoadGame": self.onLoadGame,
+            "chancellorSelection": self.chancellorSelection,
+            "vote": self.vote,
+            "getCardsPresident": self.getCardsPresident,
+            "discardPresident": self.discardPresident,
+            "handler": self.handler,
+            "updateBoard": self.updateBoard,
+            "investigationResponse": self.investigationResponse,
+            "executionResponse": self.executionResponse,
+            "getBoard": self.getBoard,
+            "specialPresidencySelection": self.specialPresidencySelection,
+            "sync": self.sync,
+            "timeout": self.timeout,
+        }
+
+    #This method runs a single event against the room and returns the
+    #room together with the list of messages it produced.
+    def apply(self, state, event):
+        handler = self.handlers.get(event["type"])
+        if handler is None:
+            raise ValueError("unknown event type: %r" % (event["type"],))
+        messages = []
+        handler(state, event, messages)
+        if event["type"] not in READ_ONLY:
+            state.dirty = True
+        return state, messages
+
+    #This method returns the names of everyone that has set a name
+    #in the lobby.
+    def onLoadLobby(self, room, event, out):
+        userArray = []
+        for player in room.players:
+            if player.name != None:
+                userArray.append(player.name)
+        out.append(Message("onLoadLobbyResponse", {"userArray":userArray}, False))
+
+    #This method keeps a record of a player who has entered the lobby.
+    #A full room turns newcomers away with "2".
+    def newUser(self, room, event, out):
+        userId = event["userId"]
+        if userId in room.byId:
+            return
+        if room.filled:
+            out.append(Message("newUserResponse", "2", False))
+            return
+        room.addPlayer(Player(userId))
+        out.append(Message("newUserResponse", "0", True))
+
+    #This method lets a player set a name once and only once, without
+    #allowing duplicates with other users in the room. The errorCodes
+    #are: 0 -> success, 1 -> user name already in use, 2 -> the user is
+    #not in the room or already has a name. Only a new name counts
+    #towards the room being ready.
+    def addName(self, room, event, out):
+        userId = event["userId"]
+        username = event["name"]
+        player = room.byId.get(userId)
+        if player is None or player.name is not None:
+            out.append(Message("addNameSelf", {"errorCode":"2"}, False))
+            return
+        if username in room.byName:
+            out.append(Message("addNameSelf", {"errorCode":"1"}, False))
+            return
+        room.ready = room.ready + 1
+        room.setName(player, username)
+        out.append(Message("addNameSelf", {"errorCode":"0","name":username}, False))
+        out.append(Message("addNameRoom", username, True))
+
+        #Once the final user has selected their name the roles of Fascist,
+        #Hitler and Liberal are handed out at random according to the
+        #correct frequencies, and the cards are shuffled.
+        if room.ready == room.size:
+            F = FASCISTS[room.size]
+            A = room.rng.sample(range(1, room.size + 1), F + 1)
+            H = room.rng.choice(A)
+            i = 0
+            for player in room.players:
+                i += 1
+                if i in A:
+                    player.role = "Fascist"
+                else:
+                    player.role = "Liberal"
+                if i == H:
+                    player.role = "Hitler"
+            room.rng.shuffle(room.deck)
+            out.append(Message("begin", "0", True))
+
+    #This method passes the roles of the players to the client once the
+    #game room is reached.
+    def getRole(self, room, event, out):
+        playerRole = None
+        player = room.byId.get(event["userId"])
+        if player is not None:
+            playerRole = player.role
+            out.append(Message("getRoleResponse", player.role, False))
+        A = []
+        for player in room.players:
+            A.append({"name":player.name, "role": player.role})
+        out.append(Message("getPlayersResponse", {"array":A, "role":playerRole}, False))
+
+    def hasVoted(self, room, name):
+        return name in room.votes
+
+    #This method makes sure that players who refresh and return are given
+    #the right game information for a certain point in time.
+    def onLoadGame(self, room, event, out):
+        name = event["name"]
+        #This part deals with the president joining or rejoining the game.
+        if room.president == name:
+            log.debug("president reload investigation=%s chancellor=%s sentCards=%s",
+                room.investigation, room.chancellor, room.sentCards)
+            if room.investigation == True:
+                out.append(Message("investigationSelection", {"president":room.president,
+                    "players":room.getPlayers(), "board":room.board}, False))
+            #The president gets the chancellor candidates if one has not
+            #already been picked.
+            elif room.chancellor == "":
+                out.append(Message("president", room.presidentData(), False))
+            #The president gets their voting options if they have not
+            #yet voted.
+            elif room.voted == False:
+                if not self.hasVoted(room, name):
+                    out.append(Message("voting", room.chancellor, False))
+            #The president is shown their cards again if they have not
+            #passed them on. This is tracked by the .sentCards variable.
+            elif room.sentCards == False:
+                out.append(Message("sendCardsPresident", room.currentCards, False))
+        #This part deals with the chancellor joining or rejoining the game.
+        elif room.chancellor == name:
+            if room.voted == False:
+                if not self.hasVoted(room, name):
+                    out.append(Message("voting", room.chancellor, False))
+            #The remaining cards are shown to the chancellor if the
+            #president has passed them on.
+            elif room.sentCards == True:
+                out.append(Message("sendCardsChancellor", {"cards":room.currentCards,
+                    "chancellor":room.chancellor}, True))
+        else:
+            #The first president is picked if none has been picked yet.
+            if room.president == "":
+                room.getPresident()
+                out.append(Message("president", room.presidentData(), False))
+            #Players who have not voted are sent the voting information.
+            elif room.voted == False:
+                if not self.hasVoted(room, name):
+                    out.append(Message("voting", room.chancellor, False))
+
+    #This method stores the chancellor selection received from the
+    #president and starts voting. It is ignored unless the room is
+    #waiting on a chancellor rather than on a special president.
+    def chancellorSelection(self, room, event, out):
+        if room.pendingAction() != "chancellorSelection" or room.specialPick:
+            return
+        room.chancellor = event["chancellor"]
+        room.voted = False
+        out.append(Message("voting", event["chancellor"], True))
+
+    #This method adds the yes and no votes as they come from the clients
+    #and when everyone has voted it handles the consequences. Any other
+    #vote, such as "Abstain", counts towards everyone having voted but
+    #not towards the majority. Votes are only taken from living players
+    #while an election is open.
+    def vote(self, room, event, out):
+        vote = event["vote"]
+        name = event["name"]
+        if room.pendingAction() != "vote":
+            return
+        player = room.byName.get(name)
+        if player is None or player.dead:
+            return
+        #A player's vote only counts once per election.
+        if name in room.votes:
+            return
+        room.votes[name] = vote
+        if vote == "Yes":
+            room.voteYes += 1
+        if vote == "No":
+            room.voteNo += 1
+        if len(room.votes) != room.living:
+            return
+        #Once everyone has voted the ineligible chancellors for the next
+        #round are initialized.
+        room.voted = True
+        room.record.append(("vote", room.president, room.chancellor,
+            room.votingArray(), room.voteYes > room.voteNo))
+        if room.specialPresidency == False:
+            room.ineligible = {room.president}
+        #If the majority vote yes, the current chancellor is added to
+        #ineligible candidates.
+        if room.voteYes > room.voteNo:
+            room.failedVotes = 0
+            if room.specialPresidency == False:
+                room.ineligible.add(room.chancellor)
+            room.lastChancellor = room.chancellor
+            room.specialPresidency = False
+            out.append(Message("voteResult", {"majority": "Yes",
+                "votingArray": room.votingArray(),
+                "president": room.president,
+                "chancellor": room.chancellor}, True))
+        #If the majority votes no a new president is selected and the
+        #chancellor choice is reset. Three failed votes in a row place
+        #the top card on the board.
+        else:
+            room.failedVotes += 1
+            skipMessage = ""
+            if room.failedVotes == 3:
+                room.refillDeck()
+                firstCard = room.deck.popleft()
+                room.board[firstCard] += 1
+                room.record.append(("policy", firstCard, True))
+                skipMessage = "Three failed votes - a card was placed on board"
+                room.failedVotes = 0
+            out.append(Message("voteResult", {"majority": "No",
+                "votingArray": room.votingArray(),
+                "president": room.president,
+                "chancellor": room.chancellor,
+                "message": skipMessage}, True))
+            room.chancellor = ""
+            room.nextPresident()
+            self.checkGameOver(room, out)
+        room.voteNo = 0
+        room.voteYes = 0
+        room.votes = {}
+
+    #This method draws 3 cards from the top of the deck for the president.
+    #They are stored in case the president leaves and rejoins, and asking
+    #again before discarding sends the same cards rather than drawing.
+    def getCardsPresident(self, room, event, out):
+        if room.pendingAction() != "discardPresident":
+            return
+        if room.currentCards:
+            out.append(Message("sendCardsPresident", list(room.currentCards), False))
+            return
+        room.refillDeck()
+        cards = []
+        for i in range(3):
+            cards.append(room.deck.popleft())
+        room.currentCards = cards
+        out.append(Message("sendCardsPresident", cards, False))
+
+    #This method receives the card discarded by the president and sends
+    #the remaining cards to the chancellor. A discard that arrives after
+    #the cards were sent, such as one that lost the race with a timeout,
+    #is ignored.
+    def discardPresident(self, room, event, out):
+        if room.pendingAction() != "discardPresident":
+            return
+        discard = event["discard"]
+        cards = list(room.currentCards)
+        if discard not in cards:
+            return
+        cards.remove(discard)
+        room.discards.append(discard)
+        room.currentCards = cards
+        room.sentCards = True
+        out.append(Message("sendCardsChancellor", {"cards":cards,
+            "chancellor":room.chancellor}, True))
+
+    #Where the vote fails, or a presidential power has been used, this
+    #sends the chancellor candidates to the president. Code "2" moves
+    #the presidency on first.
+    def handler(self, room, event, out):
+        if event["code"] == "2":
+            room.nextPresident()
+        out.append(Message("president", room.presidentData(), True))
+
+    def checkGameOver(self, room, out):
+        for side in ("F", "L"):
+            if room.board[side] == 6:
+                room.winner = side
+                out.append(Message("gameOver", side, True))
+                return True
+        return False
+
+    #This method updates the board once the chancellor has picked their
+    #card and triggers the executive powers. It is ignored unless the
+    #chancellor holds the cards.
+    def updateBoard(self, room, event, out):
+        if room.pendingAction() != "updateBoard":
+            return
+        card = event["card"]
+        cards = list(room.currentCards)
+        if card not in cards:
+            return
+        #The other card goes on the discard pile and the selected card
+        #goes on the board.
+        cards.remove(card)
+        room.discards.extend(cards)
+        room.board[card] += 1
+        room.record.append(("policy", card, False))
+        room.sentCards = False
+        room.currentCards = []
+        room.chancellor = ""
+        if self.checkGameOver(room, out):
+            return
+        board = room.board
+        power = executivePower(room.size, board["F"]) if card == "F" else None
+        if power == "investigation":
+            room.investigation = True
+            out.append(Message("investigationSelection", {"president":room.president,
+                "players":room.getPlayers(), "board":board}, True))
+            return
+
+        if power == "specialPresidency":
+            room.specialPresidency = True
+            room.specialPick = True
+            out.append(Message("specialPresidency", {"president":room.president,
+                "players":room.getPlayers(), "board":board}, True))
+            return
+
+        if power == "showTopCard":
+            room.refillDeck()
+            out.append(Message("showTopCard", {"president":room.president,
+                "card":room.deck[0], "board":board}, True))
+            return
+
+        if power == "execution":
+            room.execution = True
+            out.append(Message("executePlayer", {"president":room.president,
+                "players":room.getPlayers(), "board":board}, True))
+            return
+
+        room.nextPresident()
+        out.append(Message("president", room.presidentData(), True))
+
+    #This method reveals the party of the investigated player to the
+    #president. Hitler shows up as a Fascist.
+    def investigationResponse(self, room, event, out):
+        player = room.byName.get(event["selectedPlayer"])
+        if player is not None:
+            playerRole = player.role
+            if playerRole == "Hitler":
+                playerRole = "Fascist"
+            log.debug("investigated %s -> %s", player.name, playerRole)
+            room.record.append(("investigate", room.president, player.name))
+            out.append(Message("playerRoleReveal", playerRole, False))
+        room.investigation = False
+
+    #This method kills the player picked by the president. Killing Hitler
+    #ends the game for the Liberals, otherwise the presidency moves on.
+    def executionResponse(self, room, event, out):
+        if room.execution == False:
+            return
+        player = room.byName.get(event["selectedPlayer"])
+        if player is None or player.dead:
+            return
+        room.kill(player)
+        room.execution = False
+        room.record.append(("execute", room.president, player.name))
+        out.append(Message("playerExecuted", player.name, True))
+        if player.role == "Hitler":
+            room.winner = "L"
+            out.append(Message("gameOver", "L", True))
+            return
+        room.nextPresident()
+        out.append(Message("president", room.presidentData(), True))
+
+    def getBoard(self, room, event, out):
+        out.append(Message("getBoardResponse", room.board, False))
+
+    #This method hands the presidency to the player picked by the
+    #president during a special presidency, once.
+    def specialPresidencySelection(self, room, event, out):
+        if not room.specialPick:
+            return
+        room.specialPick = False
+        room.record.append(("special", room.president, event["president"]))
+        room.president = event["president"]
+        out.append(Message("president", room.presidentData(room.getPlayers()), True))
+
+    #This method brings a reconnecting client up to date in one message.
+    #The client sends the last version it saw; if the room still
+    #remembers every change since then it gets only the changed parts of
+    #the public view, otherwise (or with no version) a full snapshot. The
+    #player's private view is always included.
+    def sync(self, room, event, out):
+        if room.phase() == "game" and room.president == "":
+            room.getPresident()
+        room.recordVersion()
+        full, public = room.changesSince(event.get("version"))
+        data = {"version": room.version, "full": full, "public": public}
+        player = room.byId.get(event["userId"])
+        data["private"] = room.privateView(player) if player is not None else None
+        out.append(Message("syncResponse", data, False))
+
+    #This method acts for the players who let a deadline pass. The server
+    #sends {"type": "timeout", "action": .., "president": ..,
+    #"chancellor": ..} with the pending action and the government the
+    #deadline was set for; if the room has moved on since, even to the
+    #same action in a later election, it does nothing. Events without a
+    #government, as older logs hold, are taken for the current one.
+    #Everybody is told who timed out, then the configured choice is
+    #played through the usual handlers, so it is logged and replayed
+    #like any other event.
+    def timeout(self, room, event, out):
+        action = event["action"]
+        if room.pendingAction() != action \
+                or event.get("president", room.president) != room.president \
+                or event.get("chancellor", room.chancellor) != room.chancellor:
+            return
+        if action == "vote":
+            players = [player.name for player in room.players
+                if player.dead == False and player.name not in room.votes]
+        elif action == "updateBoard":
+            players = [room.chancellor]
+        else:
+            players = [room.president]
+        out.append(Message("timeout", {"action":action, "players":players}, True))
+        choice = self.timeoutActions[action]
+        if choice in ("abstain", "no"):
+            vote = "Abstain" if choice == "abstain" else "No"
+            for name in players:
+                self.vote(room, {"vote":vote, "name":name}, out)
+        elif choice == "discard" and action == "updateBoard":
+            self.updateBoard(room, {"card":room.rng.choice(room.currentCards)}, out)
+        elif choice == "discard":
+            if not room.currentCards:
+                room.refillDeck()
+                room.currentCards = [room.deck.popleft() for i in range(3)]
+            self.discardPresident(room,
+                {"discard":room.rng.choice(room.currentCards)}, out)
+        else:
+            self.skipPresident(room, out)
+
+    #This method passes over the president: any cards they drew go back
+    #on top of the deck, an unused power is lost, and the next living
+    #player is asked for a chancellor.
+    def skipPresident(self, room, out):
+        if room.currentCards and room.sentCards == False:
+            room.deck.extendleft(reversed(room.currentCards))
+            room.currentCards = []
+        room.investigation = False
+        room.execution = False
+        room.specialPresidency = False
+        room.specialPick = False
+        room.chancellor = ""
+        room.voted = True
+        room.nextPresident()
+        out.append(Message("president", room.presidentData(), True))
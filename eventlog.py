@@ -0,0 +1,255 @@
+import glob
+import json
+import os
+import pickle
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+from engine import Room
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+ENCODER = json.JSONEncoder(separators=(",", ":"))
+
+#The following class makes games survive a restart. Every event that
+#changes a room is appended to a log, and rooms are periodically written
+#out as snapshots; on startup the rooms are rebuilt from the snapshots
+#plus whatever was logged after them.
+#
+#Rooms are spread over a fixed number of shard files so the log is a few
+#sequential appends rather than one file per room. Appending only puts
+#the line on a queue: a single writer thread drains everything that has
+#queued up, writes it and calls fsync once per touched shard (group
+#commit), so handlers never wait on the disk.
+#
+#Each room counts the events logged for it in Room.seq. Log lines carry
+#that number and snapshots store it, so replay skips every event a
+#snapshot already contains.
+#
+#A checkpoint rotates the log to a new segment, snapshots every room that
+#changed since the last checkpoint and then deletes the older segments.
+#Everything in those segments was applied before the rotation, so the
+#snapshots already include it and replay time stays bounded.
+#
+#A checkpoint only snapshots the rooms this log has seen, so it would
+#throw away the games of another process logging to the same directory.
+#The log therefore holds an exclusive lock on the directory while it is
+#open, and a second log opened on it gets EventLogInUse (where fcntl
+#exists).
+class EventLogInUse(Exception):
+    pass
+
+
+class EventLog:
+    def __init__(self, directory, shards=16, flushInterval=0.005,
+            checkpointBytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.snapshotDirectory = os.path.join(directory, "snapshots")
+        os.makedirs(self.snapshotDirectory, exist_ok=True)
+        self.lockFile = self.lock(directory)
+        self.shards = shards
+        self.flushInterval = flushInterval
+        self.checkpointBytes = checkpointBytes
+
+        self.pending = []
+        self.changed = set()
+        self.condition = threading.Condition()
+        self.segment = self.latestSegment() + 1
+        self.files = {}
+        self.segmentBytes = 0
+        self.writtenThrough = 0
+        self.queued = 0
+        self.waiting = False
+        self.closed = False
+
+        #The fsync call can be swapped for one that runs on a native
+        #thread when the server uses green threads (see serve.py).
+        self.fsync = os.fsync
+
+        self.writer = threading.Thread(target=self.writeLoop, daemon=True)
+        self.writer.start()
+
+    def lock(self, directory):
+        handle = open(os.path.join(directory, "lock"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                raise EventLogInUse("%s is used by another event log; every "
+                    "worker needs its own directory" % directory)
+        return handle
+
+    def latestSegment(self):
+        segments = [self.segmentNumber(path) for path in self.segmentPaths()]
+        return max(segments) if segments else 0
+
+    def segmentPaths(self):
+        return glob.glob(os.path.join(self.directory, "events-*-*.log"))
+
+    def segmentNumber(self, path):
+        return int(os.path.basename(path).split("-")[1])
+
+    def shardPath(self, segment, shard):
+        return os.path.join(self.directory,
+            "events-%08d-%03d.log" % (segment, shard))
+
+    def snapshotPath(self, code):
+        return os.path.join(self.snapshotDirectory, code + ".snap")
+
+    #This method records an event that has just been applied to the room.
+    #It must be called while the room's session is still open so events
+    #reach the log in the order they were applied. The event is encoded
+    #by the writer thread, so it must not be changed afterwards.
+    def append(self, code, room, event):
+        room.seq += 1
+        with self.condition:
+            self.pending.append((code, room.seq, event))
+            self.changed.add(code)
+            self.queued += 1
+            if self.waiting:
+                self.condition.notify()
+
+    #This method writes queued lines to their shards, one fsync per
+    #touched shard for the whole batch.
+    def writeLoop(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.waiting = True
+                    self.condition.wait()
+                    self.waiting = False
+                if self.closed and not self.pending:
+                    return
+                batch = self.pending
+                self.pending = []
+                segment = self.segment
+            byShard = defaultdict(list)
+            for code, seq, event in batch:
+                byShard[zlib.crc32(code.encode("UTF-8")) % self.shards].append(
+                    ENCODER.encode({"room":code, "seq":seq, "event":event}))
+            for shard, lines in byShard.items():
+                handle = self.files.get((segment, shard))
+                if handle is None:
+                    handle = open(self.shardPath(segment, shard), "a", encoding="UTF-8")
+                    self.files[(segment, shard)] = handle
+                data = "\n".join(lines) + "\n"
+                handle.write(data)
+                handle.flush()
+                self.fsync(handle.fileno())
+                self.segmentBytes += len(data)
+            with self.condition:
+                self.writtenThrough += len(batch)
+                self.condition.notify_all()
+            time.sleep(self.flushInterval)
+
+    #This method blocks until everything appended so far is on disk.
+    def flush(self):
+        with self.condition:
+            target = self.queued
+            self.condition.notify()
+            self.condition.wait_for(lambda: self.writtenThrough >= target)
+
+    def needsCheckpoint(self):
+        return self.segmentBytes >= self.checkpointBytes
+
+    #This method snapshots every room that changed since the last
+    #checkpoint and drops the log segments the snapshots make redundant.
+    #snapshotOf is called with each code and should return the pickled
+    #room (or None if it is gone), taken under the room's session.
+    def checkpoint(self, snapshotOf):
+        with self.condition:
+            oldSegment = self.segment
+            self.segment += 1
+            changed = self.changed
+            self.changed = set()
+        self.flush()
+        for code in changed:
+            data = snapshotOf(code)
+            if data is None:
+                self.dropSnapshot(code)
+            else:
+                self.writeSnapshot(code, data)
+        for key in [key for key in list(self.files) if key[0] <= oldSegment]:
+            self.files.pop(key).close()
+        for path in self.segmentPaths():
+            if self.segmentNumber(path) <= oldSegment:
+                os.remove(path)
+        self.segmentBytes = 0
+
+    def writeSnapshot(self, code, data):
+        path = self.snapshotPath(code)
+        with open(path + ".tmp", "wb") as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(path + ".tmp", path)
+
+    def dropSnapshot(self, code):
+        try:
+            os.remove(self.snapshotPath(code))
+        except FileNotFoundError:
+            pass
+
+    #This method rebuilds every room from the snapshots and the log and
+    #returns them as a dict of code -> Room. "create" events make a new
+    #room, "delete" events remove one, anything else is run through the
+    #engine.
+    def recover(self, engine):
+        rooms = {}
+        for path in glob.glob(os.path.join(self.snapshotDirectory, "*.snap")):
+            with open(path, "rb") as handle:
+                rooms[os.path.basename(path)[:-len(".snap")]] = pickle.load(handle)
+
+        byShard = defaultdict(list)
+        for path in self.segmentPaths():
+            shard = os.path.basename(path).split("-")[2]
+            byShard[shard].append((self.segmentNumber(path), path))
+        for shard in byShard:
+            for segment, path in sorted(byShard[shard]):
+                with open(path, encoding="UTF-8") as handle:
+                    for line in handle:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            #A torn last line from a crash mid-write.
+                            break
+                        self.replay(rooms, record, engine)
+        #The next checkpoint snapshots every recovered room, which lets it
+        #drop the segments that were just replayed.
+        with self.condition:
+            self.changed.update(rooms)
+        return rooms
+
+    def replay(self, rooms, record, engine):
+        code = record["room"]
+        event = record["event"]
+        room = rooms.get(code)
+        if event["type"] == "create":
+            if room is None or room.seq < record["seq"]:
+                room = Room(event["size"], event["seed"])
+                room.seq = record["seq"]
+                rooms[code] = room
+            return
+        if room is None or room.seq >= record["seq"]:
+            return
+        room.seq = record["seq"]
+        if event["type"] == "delete":
+            del rooms[code]
+            return
+        engine.apply(room, event)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.writer.join()
+        for handle in self.files.values():
+            handle.close()
+        self.files = {}
+        self.lockFile.close()
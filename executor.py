@@ -0,0 +1,113 @@
+import threading
+from collections import deque
+
+#The following classes run the work for each room one task at a time, in
+#the order it arrived, while different rooms run in parallel. Every room
+#has a mailbox. The first thread to submit to an idle mailbox becomes its
+#runner and works through the queue, including tasks other threads add
+#meanwhile; those threads just wait for their own task to finish. No
+#thread ever holds a lock while a task runs, and there is no lock shared
+#between rooms. A mailbox is only dropped once it is empty and idle; it
+#is marked retired under its lock, and a submitter that finds it retired
+#looks the room up again, so a room never has two runners.
+
+
+class Job:
+    __slots__ = ("task", "result", "error", "done")
+
+    def __init__(self, task):
+        self.task = task
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class Mailbox:
+    __slots__ = ("lock", "queue", "running", "processed", "maxDepth", "retired")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = deque()
+        self.running = False
+        self.processed = 0
+        self.maxDepth = 0
+        self.retired = False
+
+
+class RoomExecutor:
+    def __init__(self):
+        self.mailboxes = {}
+
+    def mailbox(self, code):
+        mailbox = self.mailboxes.get(code)
+        if mailbox is None:
+            mailbox = self.mailboxes.setdefault(code, Mailbox())
+        return mailbox
+
+    #This method runs task() in the room's order and returns its result
+    #(or raises its exception) once it has run.
+    def submit(self, code, task):
+        job = Job(task)
+        while True:
+            mailbox = self.mailbox(code)
+            with mailbox.lock:
+                if mailbox.retired:
+                    continue
+                mailbox.queue.append(job)
+                if len(mailbox.queue) > mailbox.maxDepth:
+                    mailbox.maxDepth = len(mailbox.queue)
+                runner = not mailbox.running
+                mailbox.running = True
+            break
+        if runner:
+            self.drain(mailbox)
+        else:
+            job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def drain(self, mailbox):
+        while True:
+            with mailbox.lock:
+                if not mailbox.queue:
+                    mailbox.running = False
+                    return
+                job = mailbox.queue.popleft()
+            try:
+                job.result = job.task()
+            except Exception as error:
+                job.error = error
+            mailbox.processed += 1
+            job.done.set()
+
+    #This method drops the mailbox of a room that no longer exists, unless
+    #it still has work, and says whether it is gone.
+    def forget(self, code):
+        mailbox = self.mailboxes.get(code)
+        if mailbox is None:
+            return True
+        with mailbox.lock:
+            if mailbox.running or mailbox.queue:
+                return False
+            mailbox.retired = True
+            if self.mailboxes.get(code) is mailbox:
+                del self.mailboxes[code]
+        return True
+
+    def codes(self):
+        return list(self.mailboxes)
+
+    def depth(self, code):
+        mailbox = self.mailboxes.get(code)
+        return len(mailbox.queue) if mailbox is not None else 0
+
+    #This method reports queue depths across all rooms.
+    def stats(self):
+        mailboxes = list(self.mailboxes.values())
+        depths = [len(mailbox.queue) for mailbox in mailboxes]
+        return {"rooms": len(mailboxes),
+            "queued": sum(depths),
+            "deepest": max(depths) if depths else 0,
+            "maxDepth": max((mailbox.maxDepth for mailbox in mailboxes), default=0),
+            "processed": sum(mailbox.processed for mailbox in mailboxes)}
@@ -0,0 +1,126 @@
+import json
+import logging
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+#The following classes collect the server's metrics and render them in
+#the Prometheus text format. Recording is a few additions under no lock:
+#a lost increment under a rare thread switch is an acceptable price for
+#keeping them cheap enough to leave on in production.
+
+#Upper bounds of the latency buckets, in seconds.
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels, lines):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append('%s_bucket{%s,le="%g"} %d' % (name, labels, bound, cumulative))
+        lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, self.count))
+        lines.append("%s_sum{%s} %.6f" % (name, labels, self.total))
+        lines.append("%s_count{%s} %d" % (name, labels, self.count))
+
+
+#This class keeps handler latency histograms and emit counts per event
+#name. Payload bytes are measured on one emit in every byteSample and
+#scaled up, since encoding every payload twice would cost more than the
+#emit itself. It also counts the events turned away by the rate limits
+#and the frames dropped for slow sockets.
+class Metrics:
+    def __init__(self, byteSample=16):
+        self.latency = defaultdict(Histogram)
+        self.emits = defaultdict(int)
+        self.emitBytes = defaultdict(int)
+        self.byteSample = byteSample
+        self.rejected = defaultdict(int)
+        self.dropped = defaultdict(int)
+
+    def observeHandler(self, event, seconds):
+        self.latency[event].observe(seconds)
+
+    def countEmit(self, event, data):
+        count = self.emits[event] + 1
+        self.emits[event] = count
+        if count % self.byteSample == 1 or self.byteSample == 1:
+            self.emitBytes[event] += len(json.dumps(data, separators=(",", ":"))) * self.byteSample
+
+    def countRejected(self, event, reason):
+        self.rejected[(event, reason)] += 1
+
+    def countDropped(self, event, count=1):
+        self.dropped[event] += count
+
+    def render(self, lines):
+        lines.append("# TYPE secrethitler_handler_seconds histogram")
+        for event, histogram in sorted(self.latency.items()):
+            histogram.render("secrethitler_handler_seconds", 'event="%s"' % event, lines)
+        lines.append("# TYPE secrethitler_emits_total counter")
+        for event, count in sorted(self.emits.items()):
+            lines.append('secrethitler_emits_total{event="%s"} %d' % (event, count))
+        lines.append("# TYPE secrethitler_emit_bytes_total counter")
+        for event, size in sorted(self.emitBytes.items()):
+            lines.append('secrethitler_emit_bytes_total{event="%s"} %d' % (event, size))
+        lines.append("# TYPE secrethitler_rejected_events_total counter")
+        for (event, reason), count in sorted(self.rejected.items()):
+            lines.append('secrethitler_rejected_events_total{event="%s",reason="%s"} %d'
+                % (event, reason, count))
+        lines.append("# TYPE secrethitler_dropped_frames_total counter")
+        for event, count in sorted(self.dropped.items()):
+            lines.append('secrethitler_dropped_frames_total{event="%s"} %d' % (event, count))
+
+
+#This filter lets through one in every rate records below WARNING, so
+#debug logging can stay on under load. Warnings and errors always pass.
+class SampleFilter(logging.Filter):
+    def __init__(self, rate):
+        logging.Filter.__init__(self)
+        self.rate = max(1, rate)
+        self.seen = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate == 1:
+            return True
+        with self.lock:
+            self.seen += 1
+            return self.seen % self.rate == 1
+
+
+#This formatter writes each record as one JSON object per line.
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": round(record.created, 3), "level": record.levelname,
+            "logger": record.name, "message": record.getMessage()}
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+#This function sets up the "secrethitler" loggers with a level and a
+#sample rate for records below WARNING.
+def configureLogging(level="WARNING", sample=1):
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(SampleFilter(sample))
+    logger = logging.getLogger("secrethitler")
+    logger.setLevel(level)
+    logger.addHandler(handler)
+    logger.propagate = False
+    return logger
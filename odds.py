@@ -0,0 +1,168 @@
+import random
+from functools import lru_cache
+from math import comb
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from engine import executivePower
+
+#The following functions work out the odds of the card game: what the
+#next draw of three holds, who wins if every policy from here on is
+#played at random, and how often each executive power comes up. A deck
+#state is the fascist and liberal cards left to draw and the board; the
+#discard pile holds the rest, and is shuffled back in once fewer than
+#three cards are left, as Room.refillDeck does.
+#
+#With NumPy installed the batch functions work on arrays of millions of
+#deck states or games at once; without it they fall back to the plain
+#Python versions, which are also the baseline in benchmarks/odds_bench.py.
+
+FASCIST_CARDS = 11
+LIBERAL_CARDS = 6
+WINNING_CARDS = 6
+PLAYOUTS = 20000
+CACHE_SIZE = 4096
+
+
+#This function gives the chances of drawing 0, 1, 2 and 3 fascist
+#policies in three cards from fascist and liberal cards left.
+def drawOdds(fascist, liberal):
+    total = comb(fascist + liberal, 3)
+    return [comb(fascist, k) * comb(liberal, 3 - k) / total for k in range(4)]
+
+
+#These give n choose 0..3 for every element of an integer array.
+def comb3(n):
+    return (numpy.ones_like(n), n, n * (n - 1) // 2, n * (n - 1) * (n - 2) // 6)
+
+
+#This function does drawOdds for arrays of deck states at once and
+#returns an array with a row of four chances per state.
+def drawOddsBatch(fascist, liberal):
+    if numpy is None:
+        return [drawOdds(f, l) for f, l in zip(fascist, liberal)]
+    fascist = numpy.asarray(fascist, dtype=numpy.int64)
+    liberal = numpy.asarray(liberal, dtype=numpy.int64)
+    fascistWays = comb3(fascist)
+    liberalWays = comb3(liberal)
+    total = comb3(fascist + liberal)[3].astype(numpy.float64)
+    return numpy.stack([fascistWays[k] * liberalWays[3 - k] / total
+        for k in range(4)], axis=1)
+
+
+#This function plays games on from a deck state with every choice made
+#at random: the president discards one of three cards and the chancellor
+#enacts one of the other two. It returns how many fascist policies each
+#game ended with, as counts of 0 to WINNING_CARDS.
+def playOutPython(fascist, liberal, boardF, boardL, games, seed=None):
+    rng = random.Random(seed)
+    endings = [0] * (WINNING_CARDS + 1)
+    for game in range(games):
+        deckF, deckL = fascist, liberal
+        discardF = FASCIST_CARDS - boardF - fascist
+        discardL = LIBERAL_CARDS - boardL - liberal
+        playedF, playedL = boardF, boardL
+        while playedF < WINNING_CARDS and playedL < WINNING_CARDS:
+            if deckF + deckL < 3:
+                deckF, deckL = deckF + discardF, deckL + discardL
+                discardF, discardL = 0, 0
+            drawnF = 0
+            for card in range(3):
+                if rng.random() * (deckF + deckL) < deckF:
+                    deckF -= 1
+                    drawnF += 1
+                else:
+                    deckL -= 1
+            if rng.random() * 3 < drawnF:
+                drawnF -= 1
+                discardF += 1
+            else:
+                discardL += 1
+            if rng.random() * 2 < drawnF:
+                playedF += 1
+                discardF += drawnF - 1
+                discardL += 2 - drawnF
+            else:
+                playedL += 1
+                discardF += drawnF
+                discardL += 1 - drawnF
+        endings[playedF] += 1
+    return endings
+
+
+#This function does playOutPython for all games at once, a round of
+#every game per step.
+def playOut(fascist, liberal, boardF, boardL, games, seed=None):
+    if numpy is None:
+        return playOutPython(fascist, liberal, boardF, boardL, games, seed)
+    rng = numpy.random.default_rng(seed)
+    deckF = numpy.full(games, fascist, dtype=numpy.int64)
+    deckL = numpy.full(games, liberal, dtype=numpy.int64)
+    discardF = numpy.full(games, FASCIST_CARDS - boardF - fascist, dtype=numpy.int64)
+    discardL = numpy.full(games, LIBERAL_CARDS - boardL - liberal, dtype=numpy.int64)
+    playedF = numpy.full(games, boardF, dtype=numpy.int64)
+    playedL = numpy.full(games, boardL, dtype=numpy.int64)
+    active = (playedF < WINNING_CARDS) & (playedL < WINNING_CARDS)
+    while active.any():
+        refill = deckF + deckL < 3
+        deckF += numpy.where(refill, discardF, 0)
+        deckL += numpy.where(refill, discardL, 0)
+        discardF[refill] = 0
+        discardL[refill] = 0
+        drawnF = rng.hypergeometric(deckF, deckL, 3)
+        keptF = drawnF - (rng.random(games) * 3 < drawnF)
+        enactedF = rng.random(games) * 2 < keptF
+        playing = active.astype(numpy.int64)
+        deckF -= drawnF * playing
+        deckL -= (3 - drawnF) * playing
+        discardF += (drawnF - enactedF) * playing
+        discardL += (2 - drawnF + enactedF) * playing
+        playedF += enactedF * playing
+        playedL += ~enactedF * playing
+        active &= (playedF < WINNING_CARDS) & (playedL < WINNING_CARDS)
+    return numpy.bincount(playedF, minlength=WINNING_CARDS + 1).tolist()
+
+
+#This function gives the odds for a deck state: the chances of each
+#number of fascists in the next draw, of at least two of them, and of
+#each side enacting six policies first under random play. Results are
+#kept in an LRU cache; the playouts are seeded from the state, so the
+#same state always gives the same answer.
+@lru_cache(maxsize=CACHE_SIZE)
+def deckOdds(fascist, liberal, boardF, boardL):
+    if fascist + liberal < 3:
+        draw = drawOdds(FASCIST_CARDS - boardF, LIBERAL_CARDS - boardL)
+    else:
+        draw = drawOdds(fascist, liberal)
+    endings = playOut(fascist, liberal, boardF, boardL, PLAYOUTS,
+        seed=hash((fascist, liberal, boardF, boardL)) & 0xffffffff)
+    fascistWins = endings[WINNING_CARDS] / PLAYOUTS
+    return {"draw": draw, "atLeastTwoF": draw[2] + draw[3],
+        "win": {"F": fascistWins, "L": 1 - fascistWins}}
+
+
+#This function gives the odds the players may see for a board. Only the
+#board is public, so every card not on it is treated as still in play.
+def publicOdds(board):
+    return deckOdds(FASCIST_CARDS - board["F"], LIBERAL_CARDS - board["L"],
+        board["F"], board["L"])
+
+
+#This function gives, for a room size, how likely each executive power
+#is to be granted at least once in a game played at random from the
+#start, and how many times it is granted on average.
+def powerOdds(size, games=PLAYOUTS, seed=None):
+    endings = playOut(FASCIST_CARDS, LIBERAL_CARDS, 0, 0, games, seed)
+    reached = [sum(endings[count:]) / games for count in range(WINNING_CARDS + 1)]
+    powers = {}
+    for count in range(1, WINNING_CARDS):
+        power = executivePower(size, count)
+        if power is None:
+            continue
+        odds = powers.setdefault(power, {"atLeastOnce": 0.0, "expected": 0.0})
+        odds["atLeastOnce"] = max(odds["atLeastOnce"], reached[count])
+        odds["expected"] += reached[count]
+    return powers
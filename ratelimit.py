@@ -0,0 +1,68 @@
+import time
+
+#The following classes keep socket events within a budget. Every key (a
+#socket id or a room code) gets a token bucket per event type that has a
+#budget of its own, and one shared bucket for all other event types.
+#A bucket holds up to `burst` tokens and refills at `rate` tokens per
+#second; an event is let through if it can take a token. Buckets are
+#refilled lazily when they are used, so idle keys cost nothing but their
+#memory until they are forgotten.
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+
+#This class keeps the buckets for one kind of key. budgets maps event
+#types to (rate, burst) and must have a "default" entry.
+class RateLimiter:
+    def __init__(self, budgets, clock=time.monotonic):
+        self.budgets = budgets
+        self.clock = clock
+        self.buckets = {}
+
+    #This method takes a token for the event from the key's bucket and
+    #says whether there was one.
+    def allow(self, key, event):
+        if event not in self.budgets:
+            event = "default"
+        rate, burst = self.budgets[event]
+        now = self.clock()
+        buckets = self.buckets.get(key)
+        if buckets is None:
+            buckets = self.buckets.setdefault(key, {})
+        bucket = buckets.get(event)
+        if bucket is None:
+            bucket = buckets[event] = TokenBucket(burst, now)
+        else:
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        return True
+
+    #This method drops the buckets of a socket that left or a room that
+    #was evicted.
+    def forget(self, key):
+        self.buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self.buckets)
+
+
+#This function reads budgets such as "vote=2/4,default=20/40" (rate per
+#second / burst) over a copy of the defaults.
+def parseBudgets(text, defaults):
+    budgets = dict(defaults)
+    for item in (text or "").split(","):
+        if not item:
+            continue
+        event, budget = item.split("=", 1)
+        rate, burst = budget.split("/", 1)
+        budgets[event.strip()] = (float(rate), float(burst))
+    return budgets
@@ -0,0 +1,54 @@
+import os
+
+#This is the production entry point. It runs the server on green threads
+#(eventlet by default, or gevent) so a single process can hold tens of
+#thousands of mostly idle websockets instead of one OS thread each.
+#
+#Settings, all from the environment:
+#  ASYNC_MODE         eventlet (default) or gevent
+#  HOST, PORT         where to listen (0.0.0.0:3000)
+#  HANDLER_POOL_SIZE  most connections/handlers running at once (10000)
+#  BACKLOG            listen backlog (2048)
+#  PING_INTERVAL, PING_TIMEOUT, MAX_HTTP_BUFFER_SIZE are read by server.py
+#
+#The standard library has to be patched before anything else is
+#imported, which is why this is its own module rather than part of
+#server.py.
+
+ASYNC_MODE = os.environ.setdefault("ASYNC_MODE", "eventlet")
+
+if ASYNC_MODE == "eventlet":
+    import eventlet
+    import eventlet.wsgi
+    eventlet.monkey_patch()
+elif ASYNC_MODE == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+else:
+    raise SystemExit("ASYNC_MODE must be eventlet or gevent, not %r" % ASYNC_MODE)
+
+import server
+
+
+def main():
+    host = os.environ.get("HOST", "0.0.0.0")
+    port = int(os.environ.get("PORT", 3000))
+    poolSize = int(os.environ.get("HANDLER_POOL_SIZE", 10000))
+    backlog = int(os.environ.get("BACKLOG", 2048))
+
+    if ASYNC_MODE == "eventlet":
+        from eventlet import tpool
+        if server.EVENT_LOG is not None:
+            server.EVENT_LOG.fsync = lambda fd: tpool.execute(os.fsync, fd)
+        listener = eventlet.listen((host, port), backlog=backlog)
+        eventlet.wsgi.server(listener, server.app, max_size=poolSize, log_output=False)
+    else:
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+        from geventwebsocket.handler import WebSocketHandler
+        WSGIServer((host, port), server.app, spawn=Pool(poolSize),
+            backlog=backlog, handler_class=WebSocketHandler, log=None).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,134 +1,254 @@
 import os
+import pickle
 import random
+import string
+import json
 import time
-from flask import Flask, render_template, request, jsonify
+from collections import defaultdict, deque
+from flask import Flask, Response, render_template, request, jsonify
 from flask_socketio import SocketIO, send, emit, join_room, leave_room
+from codec import encode, msgpack, negotiate
+from allocator import CodeAllocator, KeyspaceExhausted
+from archive import QUERIES, ArchiveReader, GameArchive
+from assets import assetUrl, loadStaticAssets, renderPages, serveAsset
+from bots import POLICIES, BotRunner
+from engine import FASCISTS, GameEngine, Room, READ_ONLY
+from eventlog import EventLog
+from executor import RoomExecutor
+from metrics import Metrics, configureLogging
+from odds import publicOdds
+from ratelimit import RateLimiter, parseBudgets
+from store import createStore
+from timers import TimerWheel
 
-#The following class manages Rooms. It stores various variables to do with 
-#voting, player roles and full a room is, and the state of cards. 
-class Room:
-    def __init__(self, size):
-        #This variable counts how many players are ready in the lobby 
-        # (i.e how many players are named.)
-        self.ready = 0
-        
-        #These variables store the size of the room and whether 
-        #it is full.
-        self.size = int(size)
-        self.filled = False
-        
-        #These variables hold the players, the name of the president
-        #and the name of the chancellor
-        self.players = []
-        self.president= ""
-        self.chancellor = ""
-        self.presIndex = 0
-
-        #These variables stores information about voting. 
-        self.voteYes = 0
-        self.voteNo = 0
-        self.votingArray = []
-        self.voted = True
-        self.ineligible = []
-        self.failedVotes = 0
-
-        #These variables store information about the state
-        #of the deck, and whether cards have been shown
-        #to particular players
-        self.currentCards = []
-        self.sentCards = False
-        self.deck = ["F"]*11 + ["L"]*6
-        self.discards = []
-
-        #This variable stores information about the state of the board
-        self.board = {"F":0,"L":0}
-        
-        #These variables track whether things have happened
-        self.investigation = False
-        self.specialPresidency = False
-    
-    #This method allows a player to be added into a list, and modifies
-    #the size and filled parameters accordingly.
-    def addPlayer(self, playerObject):
-        self.players.append(playerObject)
-        if len(self.players) == self.size:
-            self.filled = True
-
-    def removePlayer(self, name):
-        self.players.remove(name)
-    
-    #This method sets the first President at index 0.
-    def getPresident(self):
-        self.president = self.players[self.presIndex].name
-        return self.president
-
-    #This method finds the next player in the player list and
-    #sets them as president.
-    def nextPresident(self):
-        self.presIndex = (self.presIndex + 1) % self.size
-        self.president = self.players[self.presIndex].name
-        return self.president
-    
-    #This method gives the list of candidates for Chancellor, excluding
-    #the current president, and immediately former chancellors
-    #and presidents.
-    def getChancellorCandidates(self):
-        playerList = []
-        self.ineligible.append(self.president)
-        for player in self.players:
-            playerList.append(player.name)
-        finalList = [user for user in playerList if user not in self.ineligible]
-        return finalList
-
-    def getPlayers(self):
-        L = []
-        for player in self.players:
-            if player.dead == False and player.name != self.president:
-                L.append(player.name)
-        print(L)
-        return L
-      
-class Player:
-    def __init__(self, ID):
-        self.ID = ID
-        self.name = None
-        self.role = None
-        self.dead = False
-    def setName(self, name):
-        self.name = name
-        
-        
-DATA = {}       
+DATA = createStore(os.environ.get("ROOM_STORE_URL"))
 #The DATA variable acts as the database for the entire application.
-#The expected format for the database is as follows:
-#{'<room>':Room class}
-
-USERIds = {}
-#The USERIds variable is used to generate unique <userId>'s with efficiency.
+#It maps '<room>' codes to Room objects and also remembers which
+#<userId>'s have been handed out. Setting ROOM_STORE_URL (for example
+#redis://localhost:6379/0) keeps rooms in a shared server so several
+#worker processes can serve the same games.
 
 app = Flask(__name__)
 #Initiate flask application
 
-socketio = SocketIO(app)
-#Initiate SocketIo application
+MESSAGE_QUEUE = os.environ.get("MESSAGE_QUEUE")
+socketio = SocketIO(app, message_queue=MESSAGE_QUEUE,
+    async_mode=os.environ.get("ASYNC_MODE") or None,
+    ping_interval=float(os.environ.get("PING_INTERVAL", 25)),
+    ping_timeout=float(os.environ.get("PING_TIMEOUT", 20)),
+    max_http_buffer_size=int(os.environ.get("MAX_HTTP_BUFFER_SIZE", 1000000)))
+#Initiate SocketIo application. When MESSAGE_QUEUE is set, broadcasts
+#are relayed through it so every worker reaches every socket in a room.
+#ASYNC_MODE picks threading, eventlet or gevent (see serve.py for the
+#high-concurrency entry point) and the PING_* settings control how
+#often idle sockets are checked.
+
+TIMEOUT_ACTIONS = dict(item.split("=", 1)
+    for item in os.environ.get("TIMEOUT_ACTIONS", "").split(",") if item)
+ENGINE = GameEngine(TIMEOUT_ACTIONS)
+#The ENGINE holds the rules of the game. The socket handlers below only
+#turn their arguments into engine events and send out what it returns.
+#TIMEOUT_ACTIONS (for example "vote=no,discardPresident=skip") picks
+#what the engine does for a player who misses a deadline.
+
+METRICS = Metrics()
+configureLogging(os.environ.get("LOG_LEVEL", "WARNING"),
+    int(os.environ.get("LOG_SAMPLE", 1)))
+#METRICS records handler latency and emits per event for /metrics.
+#LOG_LEVEL gates the structured (JSON) logs and LOG_SAMPLE keeps one in
+#every LOG_SAMPLE records below WARNING.
+
+ROOMS = RoomExecutor()
+#Everything that reads or changes a room runs through ROOMS, which runs
+#the work for each room one task at a time in arrival order while
+#different rooms run in parallel.
+
+EVENT_LOG_DIR = os.environ.get("EVENT_LOG_DIR")
+EVENT_LOG = EventLog(EVENT_LOG_DIR) if EVENT_LOG_DIR else None
+CHECKPOINT_INTERVAL = float(os.environ.get("CHECKPOINT_INTERVAL", 60))
+#When EVENT_LOG_DIR is set every event that changes a room is written to
+#an event log there, and rooms are snapshotted every CHECKPOINT_INTERVAL
+#seconds (or sooner when the log grows large), so games survive a
+#restart. Only one process may use a directory, so every worker needs an
+#EVENT_LOG_DIR of its own.
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR")
+ARCHIVE = GameArchive(ARCHIVE_DIR) if ARCHIVE_DIR else None
+ARCHIVE_READER = ArchiveReader(ARCHIVE_DIR) if ARCHIVE_DIR else None
+ARCHIVE_FLUSH_INTERVAL = float(os.environ.get("ARCHIVE_FLUSH_INTERVAL", 60))
+#When ARCHIVE_DIR is set every game that ends is added to a columnar
+#archive there: roles, every vote, the policies and the executive
+#actions. Finished games are written out in segments, at least every
+#ARCHIVE_FLUSH_INTERVAL seconds, and /api/stats aggregates over them.
+
+SEEDS = random.SystemRandom()
+#Each room is seeded from SEEDS; the seed is logged so a room can be
+#replayed exactly.
+
+ROOM_TTL = {
+    "lobby": float(os.environ.get("ROOM_TTL_LOBBY", 30 * 60)),
+    "game": float(os.environ.get("ROOM_TTL_GAME", 2 * 60 * 60)),
+    "finished": float(os.environ.get("ROOM_TTL_FINISHED", 5 * 60)),
+    "empty": float(os.environ.get("ROOM_TTL_EMPTY", 2 * 60)),
+}
+REAP_INTERVAL = float(os.environ.get("REAP_INTERVAL", 30))
+#A room is evicted once it has seen no events for longer than the TTL
+#(in seconds) of its phase. Rooms that every socket has left use the
+#"empty" TTL when it is shorter. The reaper checks every REAP_INTERVAL
+#seconds.
+
+ROOM_CODES = CodeAllocator(string.ascii_uppercase, 4)
+USER_IDS = CodeAllocator(string.digits, 10)
+#These allocators hand out room codes and <userId>'s in constant time.
+#Codes are still checked against DATA because other workers sharing the
+#store allocate from their own keys.
+
+SOCKETS = {}
+#The SOCKETS variable maps each connected socket id to the room it
+#joined, so a disconnect can be counted against that room.
+
+ENCODING = {}
+BINARY_ROOMS = defaultdict(int)
+#Sockets that negotiated MessagePack are listed in ENCODING and join the
+#"<room>/msgpack" channel instead of "<room>", so every broadcast is
+#encoded once per format. BINARY_ROOMS counts them per room so rooms
+#without binary clients skip the extra encode; with a MESSAGE_QUEUE the
+#other workers' sockets are unknown, so both formats are always sent
+#(unless msgpack is not installed, in which case nobody can have
+#negotiated it).
+
+SPECTATOR_TICK = float(os.environ.get("SPECTATOR_TICK", 0.25))
+SPECTATORS = defaultdict(set)
+SPECTATING = {}
+SPECTATOR_EVENTS = {}
+SPECTATOR_VERSIONS = {}
+PUBLIC_EVENTS = {"begin", "addNameRoom", "president", "voting", "voteResult",
+    "investigationSelection", "specialPresidency", "executePlayer",
+    "playerExecuted", "gameOver", "timeout"}
+SPECTATOR_HIDDEN = {"chancellorCandidates", "players"}
+#Spectators join "<room>/spectators" rather than the room itself, so they
+#never receive a player's private messages. SPECTATORS holds their socket
+#ids per room and SPECTATING maps their socket ids to rooms. Instead of getting
+#every message as it happens, they get one "spectatorFrame" per room every
+#SPECTATOR_TICK seconds, holding the public view of the room and the
+#PUBLIC_EVENTS broadcast since the last frame (collected in
+#SPECTATOR_EVENTS). Frames only carry what changed since the previous
+#frame (SPECTATOR_VERSIONS); a spectator that joins gets the whole view.
+#Events leave out the values the view already holds and the
+#SPECTATOR_HIDDEN fields (the chancellor candidates are the president's
+#to see, and the players are in the view), rooms only get a frame after
+#an event that may change them, and a frame with nothing in it is not
+#sent. A frame is encoded once and sent to every spectator.
+#showTopCard is left out of the events since only the president may see
+#the card.
+
+SID_BUDGETS = parseBudgets(os.environ.get("RATE_LIMITS_SID"), {
+    "default": (10, 20),
+    "vote": (2, 4),
+    "getCardsPresident": (1, 2),
+    "onLoadGame": (2, 5),
+    "sync": (2, 5),
+})
+ROOM_BUDGETS = parseBudgets(os.environ.get("RATE_LIMITS_ROOM"), {
+    "default": (100, 200),
+    "getCardsPresident": (2, 4),
+    "onLoadGame": (20, 40),
+    "spectate": (200, 1000),
+    "getOdds": (50, 100),
+})
+SID_LIMITS = RateLimiter(SID_BUDGETS)
+ROOM_LIMITS = RateLimiter(ROOM_BUDGETS)
+OUTBOUND_QUEUE_LIMIT = int(os.environ.get("OUTBOUND_QUEUE_LIMIT", 64))
+RESENDABLE = READ_ONLY | {"onLoadGame", "sync"}
+STALE_SPECTATORS = set()
+#Every socket event has to fit the budget of its socket and of its room
+#(rate per second / burst, per event type, overridable with
+#RATE_LIMITS_SID and RATE_LIMITS_ROOM such as "vote=2/4"); events over
+#budget are dropped, counted and answered with "rejected". Once a socket
+#has more than OUTBOUND_QUEUE_LIMIT packets waiting to be sent, it is a
+#slow consumer: its RESENDABLE events, which only send it things it can
+#ask for again, are dropped, and as a spectator it is skipped by frames
+#(it is in STALE_SPECTATORS) until it catches up and is sent one whole
+#frame. Spectators and odds have room budgets of their own, so a crowd
+#watching a game never uses up the budget of the players' moves. Events
+#for rooms that do not exist are dropped before any room bucket is made.
+
+TURN_TIMEOUTS = {
+    "chancellorSelection": float(os.environ.get("TIMEOUT_CHANCELLOR_SELECTION", 90)),
+    "vote": float(os.environ.get("TIMEOUT_VOTE", 60)),
+    "discardPresident": float(os.environ.get("TIMEOUT_DISCARD_PRESIDENT", 60)),
+    "updateBoard": float(os.environ.get("TIMEOUT_UPDATE_BOARD", 60)),
+    "power": float(os.environ.get("TIMEOUT_POWER", 90)),
+}
+TIMERS = TimerWheel(float(os.environ.get("TIMER_TICK", 0.1)))
+DEADLINES = {}
+#Whenever an event changes what a game is waiting on (the pending
+#action, the president or the chancellor), the room gets a deadline of
+#TURN_TIMEOUTS seconds (0 turns one off) for it. If the room is still
+#waiting on the same thing by then, a "timeout" event is run for it.
+#Other events, such as a player reloading the page, leave the deadline
+#alone. All deadlines live on the one TIMERS wheel, which a single
+#background task turns every TIMER_TICK seconds; DEADLINES maps rooms to
+#what they are waiting on and its timer.
 
+BOT_THINK = tuple(float(bound) for bound in os.environ.get("BOT_THINK", "1-3").split("-", 1))
+BOT_POLICY = os.environ.get("BOT_POLICY", "heuristic")
+BOT_FILL_AFTER = float(os.environ.get("BOT_FILL_AFTER", 0))
+BOTS = BotRunner(TIMERS, ROOMS.submit, DATA.get,
+    lambda room, event: deliver(room, None, applyEvent(room, event)),
+    think=(BOT_THINK[0], BOT_THINK[-1]))
+#Bots are players the server seats itself (see bots.py and /api/bots).
+#They act BOT_THINK seconds (a range such as "1-3") after the room starts
+#waiting on them, by BOT_POLICY unless another policy is asked for. With
+#BOT_FILL_AFTER set, a lobby that has had players in it but no event for
+#that many seconds has its free seats filled with bots.
+
+BACKGROUND = {"started": False}
+
+
+
+ASSETS = loadStaticAssets(app.static_folder)
+app.jinja_env.globals["assetUrl"] = lambda path: assetUrl(ASSETS, path)
+PAGES = renderPages(app, {"home":"home.html", "lobby":"lobby.html",
+    "game":"game.html"})
+#The pages do not change between requests, so they are rendered once
+#here; they and the static files are kept compressed in memory and
+#served with ETags (see assets.py).
 
 
 #The follwing three functions are for handling basic routing to display,
 #the three main pages of the application home, lobby and game.
 @app.route("/")
 def home():
-    return render_template("home.html")
+    return servePage("home")
 
 
 @app.route("/lobby")
 def lobby():
-    return render_template("lobby.html")
+    return servePage("lobby")
 
 
 @app.route("/game")
 def game():
-     return render_template("game.html")
+    return servePage("game")
+
+
+def servePage(name):
+    page = PAGES.get(name)
+    if page is None:
+        return render_template(name + ".html")
+    return serveAsset(page)
+
+
+#This function serves a static file under its fingerprinted URL. Only
+#the current fingerprint is served, so an immutable URL never changes
+#content.
+@app.route("/assets/<fingerprint>/<path:filename>")
+def fingerprintedAsset(fingerprint, filename):
+    asset = ASSETS.get(filename)
+    if asset is None or asset.fingerprint != fingerprint:
+        return jsonify({"errorCode":"1"}), 404
+    return serveAsset(asset)
 
 
 
@@ -138,26 +258,170 @@ def game():
 #ready: 0 and size: <size>
 @app.route("/api/createroom", methods = ["POST"])
 def createRoom():
-    roomSize = request.data.decode("UTF-8")
-    roomCode = ""
-    for i in range(4):
-        roomCode += chr(random.randint(65,90))
-    if DATA.get(roomCode,0) == 0:
-        x = Room(roomSize)
-        DATA[roomCode] = x
-        return jsonify({"roomCode":roomCode})
-    createRoom()
-
-
-#This function handles the process of joining a room, it takes as input 
+    try:
+        roomSize = int(request.data.decode("UTF-8"))
+    except ValueError:
+        roomSize = None
+    if roomSize not in FASCISTS:
+        return jsonify({"errorCode":"2"}), 400
+    try:
+        roomCode = newRoom(roomSize)
+    except KeyspaceExhausted:
+        return jsonify({"errorCode":"1"}), 503
+    return jsonify({"roomCode":roomCode})
+
+
+#This function creates a seeded room of the given size, lists it in the
+#lobby directory and returns its code.
+def newRoom(roomSize):
+    roomCode = ROOM_CODES.allocate()
+    while roomCode in DATA:
+        roomCode = ROOM_CODES.allocate()
+    seed = SEEDS.getrandbits(64)
+    x = Room(roomSize, seed)
+    x.lastActive = time.time()
+    listRoom(roomCode, x)
+    DATA.put(roomCode, x)
+    if EVENT_LOG is not None:
+        EVENT_LOG.append(roomCode, x, {"type":"create", "size":x.size, "seed":seed})
+    if BOT_FILL_AFTER:
+        TIMERS.schedule(BOT_FILL_AFTER, fillRoom, roomCode)
+    return roomCode
+
+
+#This function keeps the room's entry in the lobby directory up to date:
+#rooms still in the lobby are listed with their free seats, and rooms
+#that are full or have started are taken out. It only touches the
+#directory when the number of free seats changed.
+def listRoom(code, currentRoom):
+    free = 0
+    if currentRoom.phase() == "lobby":
+        free = max(0, currentRoom.size - len(currentRoom.players))
+    if free != currentRoom.listed:
+        DATA.listRoom(code, currentRoom.size, free)
+        currentRoom.listed = free
+
+
+#This function lists open rooms, fewest free seats first, a page at a
+#time. ?size= picks one room size, ?limit= the page size (at most 100)
+#and ?after= the "next" cursor of the previous page.
+@app.route("/api/rooms", methods = ["GET"])
+def openRooms():
+    try:
+        size = request.args.get("size", type=int)
+        limit = min(max(request.args.get("limit", 50, type=int), 1), 100)
+        after = request.args.get("after")
+        if after is not None:
+            free, roomSize, code = after.split(":", 2)
+            after = (int(free), int(roomSize), code)
+    except ValueError:
+        return jsonify({"errorCode":"2"}), 400
+    rooms = DATA.openRooms(size, after, limit)
+    cursor = None
+    if len(rooms) == limit:
+        code, roomSize, free = rooms[-1]
+        cursor = "%d:%d:%s" % (free, roomSize, code)
+    return jsonify({"rooms":[{"roomCode":code, "size":roomSize, "freeSeats":free}
+        for code, roomSize, free in rooms], "next":cursor})
+
+
+#This function seats a group of players in the open room with the fewest
+#free seats that fits them all, creating a room when none fits and a
+#size was asked for. It takes {"userIds": [..], "size": optional} and
+#returns the room code. The players are added in the room's executor, so
+#two groups can never be given the same seats; the clients then go to
+#the lobby as usual. The errorCodes are: 0 -> success, 1 -> no room
+#fits, 2 -> bad request.
+@app.route("/api/quickjoin", methods = ["POST"])
+def quickJoin():
+    body = request.get_json(silent=True) or {}
+    userIds = body.get("userIds")
+    size = body.get("size")
+    if not isinstance(userIds, list) or not userIds \
+            or len(userIds) > max(FASCISTS) \
+            or not all(isinstance(userId, str) for userId in userIds) \
+            or size is not None and size not in FASCISTS:
+        return jsonify({"errorCode":"2"}), 400
+    for attempt in range(5):
+        code = DATA.bestFit(len(userIds), size)
+        if code is None:
+            if size is None:
+                return jsonify({"errorCode":"1"})
+            try:
+                code = newRoom(size)
+            except KeyspaceExhausted:
+                return jsonify({"errorCode":"1"}), 503
+        if ROOMS.submit(code, lambda: seatPlayers(code, userIds)):
+            return jsonify({"errorCode":"0", "roomCode":code})
+    return jsonify({"errorCode":"1"})
+
+
+#This function adds the players to the room if it still has room for
+#all of them. It runs in the room's executor.
+def seatPlayers(code, userIds):
+    currentRoom = DATA.get(code)
+    if currentRoom is None:
+        DATA.delistRoom(code)
+        return False
+    if currentRoom.phase() != "lobby" \
+            or currentRoom.size - len(currentRoom.players) < len(userIds):
+        currentRoom.listed = None
+        listRoom(code, currentRoom)
+        return False
+    for userId in userIds:
+        deliver(code, None, applyEvent(code, {"type":"newUser", "userId":userId}))
+    return True
+
+
+#This function seats bots in a room's free seats. It takes {"roomCode":
+#.., "count": optional, "policy": optional} and fills every free seat
+#when no count is given. The errorCodes are: 0 -> success, 1 -> room
+#does not exist or is not in the lobby, 2 -> bad request.
+@app.route("/api/bots", methods = ["POST"])
+def addBots():
+    body = request.get_json(silent=True) or {}
+    code = body.get("roomCode")
+    count = body.get("count", max(FASCISTS))
+    policy = POLICIES.get(body.get("policy", BOT_POLICY))
+    if not isinstance(code, str) or not isinstance(count, int) or count < 1 \
+            or policy is None:
+        return jsonify({"errorCode":"2"}), 400
+    if code not in DATA:
+        return jsonify({"errorCode":"1"})
+    startBackgroundTasks()
+    names = ROOMS.submit(code, lambda: BOTS.seat(code, count, policy))
+    if not names:
+        return jsonify({"errorCode":"1"})
+    return jsonify({"errorCode":"0", "names":names})
+
+
+#This function fills the free seats of a lobby with bots once it has
+#been idle for BOT_FILL_AFTER seconds, checking again later if it was
+#not. Lobbies nobody has entered are left alone.
+def fillRoom(code):
+    def fill():
+        currentRoom = DATA.get(code)
+        if currentRoom is None or currentRoom.phase() != "lobby":
+            return
+        idle = time.time() - currentRoom.lastActive
+        if not currentRoom.players or idle < BOT_FILL_AFTER:
+            TIMERS.schedule(BOT_FILL_AFTER - idle if currentRoom.players
+                else BOT_FILL_AFTER, fillRoom, code)
+            return
+        BOTS.seat(code, currentRoom.size, POLICIES[BOT_POLICY])
+    ROOMS.submit(code, fill)
+
+
+#This function handles the process of joining a room, it takes as input
 #from a POST call, the user declared room code and returns the following
 #error codes: 0 -> success, 1 -> room does not exist, 2 -> room is full
 @app.route("/api/joinroom", methods = ["POST"])
 def joinRoom(): 
     code = request.data.decode("UTF-8")
-    if DATA.get(code,0) == 0: 
+    currentRoom = DATA.get(code)
+    if currentRoom is None: 
         return jsonify({"errorCode":"1"})
-    if DATA[code].filled == True:
+    if currentRoom.filled == True:
         return jsonify({"errorCode":"2"})
     return jsonify({"errorCode":"0"})
 
@@ -167,12 +431,595 @@ def joinRoom():
 #time a user visits the homepage.
 @app.route("/api/generateuserid", methods = ["GET"])
 def generate():
-    userID = ""
-    for i in range(10):
-        userID += str(random.randint(0,9))
-    if USERIds.get(userID,0) == 0:
-        return jsonify({"userID":userID})
-    generate()
+    try:
+        userID = USER_IDS.allocate()
+        while DATA.hasUserId(userID):
+            userID = USER_IDS.allocate()
+    except KeyspaceExhausted:
+        return jsonify({"errorCode":"1"}), 503
+    DATA.addUserId(userID)
+    return jsonify({"userID":userID})
+
+
+#This function reports how full the room code and user id spaces are.
+@app.route("/api/allocator", methods = ["GET"])
+def allocatorStats():
+    return jsonify({"roomCodes":ROOM_CODES.stats(), "userIds":USER_IDS.stats()})
+
+
+#This function gives the number of seconds a room may sit idle before
+#it is evicted.
+def roomTtl(currentRoom):
+    ttl = ROOM_TTL[currentRoom.phase()]
+    if currentRoom.connections <= 0:
+        ttl = min(ttl, ROOM_TTL["empty"])
+    return ttl
+
+
+#This function removes a room from DATA so its code can be used again.
+#Its sockets are taken out of the room's channels and forgotten, so a
+#room that later gets the same code never reaches them. It has to run
+#inside the room's executor.
+def releaseRoom(code):
+    for channel in (code, binaryChannel(code), spectatorChannel(code)):
+        socketio.close_room(channel)
+    for sid, room in list(SOCKETS.items()):
+        if room == code:
+            SOCKETS.pop(sid, None)
+    for sid in SPECTATORS.pop(code, ()):
+        SPECTATING.pop(sid, None)
+        STALE_SPECTATORS.discard(sid)
+    BINARY_ROOMS.pop(code, None)
+    SPECTATOR_EVENTS.pop(code, None)
+    SPECTATOR_VERSIONS.pop(code, None)
+    ROOM_LIMITS.forget(code)
+    BOTS.forget(code)
+    deadline = DEADLINES.pop(code, None)
+    if deadline is not None:
+        TIMERS.cancel(deadline[1])
+    DATA.delistRoom(code)
+    if EVENT_LOG is not None:
+        with DATA.session(code) as currentRoom:
+            if currentRoom is not None:
+                EVENT_LOG.append(code, currentRoom, {"type":"delete"})
+    DATA.delete(code)
+    ROOM_CODES.release(code)
+
+
+def evictIfIdle(code, now):
+    currentRoom = DATA.get(code)
+    if currentRoom is not None and now - currentRoom.lastActive > roomTtl(currentRoom):
+        releaseRoom(code)
+        return True
+    return False
+
+
+#This function evicts every room that has been idle for longer than its
+#TTL and returns their codes. Mailboxes left behind by rooms that were
+#still busy when they were evicted are dropped here too.
+def evictIdleRooms(now):
+    evicted = []
+    for code in DATA.codes():
+        if ROOMS.submit(code, lambda: evictIfIdle(code, now)):
+            ROOMS.forget(code)
+            evicted.append(code)
+    for code in ROOMS.codes():
+        if code not in DATA:
+            ROOMS.forget(code)
+    return evicted
+
+
+def reapRooms():
+    while True:
+        socketio.sleep(REAP_INTERVAL)
+        evictIdleRooms(time.time())
+
+
+#This function starts the background tasks once, when the first socket
+#connects, so it works the same under every entry point.
+def startBackgroundTasks():
+    if BACKGROUND["started"]:
+        return
+    BACKGROUND["started"] = True
+    socketio.start_background_task(reapRooms)
+    socketio.start_background_task(broadcastSpectatorFrames)
+    socketio.start_background_task(runTimers)
+    if EVENT_LOG is not None:
+        socketio.start_background_task(checkpointRooms)
+    if ARCHIVE is not None:
+        socketio.start_background_task(flushArchive)
+
+
+def runTimers():
+    while True:
+        socketio.sleep(TIMERS.tick)
+        TIMERS.advance()
+
+
+#This function sets the room's deadline for the action it is waiting on,
+#replacing the previous one if the room is now waiting on something
+#else. It runs in the room's executor after every event that may change
+#the room.
+def armDeadline(room, currentRoom):
+    action = currentRoom.pendingAction()
+    waitingOn = (action, currentRoom.president, currentRoom.chancellor)
+    deadline = DEADLINES.get(room)
+    if deadline is not None:
+        if deadline[0] == waitingOn:
+            return
+        del DEADLINES[room]
+        TIMERS.cancel(deadline[1])
+    if action is not None and TURN_TIMEOUTS.get(action):
+        timer = TIMERS.schedule(TURN_TIMEOUTS[action],
+            lambda: expireDeadline(room, waitingOn, timer))
+        DEADLINES[room] = (waitingOn, timer)
+
+
+#This function runs the "timeout" event for a deadline that passed,
+#unless the room was given a new deadline in the meantime. The event
+#names the government the deadline was set for, since with a shared
+#store another worker may have moved the room on without this one
+#seeing it.
+def expireDeadline(room, waitingOn, timer):
+    action, president, chancellor = waitingOn
+    def expire():
+        deadline = DEADLINES.get(room)
+        if deadline is None or deadline[1] is not timer:
+            return
+        del DEADLINES[room]
+        deliver(room, None, applyEvent(room, {"type":"timeout", "action":action,
+            "president":president, "chancellor":chancellor}))
+    ROOMS.submit(room, expire)
+
+
+#This function builds a spectator frame for the room as a JSON string,
+#or None if the room is gone or there is nothing to send. A tick frame
+#holds the public view changes since the previous tick frame; otherwise
+#the frame holds the whole view. "full", "state" and "events" are left
+#out when they are false or empty. It runs in the room's executor.
+def spectatorFrame(room, events, tick=False):
+    with DATA.session(room) as currentRoom:
+        if currentRoom is None:
+            return None
+        currentRoom.recordVersion()
+        if tick:
+            full, state = currentRoom.changesSince(SPECTATOR_VERSIONS.get(room))
+            SPECTATOR_VERSIONS[room] = currentRoom.version
+        else:
+            full, state = True, currentRoom.lastPublic
+        return spectatorFrameJSON(room, currentRoom.version, full, state,
+            spectatorEvents(events, currentRoom.lastPublic))
+
+
+def spectatorFrameJSON(room, version, full, state, events):
+    if not full and not state and not events:
+        return None
+    frame = {"room":room, "version":version}
+    if full:
+        frame["full"] = True
+    if state:
+        frame["state"] = state
+    if events:
+        frame["events"] = events
+    return json.dumps(frame, separators=(",", ":"))
+
+
+#This function gives the events of a frame without the fields the
+#frame's public view already holds with the same value, such as the
+#president and the board, or that spectators do not get at all
+#(SPECTATOR_HIDDEN). An event with nothing left is sent by name alone.
+def spectatorEvents(events, public):
+    trimmed = []
+    for event, data in events:
+        if isinstance(data, dict):
+            data = {key: value for key, value in data.items()
+                if key not in SPECTATOR_HIDDEN
+                and (key not in public or public[key] != value)}
+            if not data:
+                trimmed.append([event])
+                continue
+        trimmed.append([event, data])
+    return trimmed
+
+
+#This function sends each spectated room that changed one coalesced
+#frame per tick, skipping slow spectators, and then catches up the slow
+#spectators that have drained.
+def broadcastSpectatorFrames():
+    while True:
+        socketio.sleep(SPECTATOR_TICK)
+        for room in list(SPECTATOR_EVENTS):
+            events = SPECTATOR_EVENTS.pop(room)
+            if not SPECTATORS.get(room):
+                continue
+            frame = ROOMS.submit(room, lambda: spectatorFrame(room, events, True))
+            if frame is not None:
+                skip = slowSpectators(room)
+                socketio.emit("spectatorFrame", frame, room=spectatorChannel(room),
+                    skip_sid=skip or None)
+        if STALE_SPECTATORS:
+            resyncSpectators()
+
+
+#This function marks the room's spectators that are too far behind as
+#stale and returns every stale one.
+def slowSpectators(room):
+    skip = []
+    for sid in list(SPECTATORS.get(room, ())):
+        if sid in STALE_SPECTATORS or outboundDepth(sid) > OUTBOUND_QUEUE_LIMIT:
+            STALE_SPECTATORS.add(sid)
+            skip.append(sid)
+    if skip:
+        METRICS.countDropped("spectatorFrame", len(skip))
+    return skip
+
+
+#This function sends a whole frame, in place of the frames they missed,
+#to the stale spectators whose queues have drained to half the limit.
+def resyncSpectators():
+    frames = {}
+    for sid in list(STALE_SPECTATORS):
+        room = SPECTATING.get(sid)
+        if room is None:
+            STALE_SPECTATORS.discard(sid)
+            continue
+        if outboundDepth(sid) > OUTBOUND_QUEUE_LIMIT // 2:
+            continue
+        if room not in frames:
+            frames[room] = ROOMS.submit(room, lambda: spectatorFrame(room, []))
+        if frames[room] is not None:
+            socketio.emit("spectatorFrame", frames[room], room=sid)
+        STALE_SPECTATORS.discard(sid)
+
+
+def spectatorChannel(room):
+    return room + "/spectators"
+
+
+#This function lets anyone watch a game. The spectator gets a full frame
+#straight away and then the coalesced frames; it never joins the room
+#itself, so no roles or cards reach it.
+@socketio.on("spectate")
+def handleSpectate(room):
+    frame = None
+    if room in DATA:
+        if not admit(room, request.sid, "spectate"):
+            return
+        frame = ROOMS.submit(room, lambda: spectatorFrame(room, []))
+    if frame is None:
+        emit("spectateResponse", {"errorCode":"1"})
+        return
+    sid = request.sid
+    if SPECTATING.get(sid) != room:
+        stopSpectating(sid)
+        join_room(spectatorChannel(room))
+        SPECTATING[sid] = room
+        SPECTATORS[room].add(sid)
+    emit("spectateResponse", {"errorCode":"0"})
+    emit("spectatorFrame", frame)
+
+
+def stopSpectating(sid):
+    room = SPECTATING.pop(sid, None)
+    if room is None:
+        return
+    leave_room(spectatorChannel(room), sid=sid)
+    STALE_SPECTATORS.discard(sid)
+    SPECTATORS[room].discard(sid)
+    if not SPECTATORS[room]:
+        del SPECTATORS[room]
+        SPECTATOR_VERSIONS.pop(room, None)
+
+
+#This function pickles a room under its session for the event log's
+#snapshots.
+def snapshotOf(code):
+    def snapshot():
+        with DATA.session(code) as currentRoom:
+            if currentRoom is None:
+                return None
+            return pickle.dumps(currentRoom, pickle.HIGHEST_PROTOCOL)
+    return ROOMS.submit(code, snapshot)
+
+
+def checkpointRooms():
+    lastCheckpoint = time.time()
+    while True:
+        socketio.sleep(1)
+        if EVENT_LOG.needsCheckpoint() or time.time() - lastCheckpoint >= CHECKPOINT_INTERVAL:
+            EVENT_LOG.checkpoint(snapshotOf)
+            lastCheckpoint = time.time()
+
+
+def flushArchive():
+    while True:
+        socketio.sleep(ARCHIVE_FLUSH_INTERVAL)
+        ARCHIVE.flush()
+
+
+#This function runs an aggregate over the archived games:
+#?query=winRate (win rate by room size and role), voteAgreement (how
+#often each role votes yes, abstains, or votes the way the election
+#went) or games (games, policies and elections by room size and
+#winner).
+@app.route("/api/stats", methods = ["GET"])
+def stats():
+    query = request.args.get("query", "winRate")
+    if ARCHIVE_READER is None or query not in QUERIES:
+        return jsonify({"errorCode":"1"}), 404
+    return jsonify({"query":query, "stats":ARCHIVE_READER.stats(query)})
+
+
+#This function rebuilds the rooms from the event log when the server
+#starts. Sockets have to reconnect, so connection counts start at zero.
+def recoverRooms():
+    now = time.time()
+    for code, currentRoom in EVENT_LOG.recover(ENGINE).items():
+        currentRoom.lastActive = now
+        currentRoom.connections = 0
+        currentRoom.listed = None
+        listRoom(code, currentRoom)
+        DATA.put(code, currentRoom)
+        for player in currentRoom.players:
+            DATA.addUserId(player.ID)
+        armDeadline(code, currentRoom)
+
+
+#This function returns the estimated memory held by the rooms, in total
+#and by phase, or for a single room when ?room=<code> is given.
+@app.route("/api/memory", methods = ["GET"])
+def memory():
+    code = request.args.get("room")
+    if code is not None:
+        estimate = memoryOf(code) if code in DATA else None
+        if estimate is None:
+            return jsonify({"errorCode":"1"})
+        return jsonify({"room":code, "phase":estimate[0], "bytes":estimate[1]})
+    byPhase = {}
+    total = 0
+    count = 0
+    for code in DATA.codes():
+        estimate = memoryOf(code)
+        if estimate is None:
+            continue
+        phase = byPhase.setdefault(estimate[0], {"rooms":0, "bytes":0})
+        phase["rooms"] += 1
+        phase["bytes"] += estimate[1]
+        total += estimate[1]
+        count += 1
+    return jsonify({"rooms":count, "bytes":total,
+        "averageBytes":total // count if count else 0, "phases":byPhase})
+
+
+#This function gives the phase of a room and its estimated size, or None
+#if it is gone. It walks the room's dicts, so like snapshotOf it runs in
+#the room's executor.
+def memoryOf(code):
+    def estimate():
+        with DATA.session(code) as currentRoom:
+            if currentRoom is None:
+                return None
+            return currentRoom.phase(), currentRoom.memoryEstimate()
+    return ROOMS.submit(code, estimate)
+
+
+#This function keeps track of which room a socket is in so that rooms
+#everyone has left can be evicted sooner.
+def joinGameRoom(room):
+    binary = request.sid in ENCODING
+    join_room(binaryChannel(room) if binary else room)
+    previous = SOCKETS.get(request.sid)
+    if previous == room:
+        return
+    if previous is not None:
+        countConnection(previous, -1)
+        if binary:
+            BINARY_ROOMS[previous] -= 1
+    SOCKETS[request.sid] = room
+    countConnection(room, 1)
+    if binary:
+        BINARY_ROOMS[room] += 1
+
+
+def binaryChannel(room):
+    return room + "/msgpack"
+
+
+def countConnection(room, change):
+    if room not in DATA:
+        return
+    def count():
+        with DATA.session(room) as currentRoom:
+            if currentRoom is not None:
+                currentRoom.connections += change
+    ROOMS.submit(room, count)
+
+
+@socketio.on("connect")
+def handleConnect():
+    startBackgroundTasks()
+
+
+@socketio.on("disconnect")
+def handleDisconnect():
+    stopSpectating(request.sid)
+    SID_LIMITS.forget(request.sid)
+    binary = ENCODING.pop(request.sid, None) is not None
+    room = SOCKETS.pop(request.sid, None)
+    if room is not None:
+        countConnection(room, -1)
+        if binary:
+            BINARY_ROOMS[room] -= 1
+            if BINARY_ROOMS[room] <= 0:
+                del BINARY_ROOMS[room]
+
+
+#This function lets a client ask for the compact binary format. It sends
+#the list of encodings it understands, in order of preference, and gets
+#back "encodingSelected" with the one the server will use from now on.
+#Clients that never send it keep getting JSON.
+@socketio.on("setEncoding")
+def handleSetEncoding(offered):
+    sid = request.sid
+    encoding = negotiate(offered)
+    binary = sid in ENCODING
+    room = SOCKETS.get(sid)
+    if encoding == "msgpack" and not binary:
+        ENCODING[sid] = encoding
+        if room is not None:
+            leave_room(room)
+            join_room(binaryChannel(room))
+            BINARY_ROOMS[room] += 1
+    elif encoding == "json" and binary:
+        del ENCODING[sid]
+        if room is not None:
+            leave_room(binaryChannel(room))
+            join_room(room)
+            BINARY_ROOMS[room] -= 1
+    emit("encodingSelected", encoding)
+
+
+#This function runs an event through the game engine inside a session
+#on the room and returns the messages it produces.
+def applyEvent(room, event):
+    with DATA.session(room) as currentRoom:
+        if currentRoom is None:
+            return []
+        currentRoom.lastActive = time.time()
+        currentRoom, messages = ENGINE.apply(currentRoom, event)
+        if event["type"] not in READ_ONLY:
+            if SPECTATORS.get(room):
+                SPECTATOR_EVENTS.setdefault(room, deque(maxlen=32))
+            if EVENT_LOG is not None:
+                EVENT_LOG.append(room, currentRoom, event)
+            armDeadline(room, currentRoom)
+            BOTS.wake(room, currentRoom)
+            listRoom(room, currentRoom)
+            if ARCHIVE is not None and currentRoom.winner is not None \
+                    and not currentRoom.archived:
+                ARCHIVE.append(currentRoom)
+                currentRoom.archived = True
+    return messages
+
+
+#This function sends messages either to the whole room or back to the
+#socket that sent the event. It does not need a request context, so it
+#works from whichever thread is running the room's tasks. Events the
+#server raises itself have no socket (sid is None), so only their
+#broadcasts are sent.
+def deliver(room, sid, messages):
+    if SPECTATORS.get(room):
+        public = [[message.event, message.data] for message in messages
+            if message.broadcast and message.event in PUBLIC_EVENTS]
+        if public:
+            SPECTATOR_EVENTS.setdefault(room, deque(maxlen=32)).extend(public)
+    for message in messages:
+        METRICS.countEmit(message.event, message.data)
+        if message.broadcast:
+            socketio.emit(message.event, message.data, room=room)
+            if msgpack is not None and (BINARY_ROOMS.get(room) or MESSAGE_QUEUE):
+                socketio.emit(message.event, encode(message.data, "msgpack"),
+                    room=binaryChannel(room))
+        elif sid is not None:
+            socketio.emit(message.event, encode(message.data,
+                ENCODING.get(sid, "json")), room=sid)
+
+
+#This function runs an event for a room in the room's executor, so no
+#two events for the same room ever interleave, and sends out what it
+#produces in the same order. Events for rooms that do not exist are
+#dropped before they get a mailbox.
+def dispatch(room, event):
+    sid = request.sid
+    if not isinstance(room, str) or room not in DATA:
+        return
+    if not admit(room, sid, event["type"]):
+        return
+    start = time.perf_counter()
+    ROOMS.submit(room, lambda: deliver(room, sid, applyEvent(room, event)))
+    METRICS.observeHandler(event["type"], time.perf_counter() - start)
+
+
+#This function checks an event against the socket's and the room's
+#budgets and the socket's outbound queue, counting it if it is turned
+#away. A socket whose event is over budget is sent "rejected" with the
+#event and the reason, so it can wait and send it again; a slow
+#consumer is not sent anything more.
+def admit(room, sid, eventType):
+    if not SID_LIMITS.allow(sid, eventType):
+        reason = "sid"
+    elif not ROOM_LIMITS.allow(room, eventType):
+        reason = "room"
+    elif eventType in RESENDABLE and outboundDepth(sid) > OUTBOUND_QUEUE_LIMIT:
+        reason = "backpressure"
+    else:
+        return True
+    METRICS.countRejected(eventType, reason)
+    if reason != "backpressure":
+        socketio.emit("rejected", encode({"event":eventType, "reason":reason},
+            ENCODING.get(sid, "json")), room=sid)
+    return False
+
+
+#This function gives the number of packets waiting to be sent to a
+#socket. python-socketio 5 queues them per engine.io socket; without
+#that (or for a socket on another worker) it gives 0.
+def outboundDepth(sid):
+    try:
+        server = socketio.server
+        socket = server.eio.sockets.get(server.manager.eio_sid_from_sid(sid, "/"))
+        return socket.queue.qsize() if socket is not None else 0
+    except AttributeError:
+        return 0
+
+
+#This function serves the metrics in the Prometheus text format: handler
+#latency and emits per event, rooms and players by phase, room queue
+#depths, bots and their moves, and the deck, discard and vote sizes of
+#every room.
+@app.route("/metrics", methods = ["GET"])
+def metrics():
+    lines = []
+    METRICS.render(lines)
+    rooms = defaultdict(int)
+    players = defaultdict(int)
+    sizes = []
+    for code in DATA.codes():
+        currentRoom = DATA.get(code)
+        if currentRoom is None:
+            continue
+        phase = currentRoom.phase()
+        rooms[phase] += 1
+        players[phase] += len(currentRoom.players)
+        sizes.append((code, len(currentRoom.deck), len(currentRoom.discards),
+            len(currentRoom.votes)))
+    lines.append("# TYPE secrethitler_rooms gauge")
+    for phase, count in sorted(rooms.items()):
+        lines.append('secrethitler_rooms{phase="%s"} %d' % (phase, count))
+    lines.append("# TYPE secrethitler_players gauge")
+    for phase, count in sorted(players.items()):
+        lines.append('secrethitler_players{phase="%s"} %d' % (phase, count))
+    queues = ROOMS.stats()
+    lines.append("# TYPE secrethitler_room_queue_depth gauge")
+    lines.append("secrethitler_room_queue_depth %d" % queues["queued"])
+    lines.append("# TYPE secrethitler_room_queue_max_depth gauge")
+    lines.append("secrethitler_room_queue_max_depth %d" % queues["maxDepth"])
+    bots = BOTS.stats()
+    lines.append("# TYPE secrethitler_bots gauge")
+    lines.append("secrethitler_bots %d" % bots["bots"])
+    lines.append("# TYPE secrethitler_bot_moves_total counter")
+    lines.append("secrethitler_bot_moves_total %d" % bots["moves"])
+    for name, index in (("deck", 1), ("discards", 2), ("votes", 3)):
+        lines.append("# TYPE secrethitler_room_%s gauge" % name)
+        for entry in sizes:
+            lines.append('secrethitler_room_%s{room="%s"} %d' % (name, entry[0], entry[index]))
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+#This function reports how much work is queued up for the rooms.
+@app.route("/api/queues", methods = ["GET"])
+def queueStats():
+    return jsonify(ROOMS.stats())
 
 
 #This function serves to update the lobby page on refresh or onload and
@@ -180,12 +1027,7 @@ def generate():
 #on the socket emit.
 @socketio.on("onLoadLobby")
 def handleOnLoadLobby (room): 
-    userArray = []
-    for player in DATA[room].players:
-            username = player.name
-            if username != None:
-                userArray.append(username)
-    emit("onLoadLobbyResponse",{"userArray":userArray})
+    dispatch(room, {"type":"onLoadLobby"})
 
 
 #This function serves to keep a record of players who have entered the 
@@ -194,331 +1036,119 @@ def handleOnLoadLobby (room):
 #0 is sent to indicate a succesful record of a new user.
 @socketio.on("newUser")
 def handleNewUser(userId,room):
-    join_room(room)
-    idList = []
-    for player in DATA[room].players:
-        idList.append(player.ID)
-    if userId not in idList:
-        x = Player(userId)
-        DATA[room].addPlayer(x)
-        emit("newUserResponse","0", room=room)
+    joinGameRoom(room)
+    dispatch(room, {"type":"newUser", "userId":userId})
 
 
 #This function allows a user in a particulular room set a name once and 
 #only once, without allowing duplicates with other users in the room. The
 #userId, username and room are passed as arguments during the socket emit.
 #The function returns the following errorCodes: 0 -> success, 1 -> user
-#name already in use.
+#name already in use. When the last player is named the roles are handed
+#out and "begin" is sent to the room.
 @socketio.on("addName")
 def handleAddName(userId,username,room):
-    for player in DATA[room].players:
-        if username == player.name:
-            emit("addNameSelf",{"errorCode":"1"})
-            return
-    DATA[room].ready = DATA[room].ready +1 
-    for player in DATA[room].players:
-        if userId == player.ID:
-            player.setName(username)
-    emit("addNameSelf",{"errorCode":"0","name":username})
-    emit("addNameRoom", username, room=room)
-
-    #This block of code is responsible for signalling that the final user 
-    #has selected their name and thus the game is ready to begin. It also
-    #handles the process of allocating the roles of Fascist (F), Hitler (H)
-    #and liberal in a random process according to the corect frequencies. The
-    #cards are also shuffled.
-    size = DATA[room].size
-    if DATA[room].ready == size:
-        if size in [5,6]:
-            F = 1
-        if size in [7,8]:
-            F = 2
-        if size in [9,10]:
-            F = 3
-    
-        A = random.sample(range(1,size),F+1)
-        H = random.choice(A)
-        i = 0
-        for player in DATA[room].players:
-            i += 1
-            if i in A: 
-                player.role = "Fascist"
-            else: 
-                player.role = "Liberal"
-            if i == H: 
-                player.role = "Hitler"
-        
-        random.shuffle(DATA[room].deck)
-        emit("begin","0",room=room)
-        
+    dispatch(room, {"type":"addName", "userId":userId, "name":username})
+
 
 #This function is used to pass the various roles of the players
 #on to the client side once the game room is reached.
 @socketio.on("getRole")
 def handleRole(room, userId):
-    for player in DATA[room].players:
-        if player.ID == userId:
-            playerRole = player.role
-            emit("getRoleResponse", player.role)
-    A = []
-    for player in DATA[room].players:
-        A.append({"name":player.name, "role": player.role})
-    emit("getPlayersResponse", {"array":A, "role":playerRole})
+    dispatch(room, {"type":"getRole", "userId":userId})
+
         
 #This function runs the game, ensuring that when players refresh and return 
 #are given the right game information for a certain point in time
 @socketio.on("onLoadGame")
 def gamestart(room, name):
-    join_room(room)
-    #This part of the function deals with if the president joins or 
-    #rejoins the game.
-    if DATA[room].president == name:
-        print(DATA[room].investigation)
-        print(DATA[room].chancellor)
-        print(DATA[room].sentCards)
-        if DATA[room].investigation == True:
-            emit("investigationSelection",{"president":DATA[room].president, 
-                    "players":DATA[room].getPlayers(), "board":DATA[room].board})
-            return
-        #This part of the code gives the president the chancellor
-        #candidates if it has not already been picked.
-        elif DATA[room].chancellor == "":
-            presidentData = {"president": DATA[room].president, \
-                "chancellorCandidates": DATA[room].getChancellorCandidates(), \
-                    "board":DATA[room].board}
-            emit("president", presidentData)
-        #This part of the code gives the president their voting 
-        #options if they have not yet voted for anyone.
-        elif DATA[room].voted == False:
-            for item in DATA[room].votingArray:
-                if item[0] == name:
-                    return
-            emit("voting", DATA[room].chancellor)
-        #This part of the code checks if the president has been
-        #given their voting cards and displays them if they 
-        #haven't. This is tracked by the .sentCards variable
-        elif DATA[room].sentCards == False:
-            emit("sendCardsPresident", DATA[room].currentCards)
-            return
-    #This part of the function deals with if the chancellor joins or 
-    #rejoins the game.    
-    elif DATA[room].chancellor == name:
-        #This part of the code gives the chancellor their voting 
-        #options if they have not yet voted for anyone.
-        if DATA[room].voted == False:
-            for item in DATA[room].votingArray:
-                if item[0] == name:
-                    return
-            emit("voting", DATA[room].chancellor)
-        #This part of the code checks if the president has passed on
-        # their cards and displays the remaining to the chancellor 
-        # if the chancellor has not sent
-        # them on. This is tracked by the .sentCards variable
-        elif DATA[room].sentCards == True:
-            cards = DATA[room].currentCards
-            emit("sendCardsChancellor",{"cards":cards, \
-                "chancellor":DATA[room].chancellor}, room=room)
-            return
-    else:
-        #This part of the code picks a president if none has been picked 
-        #and initializes the president
-        if DATA[room].president == "":
-            DATA[room].getPresident()
-            presidentData = {"president": DATA[room].president, \
-                "chancellorCandidates": DATA[room].getChancellorCandidates(), \
-                "board":DATA[room].board}
-            emit("president", presidentData)
-        #This part of the code checks if a player has voted and sends
-        #voting information if they have not. 
-        elif DATA[room].voted == False:
-            for item in DATA[room].votingArray:
-                if item[0] == name:
-                    return
-            emit("voting", DATA[room].chancellor)
+    joinGameRoom(room)
+    dispatch(room, {"type":"onLoadGame", "name":name})
 
 #This function stores the chancellor selection received from 
 #the president and initializes voting
 @socketio.on("chancellorSelection")
 def getSelection(chancellor, room):
-    DATA[room].chancellor = chancellor
-    DATA[room].voted = False
-    emit("voting", chancellor, room=room)
+    dispatch(room, {"type":"chancellorSelection", "chancellor":chancellor})
 
 #This function handles voting. It adds the yes and no votes
 #as they come from the clients and when everyone has voted
 #it handles the consequences of a yes and no votes
 @socketio.on("vote")
 def handleVote(vote,room,name):
-    #votingArray stores every players' votes
-    DATA[room].votingArray.append([name,vote])
-    #player votes are tallied
-    if vote == "Yes":
-        DATA[room].voteYes += 1
-    if vote == "No":
-        DATA[room].voteNo += 1
-    #once everyone has voted some variables are set (and ineligible
-    #chancellors for the next round are initializied.)
-    if DATA[room].voteNo + DATA[room].voteYes == DATA[room].size:
-        DATA[room].voted = True
-        majority = "No"
-        if DATA[room].specialPresidency == False:
-            DATA[room].ineligible = []
-            DATA[room].ineligible.append(DATA[room].president)
-        #If the majority vote yes, the current chancellor is added
-        #to ineligible candidates, and the result of the vote is 
-        #sent to all the clients.
-        if DATA[room].voteYes > DATA[room].voteNo:
-            DATA[room].failedVotes = 0
-            majority = "Yes"
-            if DATA[room].specialPresidency == False:
-                DATA[room].ineligible.append(DATA[room].chancellor)
-            
-            DATA[room].specialPresidency = False
-
-            emit("voteResult", {"majority": majority,
-                "votingArray": DATA[room].votingArray, 
-                "president": DATA[room].president, 
-                "chancellor": DATA[room].chancellor}, room=room)
-        #If the majority votes no a new president is selected and 
-        #the chancellor choice is reset. 
-        else:
-            DATA[room].failedVotes += 1
-            skipMessage = ""
-            if DATA[room].failedVotes == 3:
-                firstCard = DATA[room].deck.pop(0)
-                DATA[room].board[firstCard] += 1
-                skipMessage = "Three failed votes - a card was placed on board"
-                DATA[room].failedVotes = 0 
-            emit("voteResult", {"majority": majority, \
-                "votingArray": DATA[room].votingArray, \
-                    "president": DATA[room].president, \
-                        "chancellor": DATA[room].chancellor, \
-                            "message": skipMessage}, room=room)
-            DATA[room].chancellor = ""
-            DATA[room].nextPresident()
-        #After the vote all the voting variables are reset. The 
-        #result is sent to all clients
-        DATA[room].voteNo = 0
-        DATA[room].voteYes = 0
-        DATA[room].votingArray = []
+    dispatch(room, {"type":"vote", "vote":vote, "name":name})
 
 #The cards are sent to the president
 @socketio.on("getCardsPresident")
 def handleGetCards(room):
-    #The deck is shuffled if not enough cards remain
-    if len(DATA[room].deck) < 3:
-        DATA[room].deck = DATA[room].deck + DATA[room].discard
-        random.shuffle(DATA[room].deck)
-    #3 cards are drawn from the top of the deck.
-    cards = []
-    for i in range(3):
-        cards.append(DATA[room].deck.pop(0))    
-    #The list of cards are stores in case stored 
-    #in case the president leaves and rejoins.
-    DATA[room].currentCards = cards
-    emit("sendCardsPresident",cards)
+    dispatch(room, {"type":"getCardsPresident"})
 
 #This functions recieves the discarded card information
 #from the client and sends the remaining cards to the 
 #chancellor
 @socketio.on("discardPresident")
 def handleDiscard(discard,cards,room):
-    cards.remove(discard)
-    DATA[room].discards.append(discard)
-    DATA[room].currentCards = cards
-    DATA[room].sentCards = True
-    emit("sendCardsChancellor",{"cards":cards, \
-        "chancellor":DATA[room].chancellor},room=room)
+    dispatch(room, {"type":"discardPresident", "discard":discard, "cards":cards})
 
 #Where the vote fails, this function is activated and sends the 
 #selecting chancellor data to the president
 @socketio.on("handler")
 def responder(code, room):
-    if code == "2":
-        DATA[room].nextPresident()
-    presidentData = {"president": DATA[room].president, \
-            "chancellorCandidates": DATA[room].getChancellorCandidates(),\
-                "board":DATA[room].board}
-    emit("president", presidentData, room=room)   
+    dispatch(room, {"type":"handler", "code":code})
 
 #This function updates the board once the chancellor has picked their
 #card.
 @socketio.on("updateBoard")
 def handleUpdateBoard(card,cards,room):
-    #Adding the discarded card into the discard pile and also adding the
-    #selected card onto the board
-    discard = cards.remove(card)
-    DATA[room].discards.append(discard)
-    DATA[room].board[card] += 1
-    #Getting the chancellor selections which may include the next president
-    #but not the previous president or chancellor
-    DATA[room].sentCards = False
-    DATA[room].currentCards = []
-    DATA[room].chancellor = ""
-    if DATA[room].board["F"] == 6:
-        emit("gameOver","F",room=room)
-    if DATA[room].board["L"] == 6:
-        emit("gameOver","L",room=room)
-    if card == "F":
-        if (DATA[room].board["F"] == 1 and DATA[room].size in [9,10]) \
-            or (DATA[room].board["F"] == 2 and DATA[room].size in [7,8,9,10]):
-                DATA[room].investigation = True
-                emit("investigationSelection",{"president":DATA[room].president,
-                    "players":DATA[room].getPlayers(), "board":DATA[room].board },
-                        room=room)
-                return
-
-        if (DATA[room].board["F"] == 1 and DATA[room].size in [5,8,9,10]):
-            DATA[room].specialPresidency = True
-            emit("specialPresidency",{"president":DATA[room].president, 
-                "players":DATA[room].getPlayers(), "board":DATA[room].board },
-                    room=room)
-            return
-
-        if DATA[room].board["F"] == 3 and DATA[room].size in [5,6]:
-            if len(DATA[room].deck) < 3:
-                DATA[room].deck = DATA[room].deck + DATA[room].discard
-                random.shuffle(DATA[room].deck)
-            topCard = DATA[room].deck[0]
-            emit("showTopCard",{"president":DATA[room].president,"card":topCard, 
-                "board":DATA[room].board}, room = room)
-            return 
-
-        if DATA[room].board["F"] in [4,5]:
-            emit("executePlayer", {"president":DATA[room],"players":DATA[room].getPlayers(),
-            "board":DATA[room].board},room=room)
-            return
-
-    president = DATA[room].nextPresident()  
-    chancellors = DATA[room].getChancellorCandidates()
-    emit("president",{"president":president,"chancellorCandidates":chancellors,"board":DATA[room].board},room=room)
+    dispatch(room, {"type":"updateBoard", "card":card, "cards":cards})
 
 @socketio.on("investigationResponse")
 def checkPlayer(selectedPlayer, room):
-    print(selectedPlayer)
-    for player in DATA[room].players:
-        if player.name == selectedPlayer:
-            playerRole = player.role
-            if playerRole == "H":
-                playerRole = "F"
-            print(playerRole)
-            emit("playerRoleReveal", playerRole)
-    DATA[room].investigation = False
+    dispatch(room, {"type":"investigationResponse", "selectedPlayer":selectedPlayer})
+
+#This function kills the player the president picked after an
+#"executePlayer" message.
+@socketio.on("executionResponse")
+def handleExecution(selectedPlayer, room):
+    dispatch(room, {"type":"executionResponse", "selectedPlayer":selectedPlayer})
 
 @socketio.on("getBoard")
 def handleGetBoard(room):
-    emit("getBoardResponse",DATA[room].board)
+    dispatch(room, {"type":"getBoard"})
+
+#This function brings a reconnecting client up to date in a single
+#round trip. The client sends the last version it saw (or nothing) and
+#gets back a "syncResponse" with the changes since then, or a full
+#snapshot, together with its own role, hand and choices. A version that
+#is not a whole number counts as none.
+@socketio.on("sync")
+def handleSync(room, userId, version=None):
+    if not isinstance(version, int) or isinstance(version, bool):
+        version = None
+    joinGameRoom(room)
+    dispatch(room, {"type":"sync", "userId":userId, "version":version})
+
+#This function sends the odds for the room's board: the chances of each
+#number of fascist policies in the next draw and of each side winning if
+#play were random from here. They only depend on the board, which is
+#public, and are cached per board, so they are worked out outside the
+#room's executor.
+@socketio.on("getOdds")
+def handleGetOdds(room):
+    sid = request.sid
+    currentRoom = DATA.get(room)
+    if currentRoom is None or not admit(room, sid, "getOdds"):
+        return
+    board = dict(currentRoom.board)
+    data = dict(publicOdds(board), board=board)
+    emit("oddsResponse", encode(data, ENCODING.get(sid, "json")))
 
 @socketio.on("specialPresidencySelection")
 def handleSPSelection(president,room):
-    DATA[room].president = president
-    presidentData = {
-        "president": president, 
-        "chancellorCandidates": DATA[room].getPlayers(),
-        "board":DATA[room].board
-    }
-    emit("president", presidentData, room=room)   
+    dispatch(room, {"type":"specialPresidencySelection", "president":president})
+
+if EVENT_LOG is not None:
+    recoverRooms()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=os.environ.get("PORT", 3000), debug=True)
-    socketio.run(app)
\ No newline at end of file
+    socketio.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 3000)), debug=True)
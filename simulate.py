@@ -0,0 +1,156 @@
+import argparse
+import random
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+from engine import GameEngine, Room
+
+#This module plays full games against the GameEngine with no sockets at
+#all. Each simulated client reacts to the messages the engine sends the
+#way the browser does, picking at random wherever a player has a choice.
+#Because the room and the players share one seed, every game can be
+#replayed exactly, which makes it useful for fuzzing for stuck states and
+#for measuring how much the rules cost on their own. With afk set, each
+#reaction is skipped with that probability and the game is carried on by
+#"timeout" events, the way the server's deadlines do.
+
+ENGINE = GameEngine()
+
+
+#This function plays one game and returns the winner ("F" or "L"), or
+#"stuck" when the game stops producing anything to react to, or runs
+#past maxEvents.
+def playGame(size, seed, maxEvents=2000, afk=0.0):
+    room = Room(size, seed)
+    rng = random.Random(seed ^ 0x5bd1e995)
+    names = ["P%d" % i for i in range(size)]
+    byName = {}
+    events = 0
+
+    def apply(event):
+        nonlocal events
+        events += 1
+        return ENGINE.apply(room, event)[1]
+
+    for i, name in enumerate(names):
+        apply({"type":"newUser", "userId":str(i)})
+    for i, name in enumerate(names):
+        apply({"type":"addName", "userId":str(i), "name":name})
+    for player in room.players:
+        byName[player.name] = player
+
+    pending = []
+    for name in names:
+        pending.extend(apply({"type":"onLoadGame", "name":name}))
+
+    while events < maxEvents:
+        if not pending:
+            action = room.pendingAction()
+            if afk == 0 or action is None:
+                return "stuck", events
+            pending.extend(apply({"type":"timeout", "action":action}))
+            continue
+        message = pending.pop(0)
+        event = message.event
+        data = message.data
+        if event == "gameOver":
+            return data, events
+        if afk and event != "voting" and rng.random() < afk:
+            continue
+        if event == "president":
+            candidates = data["chancellorCandidates"]
+            if not candidates:
+                return "stuck", events
+            pending.extend(apply({"type":"chancellorSelection",
+                "chancellor":rng.choice(candidates)}))
+        elif event == "voting":
+            for player in room.players:
+                if player.dead == False and not (afk and rng.random() < afk):
+                    pending.extend(apply({"type":"vote", "name":player.name,
+                        "vote":rng.choice(("Yes", "No"))}))
+        elif event == "voteResult":
+            if data["majority"] == "Yes":
+                pending.extend(apply({"type":"getCardsPresident"}))
+            else:
+                pending.extend(apply({"type":"handler", "code":"1"}))
+        elif event == "sendCardsPresident":
+            pending.extend(apply({"type":"discardPresident",
+                "discard":rng.choice(data), "cards":list(data)}))
+        elif event == "sendCardsChancellor":
+            cards = data["cards"]
+            pending.extend(apply({"type":"updateBoard",
+                "card":rng.choice(cards), "cards":list(cards)}))
+        elif event == "investigationSelection":
+            apply({"type":"investigationResponse",
+                "selectedPlayer":rng.choice(data["players"])})
+            pending.extend(apply({"type":"handler", "code":"2"}))
+        elif event == "specialPresidency":
+            pending.extend(apply({"type":"specialPresidencySelection",
+                "president":rng.choice(data["players"])}))
+        elif event == "showTopCard":
+            pending.extend(apply({"type":"handler", "code":"2"}))
+        elif event == "executePlayer":
+            pending.extend(apply({"type":"executionResponse",
+                "selectedPlayer":rng.choice(data["players"])}))
+    return "stuck", events
+
+
+#This function plays a batch of games in one process and returns how
+#often each outcome happened, the total number of events, and the seeds
+#of any stuck games so they can be replayed.
+def playBatch(args):
+    seeds, sizes, afk = args
+    outcomes = Counter()
+    events = 0
+    stuck = []
+    for seed in seeds:
+        size = sizes[seed % len(sizes)]
+        result, count = playGame(size, seed, afk=afk)
+        outcomes[result] += 1
+        events += count
+        if result == "stuck":
+            stuck.append((size, seed))
+    return outcomes, events, stuck
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless game simulator")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sizes", default="5,6,7,8,9,10")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--afk", type=float, default=0.0)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    seeds = range(args.seed, args.seed + args.games)
+    jobs = [(seeds[i:i + args.batch], sizes, args.afk)
+        for i in range(0, args.games, args.batch)]
+
+    start = time.perf_counter()
+    if args.workers > 1:
+        with Pool(args.workers) as pool:
+            results = pool.map(playBatch, jobs)
+    else:
+        results = [playBatch(job) for job in jobs]
+    elapsed = time.perf_counter() - start
+
+    outcomes = Counter()
+    events = 0
+    stuck = []
+    for batchOutcomes, batchEvents, batchStuck in results:
+        outcomes.update(batchOutcomes)
+        events += batchEvents
+        stuck.extend(batchStuck)
+
+    print("games=%d workers=%d time=%.2fs games/s=%.0f events/s=%.0f" %
+        (args.games, args.workers, elapsed, args.games / elapsed, events / elapsed))
+    print("outcomes: %s" % dict(outcomes))
+    if stuck:
+        print("stuck (size, seed): %s" % stuck[:20])
+
+
+if __name__ == "__main__":
+    main()
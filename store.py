@@ -0,0 +1,222 @@
+import pickle
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+
+#The following classes store Room objects. Handlers should never hold
+#on to a Room between events: they open a session on the room code,
+#change it, and the store writes it back when the session closes. This
+#lets the same handlers run against a dict in one process or against a
+#shared Redis-protocol server used by several worker processes.
+#
+#Both stores also keep the lobby directory: every room with free seats is
+#listed in a bucket for its (free seats, size), and each bucket keeps its
+#codes sorted. There are only a few dozen buckets, so listing a page of
+#open rooms or finding the best fit for a group takes a binary search in
+#a handful of buckets however many rooms there are. Pages are ordered by
+#free seats, then size, then code, and continue after a cursor of the
+#last (free, size, code) seen.
+
+
+#This store keeps rooms in a dict inside the current process. Sessions
+#hand out the live object so there is nothing to write back.
+class MemoryRoomStore:
+    def __init__(self):
+        self.rooms = {}
+        self.userIds = set()
+        self.listing = {}
+        self.buckets = {}
+
+    def get(self, code):
+        return self.rooms.get(code)
+
+    def put(self, code, room):
+        self.rooms[code] = room
+
+    def delete(self, code):
+        self.rooms.pop(code, None)
+
+    def codes(self):
+        return list(self.rooms)
+
+    def __contains__(self, code):
+        return code in self.rooms
+
+    def __len__(self):
+        return len(self.rooms)
+
+    #This method yields the room for the code (or None if it does not
+    #exist). Changes are made on the live object.
+    @contextmanager
+    def session(self, code):
+        yield self.rooms.get(code)
+
+    def hasUserId(self, userId):
+        return userId in self.userIds
+
+    def addUserId(self, userId):
+        self.userIds.add(userId)
+
+    #This method lists the room in the lobby directory with its number
+    #of free seats, or takes it out when there are none.
+    def listRoom(self, code, size, free):
+        self.delistRoom(code)
+        if free > 0:
+            insort(self.buckets.setdefault((free, size), []), code)
+            self.listing[code] = (free, size)
+
+    def delistRoom(self, code):
+        key = self.listing.pop(code, None)
+        if key is not None:
+            bucket = self.buckets[key]
+            del bucket[bisect_left(bucket, code)]
+
+    #This method returns up to limit open rooms as (code, size, free)
+    #after the cursor, optionally only rooms of one size.
+    def openRooms(self, size=None, after=None, limit=50):
+        rooms = []
+        for key in sorted(self.buckets):
+            if size is not None and key[1] != size:
+                continue
+            if after is not None and key < after[:2]:
+                continue
+            bucket = self.buckets[key]
+            start = 0
+            if after is not None and key == after[:2]:
+                start = bisect_right(bucket, after[2])
+            for code in bucket[start:start + limit - len(rooms)]:
+                rooms.append((code, key[1], key[0]))
+            if len(rooms) == limit:
+                break
+        return rooms
+
+    #This method returns the open room with the fewest free seats that
+    #still fits the given number of players, or None.
+    def bestFit(self, seats, size=None):
+        best = None
+        for key, bucket in self.buckets.items():
+            if bucket and key[0] >= seats and (size is None or key[1] == size) \
+                    and (best is None or key < best):
+                best = key
+        return self.buckets[best][0] if best is not None else None
+
+
+#This store keeps pickled rooms in a Redis-protocol server so that
+#several worker processes can share them. Each session takes a per-room
+#lock so two workers never interleave changes to the same room.
+class RedisRoomStore:
+    def __init__(self, url, prefix="sh:", lockTimeout=10):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.lockTimeout = lockTimeout
+
+    def key(self, code):
+        return self.prefix + "room:" + code
+
+    def get(self, code):
+        data = self.client.get(self.key(code))
+        if data is None:
+            return None
+        return pickle.loads(data)
+
+    def put(self, code, room):
+        self.client.set(self.key(code),
+            pickle.dumps(room, pickle.HIGHEST_PROTOCOL))
+
+    def delete(self, code):
+        self.client.delete(self.key(code))
+
+    def codes(self):
+        start = len(self.prefix + "room:")
+        return [key.decode("UTF-8")[start:] for key in
+            self.client.scan_iter(match=self.key("*"))]
+
+    def __contains__(self, code):
+        return self.client.exists(self.key(code)) == 1
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.key("*")))
+
+    #This method loads the room under its lock, yields it, and writes
+    #it back once the handler is done with it.
+    @contextmanager
+    def session(self, code):
+        lock = self.client.lock(self.prefix + "lock:" + code,
+            timeout=self.lockTimeout)
+        with lock:
+            room = self.get(code)
+            yield room
+            if room is not None:
+                self.put(code, room)
+
+    def hasUserId(self, userId):
+        return self.client.sismember(self.prefix + "userids", userId)
+
+    def addUserId(self, userId):
+        self.client.sadd(self.prefix + "userids", userId)
+
+    #The lobby directory keeps a sorted set (all scores 0, so ordered by
+    #code) per bucket, a hash of where each room is listed and a set of
+    #the buckets in use.
+    def bucket(self, free, size):
+        return "%sopen:%d:%d" % (self.prefix, free, size)
+
+    def bucketKeys(self, size=None):
+        keys = []
+        for name in self.client.smembers(self.prefix + "buckets"):
+            free, bucketSize = name.decode("UTF-8").rsplit(":", 2)[1:]
+            if size is None or int(bucketSize) == size:
+                keys.append((int(free), int(bucketSize)))
+        return sorted(keys)
+
+    def listRoom(self, code, size, free):
+        self.delistRoom(code)
+        if free > 0:
+            bucket = self.bucket(free, size)
+            pipe = self.client.pipeline()
+            pipe.zadd(bucket, {code: 0})
+            pipe.hset(self.prefix + "listing", code, "%d:%d" % (free, size))
+            pipe.sadd(self.prefix + "buckets", bucket)
+            pipe.execute()
+
+    def delistRoom(self, code):
+        listed = self.client.hget(self.prefix + "listing", code)
+        if listed is not None:
+            free, size = listed.decode("UTF-8").split(":")
+            pipe = self.client.pipeline()
+            pipe.zrem(self.bucket(int(free), int(size)), code)
+            pipe.hdel(self.prefix + "listing", code)
+            pipe.execute()
+
+    def openRooms(self, size=None, after=None, limit=50):
+        rooms = []
+        for key in self.bucketKeys(size):
+            if after is not None and key < after[:2]:
+                continue
+            start = "-"
+            if after is not None and key == after[:2]:
+                start = "(" + after[2]
+            codes = self.client.zrangebylex(self.bucket(*key), start, "+",
+                start=0, num=limit - len(rooms))
+            for code in codes:
+                rooms.append((code.decode("UTF-8"), key[1], key[0]))
+            if len(rooms) == limit:
+                break
+        return rooms
+
+    def bestFit(self, seats, size=None):
+        for key in self.bucketKeys(size):
+            if key[0] < seats:
+                continue
+            codes = self.client.zrange(self.bucket(*key), 0, 0)
+            if codes:
+                return codes[0].decode("UTF-8")
+        return None
+
+
+#This function picks the store from a URL. No URL means rooms are kept
+#in this process only.
+def createStore(url=None):
+    if url:
+        return RedisRoomStore(url)
+    return MemoryRoomStore()
@@ -0,0 +1,112 @@
+import logging
+import math
+import threading
+import time
+
+log = logging.getLogger("secrethitler.timers")
+
+#The following classes keep every deadline in the server on one
+#hierarchical timer wheel, so thousands of rooms waiting on a vote or a
+#card cost no threads. Time moves in ticks. Level 0 has a slot per tick
+#for the next `slots` ticks, level 1 a slot per `slots` ticks, and so on;
+#a timer sits on the lowest level its delay fits in and is moved down a
+#level each time the wheel above it turns over. Scheduling and
+#cancelling are O(1), and advancing costs O(levels) per tick plus the
+#timers that fire or move.
+
+
+class Timer:
+    __slots__ = ("expires", "callback", "args", "slot")
+
+    def __init__(self, expires, callback, args):
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self.slot = None
+
+
+class TimerWheel:
+    def __init__(self, tick=0.1, slots=64, levels=4, clock=time.monotonic):
+        if slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        self.tick = tick
+        self.bits = slots.bit_length() - 1
+        self.mask = slots - 1
+        self.levels = levels
+        self.clock = clock
+        self.origin = clock()
+        self.current = 0
+        self.wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self.count = 0
+        self.lock = threading.Lock()
+
+    #This method calls callback(*args) once delay seconds have passed
+    #and returns the timer, which can be cancelled.
+    def schedule(self, delay, callback, *args):
+        with self.lock:
+            timer = Timer(self.current + max(1, int(math.ceil(delay / self.tick))),
+                callback, args)
+            self.place(timer)
+            self.count += 1
+        return timer
+
+    #This method puts a timer in the slot it belongs to for the current
+    #tick. Timers further out than the top level can reach wait in its
+    #last slot and are placed again when it turns over.
+    def place(self, timer):
+        delta = timer.expires - self.current
+        expires = timer.expires
+        for level in range(self.levels):
+            if delta < 1 << (self.bits * (level + 1)):
+                break
+        else:
+            expires = self.current + (1 << (self.bits * self.levels)) - 1
+        slot = self.wheels[level][(expires >> (self.bits * level)) & self.mask]
+        slot[timer] = None
+        timer.slot = slot
+
+    #This method stops a timer that has not fired yet. Cancelling a timer
+    #twice, or after it fired, does nothing.
+    def cancel(self, timer):
+        with self.lock:
+            if timer.slot is not None:
+                del timer.slot[timer]
+                timer.slot = None
+                self.count -= 1
+
+    #This method moves the wheel up to now and runs the callbacks of the
+    #timers that expired, outside the lock, returning how many ran.
+    def advance(self, now=None):
+        if now is None:
+            now = self.clock()
+        target = int((now - self.origin) / self.tick)
+        expired = []
+        with self.lock:
+            while self.current < target:
+                if self.count == 0:
+                    self.current = target
+                    break
+                self.current += 1
+                for level in range(self.levels - 1, 0, -1):
+                    shift = self.bits * level
+                    if self.current & ((1 << shift) - 1) == 0:
+                        slot = self.wheels[level][(self.current >> shift) & self.mask]
+                        timers = list(slot)
+                        slot.clear()
+                        for timer in timers:
+                            self.place(timer)
+                slot = self.wheels[0][self.current & self.mask]
+                for timer in slot:
+                    timer.slot = None
+                expired.extend(slot)
+                self.count -= len(slot)
+                slot.clear()
+        for timer in expired:
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                log.exception("timer callback failed")
+        return len(expired)
+
+    def __len__(self):
+        return self.count